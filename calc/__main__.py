@@ -0,0 +1,21 @@
+import sys
+
+# `python -m calc EXPRESSION` prints the result and exits, anything else
+# (no arguments, --file, --help, piped input) goes to calc.cli.main.
+# arguments are joined, so `python -m calc 2 + 3` works unquoted. keep
+# module-level imports out of this file, tests/cli/test_oneshot.py holds
+# the one-shot path to an import-time budget
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    if not argv or argv[0].startswith("--") or argv[0] == "-h":
+        from calc.cli.main import main as cli_main
+        return cli_main(argv)
+
+    from calc.cli.oneshot import run
+    return run(" ".join(argv))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
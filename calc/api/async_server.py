@@ -0,0 +1,466 @@
+import argparse
+import asyncio
+import json
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from email.utils import formatdate
+from http import HTTPStatus
+from time import perf_counter, time
+from urllib.parse import parse_qsl, urlsplit
+
+from calc.api import handlers
+from calc.api.handlers import SESSION_HEADER
+from calc.api.sessions import SessionStore
+from calc.core import metrics
+from calc.core.history import HistoryLog, SQLiteHistory
+from calc.core.session import CalculatorSession
+
+# asyncio front end serving the same routes as the Flask app in
+# calc.api.main, through the same calc.api.handlers. every connection is a
+# coroutine rather than a thread, so thousands of idle keep-alive clients
+# cost a few KB each. requests on one connection are answered in order,
+# which is what HTTP/1.1 pipelining requires. anything that touches a
+# session runs on a thread pool so evaluations never stall the event loop
+
+MAX_HEADER_BYTES = 64 * 1024
+MAX_BODY_BYTES = 16 * 1024 * 1024
+# idle keep-alive connections are closed after this many seconds
+KEEPALIVE_TIMEOUT = 75.0
+# batch results are handed from the evaluating thread to the socket in
+# chunks of this many lines, at most BATCH_CHUNKS chunks ahead
+BATCH_CHUNK = 64
+BATCH_CHUNKS = 8
+
+
+class HttpError(Exception):
+
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+
+
+class Request:
+    __slots__ = ("method", "path", "args", "headers", "body", "client", "keep_alive", "chunked")
+
+    def __init__(self, method, path, args, headers, body, client, keep_alive, chunked):
+        self.method = method
+        self.path = path
+        self.args = args # query parameters, first value of each
+        self.headers = headers # lower-cased names
+        self.body = body
+        self.client = client # session token, like client_session() in Flask
+        self.keep_alive = keep_alive
+        self.chunked = chunked # False for HTTP/1.0 clients
+
+    @property
+    def mimetype(self):
+        return self.headers.get("content-type", "").split(";")[0].strip().lower()
+
+    def get_json(self, silent=False):
+        # same rules as Flask's request.get_json
+        mimetype = self.mimetype
+        if not (mimetype == "application/json"
+                or (mimetype.startswith("application/") and mimetype.endswith("+json"))):
+            if silent:
+                return None
+            raise HttpError(415, "Request Content-Type was not 'application/json'")
+        try:
+            return json.loads(self.body)
+        except ValueError:
+            if silent:
+                return None
+            raise HttpError(400, "Failed to decode JSON object")
+
+
+class Response:
+    __slots__ = ("status", "body", "content_type", "headers")
+
+    def __init__(self, status, body, content_type="application/json", headers=()):
+        self.status = status
+        self.body = body # bytes, or an async iterator of bytes to stream
+        self.content_type = content_type
+        self.headers = list(headers)
+
+
+def json_response(body, status=200):
+    # encoded like Flask's jsonify
+    return Response(status, handlers.encode_json(body))
+
+
+class AsyncApp:
+
+    def __init__(self, session_ttl=900, max_sessions=10000, history_path=None,
+                 enable_metrics=False, max_workers=None,
+                 keepalive_timeout=KEEPALIVE_TIMEOUT, max_body=MAX_BODY_BYTES,
+                 limits=handlers.DEFAULT_LIMITS, history_size=10):
+        if enable_metrics:
+            metrics.enable()
+
+        self.history_log = None
+        if history_path is not None:
+            history_log = self.history_log = HistoryLog(history_path)
+
+            def factory(token):
+                return CalculatorSession(history=SQLiteHistory(history_log, token))
+        else:
+            def factory(token):
+                return CalculatorSession(history_size=history_size)
+
+        self.sessions = SessionStore(ttl=session_ttl, max_sessions=max_sessions, factory=factory)
+        self.executor = ThreadPoolExecutor(max_workers, thread_name_prefix="calc-api")
+        self.keepalive_timeout = keepalive_timeout
+        self.max_body = max_body
+        self.limits = limits # as in create_app
+        self.connections = 0 # currently open
+
+        # (method, path) -> coroutine taking the Request
+        self.routes = {
+            ("POST", "/evaluate"): self.evaluate,
+            ("POST", "/evaluate/batch"): self.evaluate_batch,
+            ("POST", "/validate"): self.validate,
+            ("GET", "/history"): self.get_history,
+            ("POST", "/clear"): self.clear_history,
+            ("POST", "/reset"): self.reset,
+            ("GET", "/sessions"): self.session_stats,
+            ("GET", "/metrics"): self.get_metrics,
+            ("GET", "/health"): self.health,
+        }
+        self.paths = {path for _, path in self.routes}
+
+    # routes
+
+    async def evaluate(self, request):
+        data = request.get_json()
+        return await self.call(handlers.evaluate, request, data, self.limits)
+
+    async def evaluate_batch(self, request):
+        try:
+            if request.mimetype == "application/x-ndjson":
+                batch = handlers.batch_request(request.args, ndjson_lines=request.body.splitlines())
+            else:
+                batch = handlers.batch_request(request.args, request.get_json(silent=True))
+        except ValueError as e:
+            return json_response({"error": str(e)}, 400)
+        return Response(200, self.stream_batch(request.client, batch), "application/x-ndjson")
+
+    async def validate(self, request):
+        data = request.get_json()
+        return json_response(*await self.offload(handlers.validate, data, self.limits))
+
+    async def get_history(self, request):
+        try:
+            wait = handlers.wait_params(request.args)
+        except ValueError as e:
+            return json_response({"error": str(e)}, 400)
+        session = await self.offload(self.sessions.get, request.client)
+        if wait is not None:
+            await self.wait_for_version(session, *wait)
+        status, data, headers = await self.offload(
+            handlers.history_response, session, request.args, request.headers.get("if-none-match")
+        )
+        return Response(status, data, headers=headers.items())
+
+    async def wait_for_version(self, session, version, timeout):
+        # a long poll waits on the loop, not on a pool thread, so any number
+        # of them can be open without starving evaluations
+        loop = asyncio.get_running_loop()
+        changed = loop.create_future()
+
+        def wake():
+            # runs on the thread that changed the session
+            try:
+                loop.call_soon_threadsafe(lambda: changed.done() or changed.set_result(None))
+            except RuntimeError:
+                pass # the loop has closed
+
+        session.watch_version(version, wake)
+        try:
+            await asyncio.wait_for(changed, timeout)
+        except asyncio.TimeoutError:
+            pass
+        finally:
+            session.unwatch_version(wake)
+
+    async def clear_history(self, request):
+        return await self.call(handlers.clear_history, request)
+
+    async def reset(self, request):
+        return await self.call(handlers.reset, request)
+
+    async def session_stats(self, request):
+        stats = await self.offload(self.sessions.stats)
+        return json_response(stats)
+
+    async def get_metrics(self, request):
+        return Response(200, metrics.registry.render().encode(), "text/plain; version=0.0.4")
+
+    async def health(self, request):
+        return json_response(*handlers.health())
+
+    async def call(self, handler, request, *args):
+        # runs handler(session, *args) on the thread pool
+        def run():
+            return handler(self.sessions.get(request.client), *args)
+        body, status = await self.offload(run)
+        return json_response(body, status)
+
+    async def offload(self, func, *args):
+        return await asyncio.get_running_loop().run_in_executor(self.executor, func, *args)
+
+    async def stream_batch(self, client, batch):
+        # the whole batch runs on one pool thread, since evaluate_many holds
+        # the session lock until it is exhausted. lines come back through a
+        # bounded queue, so a slow reader slows the evaluation down instead
+        # of results piling up in memory
+        loop = asyncio.get_running_loop()
+        chunks = asyncio.Queue(BATCH_CHUNKS)
+        stopped = False
+
+        def put(item):
+            asyncio.run_coroutine_threadsafe(chunks.put(item), loop).result()
+
+        def produce():
+            lines = handlers.batch_lines(self.sessions.get(client), *batch, self.limits)
+            try:
+                chunk = []
+                for line in lines:
+                    if stopped:
+                        break
+                    chunk.append(line)
+                    if len(chunk) >= BATCH_CHUNK:
+                        put("".join(chunk).encode())
+                        chunk = []
+                if chunk and not stopped:
+                    put("".join(chunk).encode())
+            finally:
+                # closing here releases the session lock on this thread
+                lines.close()
+                put(None)
+
+        future = loop.run_in_executor(self.executor, produce)
+        try:
+            while True:
+                chunk = await chunks.get()
+                if chunk is None:
+                    break
+                yield chunk
+            await future
+        finally:
+            if not future.done():
+                # the client went away, unblock the producer so it stops
+                stopped = True
+                while not chunks.empty():
+                    chunks.get_nowait()
+
+    # HTTP
+
+    async def serve(self, host="127.0.0.1", port=5000, **kwargs):
+        # starts listening and returns the asyncio.Server
+        kwargs.setdefault("backlog", 1024)
+        return await asyncio.start_server(
+            self.handle_connection, host, port, limit=MAX_HEADER_BYTES, **kwargs
+        )
+
+    def run(self, host="127.0.0.1", port=5000):
+        async def main():
+            server = await self.serve(host, port)
+            async with server:
+                await server.serve_forever()
+        try:
+            asyncio.run(main())
+        finally:
+            self.close()
+
+    def close(self):
+        self.executor.shutdown(wait=True)
+        if self.history_log is not None:
+            self.history_log.close()
+
+    async def handle_connection(self, reader, writer):
+        self.connections += 1
+        peer = writer.get_extra_info("peername")
+        address = peer[0] if peer else None
+        try:
+            while True:
+                try:
+                    request = await self.read_request(reader, writer, address)
+                except HttpError as e:
+                    # the rest of the stream cannot be trusted, answer and close
+                    response = json_response({"error": e.message}, e.status)
+                    await self.write_response(writer, response, False, True)
+                    return
+                if request is None:
+                    return
+
+                start = perf_counter() if metrics.enabled else None
+                response = await self.dispatch(request)
+                if start is not None:
+                    route = request.path if request.path in self.paths else "unmatched"
+                    metrics.http_request_seconds.observe(perf_counter() - start, route, request.method)
+                    metrics.http_requests_total.inc(route, request.method, str(response.status))
+                keep_alive = await self.write_response(
+                    writer, response, request.keep_alive, request.chunked
+                )
+                if not keep_alive:
+                    return
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            self.connections -= 1
+            writer.close()
+
+    async def dispatch(self, request):
+        route = self.routes.get((request.method, request.path))
+        try:
+            if route is None:
+                if request.path in self.paths:
+                    allowed = sorted(m for m, p in self.routes if p == request.path)
+                    response = json_response({"error": "Method Not Allowed"}, 405)
+                    response.headers.append(("Allow", ", ".join(allowed)))
+                    return response
+                return json_response({"error": "Not Found"}, 404)
+            return await route(request)
+        except HttpError as e:
+            return json_response({"error": e.message}, e.status)
+        except Exception:
+            # a bug in a route, answered like Flask does rather than
+            # dropping the connection
+            traceback.print_exc()
+            return json_response({"error": "Internal Server Error"}, 500)
+
+    async def read_request(self, reader, writer, address):
+        # returns the next Request, or None once the client is done
+        try:
+            head = await asyncio.wait_for(reader.readuntil(b"\r\n\r\n"), self.keepalive_timeout)
+        except (asyncio.IncompleteReadError, asyncio.TimeoutError):
+            return None
+        except asyncio.LimitOverrunError:
+            raise HttpError(431, "Request header fields too large")
+
+        lines = head[:-4].decode("latin-1").split("\r\n")
+        parts = lines[0].split()
+        if len(parts) != 3 or not parts[2].startswith("HTTP/1."):
+            raise HttpError(400, "Malformed request line")
+        method, target, version = parts
+
+        headers = {}
+        for line in lines[1:]:
+            name, sep, value = line.partition(":")
+            if not sep:
+                raise HttpError(400, "Malformed header line")
+            name = name.strip().lower()
+            value = value.strip()
+            headers[name] = headers[name] + ", " + value if name in headers else value
+
+        connection = headers.get("connection", "").lower()
+        if version == "HTTP/1.0":
+            keep_alive = "keep-alive" in connection
+        else:
+            keep_alive = "close" not in connection
+
+        if headers.get("expect", "").lower() == "100-continue":
+            writer.write(b"HTTP/1.1 100 Continue\r\n\r\n")
+        body = await self.read_body(reader, headers)
+
+        url = urlsplit(target)
+        args = {}
+        for name, value in parse_qsl(url.query, keep_blank_values=True):
+            args.setdefault(name, value)
+        client = headers.get(SESSION_HEADER.lower()) or address or "default"
+        chunked = version != "HTTP/1.0"
+        return Request(method, url.path, args, headers, body, client, keep_alive, chunked)
+
+    async def read_body(self, reader, headers):
+        if "chunked" in headers.get("transfer-encoding", "").lower():
+            parts = []
+            size = 0
+            while True:
+                line = await reader.readuntil(b"\r\n")
+                try:
+                    length = int(line.split(b";")[0], 16)
+                except ValueError:
+                    raise HttpError(400, "Malformed chunk size")
+                if length == 0:
+                    # skip trailers
+                    while await reader.readuntil(b"\r\n") != b"\r\n":
+                        pass
+                    return b"".join(parts)
+                size += length
+                if size > self.max_body:
+                    raise HttpError(413, "Request body too large")
+                parts.append(await reader.readexactly(length))
+                await reader.readexactly(2)
+
+        length = headers.get("content-length")
+        if not length:
+            return b""
+        try:
+            length = int(length)
+        except ValueError:
+            raise HttpError(400, "Malformed Content-Length")
+        if length < 0:
+            raise HttpError(400, "Malformed Content-Length")
+        if length > self.max_body:
+            raise HttpError(413, "Request body too large")
+        return await reader.readexactly(length)
+
+    async def write_response(self, writer, response, keep_alive, chunked):
+        # writes response and returns whether the connection stays open.
+        # without chunked encoding a stream is ended by closing the connection
+        streaming = not isinstance(response.body, bytes)
+        if streaming and not chunked:
+            keep_alive = False
+        status = HTTPStatus(response.status)
+        head = [
+            f"HTTP/1.1 {status.value} {status.phrase}",
+            f"Date: {formatdate(time(), usegmt=True)}",
+            f"Content-Type: {response.content_type}",
+        ]
+        head.extend(f"{name}: {value}" for name, value in response.headers)
+        if streaming and chunked:
+            head.append("Transfer-Encoding: chunked")
+        elif not streaming and status != HTTPStatus.NOT_MODIFIED:
+            head.append(f"Content-Length: {len(response.body)}")
+        head.append("Connection: keep-alive" if keep_alive else "Connection: close")
+        writer.write(("\r\n".join(head) + "\r\n\r\n").encode("latin-1"))
+
+        if not streaming:
+            writer.write(response.body)
+            await writer.drain()
+            return keep_alive
+
+        chunks = response.body
+        try:
+            async for chunk in chunks:
+                writer.write(b"%x\r\n%b\r\n" % (len(chunk), chunk) if chunked else chunk)
+                await writer.drain()
+        finally:
+            await chunks.aclose()
+        if chunked:
+            writer.write(b"0\r\n\r\n")
+        await writer.drain()
+        return keep_alive
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(prog="calc-async-server", description="asyncio calculator API")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=5000)
+    parser.add_argument("--workers", type=int, default=None,
+                        help="evaluation threads (default: Python's ThreadPoolExecutor default)")
+    parser.add_argument("--history", default=None, metavar="PATH",
+                        help="keep history in this SQLite file")
+    parser.add_argument("--metrics", action="store_true", help="collect /metrics")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    app = AsyncApp(history_path=args.history, enable_metrics=args.metrics,
+                   max_workers=args.workers)
+    app.run(args.host, args.port)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,282 @@
+import json
+from hashlib import blake2b
+
+from calc.core.backends import get_backend
+from calc.core.errors import CalcError, CalcLimitError
+from calc.core.limits import Limits
+from calc.core.validation import validate_expr
+
+# route logic shared by the Flask app (calc.api.main) and the asyncio server
+# (calc.api.async_server). handlers take the client's session and plain
+# request data (the decoded JSON body, a mapping of query parameters) and
+# return (body, status), so both front ends answer exactly the same way
+
+# clients identify themselves with this header, otherwise by address
+SESSION_HEADER = "X-Session-Token"
+
+# upper bound for ?limit= on paginated history
+MAX_PAGE_SIZE = 1000
+
+PAGING_PARAMS = ("cursor", "limit", "since", "until")
+
+# ?wait_for_version= long polls wait at most ?timeout= seconds, this long
+# unless given and never longer than MAX_WAIT
+DEFAULT_WAIT = 30.0
+MAX_WAIT = 300.0
+WAIT_PARAMS = ("wait_for_version", "timeout")
+
+# encoded responses cached per session version, for different query strings
+MAX_CACHED_RESPONSES = 16
+
+# complexity budget for every evaluation unless the app is created with
+# other limits (or limits=None), see calc.core.limits
+DEFAULT_LIMITS = Limits()
+
+# exceeding these means the expression is too big (413), exceeding the
+# others that it is too expensive to evaluate (422)
+SIZE_LIMITS = {"length", "tokens", "digits"}
+
+
+def evaluate(session, data, limits=None):
+    if not data or "expression" not in data:
+        return {"error": "Missing 'expression' field"}, 400
+
+    expr = data["expression"]
+    try:
+        backend = request_backend(data.get("backend"), data.get("precision"))
+    except ValueError as e:
+        return {"error": str(e)}, 400
+    try:
+        result = session.evaluate(expr, backend=backend, limits=limits)
+        return {
+            "expression": expr,
+            "result": result,
+            "status": "success"
+        }, 200
+    except CalcError as e:
+        return {
+            "expression": expr,
+            "error": str(e),
+            "code": e.code,
+            "status": "error"
+        }, error_status(e)
+
+
+def error_status(error):
+    if isinstance(error, CalcLimitError):
+        return 413 if error.limit in SIZE_LIMITS else 422
+    return 400
+
+
+def batch_request(args, data=None, ndjson_lines=None):
+    # (expressions, record_history, backend) for /evaluate/batch, raises
+    # ValueError if a JSON body has no expressions list or the backend is
+    # invalid. a JSON body is {"expressions": [...], "record_history": bool,
+    # "backend": ..., "precision": ...}. an NDJSON body is passed as an
+    # iterable of lines, read lazily, with ?record_history=false, ?backend=
+    # and ?precision= in the query
+    if ndjson_lines is not None:
+        record_history = args.get("record_history", "true").lower() != "false"
+        backend = request_backend(args.get("backend"), query_number(args, "precision", int))
+        return read_ndjson_expressions(ndjson_lines), record_history, backend
+    if not isinstance(data, dict) or not isinstance(data.get("expressions"), list):
+        raise ValueError("Missing 'expressions' list")
+    backend = request_backend(data.get("backend"), data.get("precision"))
+    return iter(data["expressions"]), bool(data.get("record_history", True)), backend
+
+
+def request_backend(name, precision):
+    # the numeric backend a request asks for, None for the default Decimal
+    # evaluation. a precision alone means the decimal backend
+    if name is None and precision is None:
+        return None
+    return get_backend("decimal" if name is None else name, precision)
+
+
+def batch_lines(session, exprs, record_history, backend=None, limits=None):
+    # one NDJSON line per expression, evaluated lazily as lines are consumed.
+    # limits apply to each expression on its own
+    results = session.evaluate_many(exprs, record_history, backend, limits)
+    for index, (expr, result, error) in enumerate(results):
+        if error is None:
+            record = {
+                "index": index,
+                "expression": expr,
+                "result": result,
+                "status": "success"
+            }
+        else:
+            record = {
+                "index": index,
+                "expression": expr,
+                "error": str(error),
+                "code": error.code,
+                "status": "error"
+            }
+        yield json.dumps(record) + "\n"
+
+
+def history(session, args):
+    # ?q= searches, see search_history
+    if "q" in args:
+        return search_history(session, args)
+
+    # without paging parameters, get last 10
+    if not any(key in args for key in PAGING_PARAMS):
+        entries = session.get_history()
+        return {
+            "history": entries,
+            "count": len(entries)
+        }, 200
+
+    # otherwise page through history oldest first, pass next_cursor
+    # back as ?cursor= to get the following page
+    try:
+        cursor = query_number(args, "cursor", int)
+        limit = query_number(args, "limit", int, 50)
+        since = query_number(args, "since", float)
+        until = query_number(args, "until", float)
+    except ValueError as e:
+        return {"error": str(e)}, 400
+    if not 1 <= limit <= MAX_PAGE_SIZE:
+        return {"error": f"'limit' must be between 1 and {MAX_PAGE_SIZE}"}, 400
+
+    entries, next_cursor = session.get_history_page(cursor, limit, since, until)
+    return {
+        "history": entries,
+        "count": len(entries),
+        "next_cursor": next_cursor
+    }, 200
+
+
+def history_response(session, args, if_none_match=None):
+    # GET /history as (status, encoded body, headers). the encoded body is
+    # cached until the session's version changes and carries an ETag, a
+    # matching If-None-Match gets a 304 without a body. long polls have
+    # waited (see wait_params) before this is called. history that other
+    # processes change as well is encoded every time
+    key = tuple(sorted((name, value) for name, value in args.items() if name not in WAIT_PARAMS))
+    cacheable = not getattr(session.history, "shared", False)
+    with session.lock:
+        cached = session.response_cache.get(key) if cacheable else None
+        if cached is None:
+            # read before the history, other processes may append in between
+            # and a version that is behind only makes the next poll return
+            version = session.current_version()
+            body, status = history(session, args)
+            if status != 200:
+                return status, encode_json(body), {}
+            body["version"] = version
+            data = encode_json(body)
+            cached = data, '"' + blake2b(data, digest_size=12).hexdigest() + '"'
+            if cacheable and len(session.response_cache) < MAX_CACHED_RESPONSES:
+                session.response_cache[key] = cached
+    data, etag = cached
+    if if_none_match and etag_matches(if_none_match, etag):
+        return 304, b"", {"ETag": etag}
+    return 200, data, {"ETag": etag}
+
+
+def wait_params(args):
+    # (version, timeout) of a ?wait_for_version= long poll, None for a
+    # plain request. raises ValueError if either is malformed
+    version = query_number(args, "wait_for_version", int)
+    if version is None:
+        return None
+    timeout = query_number(args, "timeout", float, DEFAULT_WAIT)
+    if not 0 <= timeout <= MAX_WAIT:
+        raise ValueError(f"'timeout' must be between 0 and {MAX_WAIT:g}")
+    return version, timeout
+
+
+def etag_matches(if_none_match, etag):
+    # If-None-Match holds "*" or a list of tags, weak ones match too
+    for tag in if_none_match.split(","):
+        tag = tag.strip()
+        if tag == "*" or tag.removeprefix("W/") == etag:
+            return True
+    return False
+
+
+def encode_json(body):
+    # the bytes Flask's jsonify sends
+    return (json.dumps(body, separators=(",", ":"), sort_keys=True) + "\n").encode()
+
+
+def search_history(session, args):
+    # the last ?limit= entries (default 50) whose expression contains ?q=,
+    # or starts with it with ?match=prefix, whitespace ignored
+    query = args["q"]
+    match = args.get("match", "substring")
+    if match not in ("substring", "prefix"):
+        return {"error": "'match' must be 'substring' or 'prefix'"}, 400
+    try:
+        limit = query_number(args, "limit", int, 50)
+    except ValueError as e:
+        return {"error": str(e)}, 400
+    if not 1 <= limit <= MAX_PAGE_SIZE:
+        return {"error": f"'limit' must be between 1 and {MAX_PAGE_SIZE}"}, 400
+
+    entries = session.search_history(query, limit, prefix=match == "prefix")
+    return {
+        "history": entries,
+        "count": len(entries),
+        "query": query
+    }, 200
+
+
+def validate(data, limits=None):
+    # parse-only check for validating while typing, takes no session so
+    # history and state are never touched. problems as in
+    # calc.core.validation, a valid expression is 200 with none
+    if not isinstance(data, dict) or "expression" not in data:
+        return {"error": "Missing 'expression' field"}, 400
+
+    expr = data["expression"]
+    if not isinstance(expr, str):
+        return {"error": "'expression' must be a string"}, 400
+    problems = validate_expr(expr, limits)
+    return {"expression": expr, "valid": not problems, "problems": problems}, 200
+
+
+def clear_history(session):
+    session.clear_history()
+    return {"status": "success", "message": "History cleared"}, 200
+
+
+def reset(session):
+    session.reset()
+    return {"status": "success", "message": "Calculator reset"}, 200
+
+
+def health():
+    return {"status": "ok"}, 200
+
+
+def query_number(args, name, convert, default=None):
+    # reads a numeric query parameter, raising ValueError if it is malformed
+    value = args.get(name)
+    if value is None:
+        return default
+    try:
+        return convert(value)
+    except ValueError:
+        raise ValueError(f"Invalid value for '{name}': {value!r}")
+
+
+def read_ndjson_expressions(lines):
+    # yields one expression per non-blank line (bytes or str). a line is
+    # either a JSON string or an object with an "expression" field, lines
+    # that are not valid JSON yield None and are reported as item errors
+    for line in lines:
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            item = json.loads(line)
+        except ValueError:
+            yield None
+            continue
+        if isinstance(item, dict):
+            item = item.get("expression")
+        yield item
@@ -1,59 +1,145 @@
-from flask import Flask, request, jsonify
+import atexit
+from time import perf_counter
+
+from flask import Flask, Response, g, request, jsonify, stream_with_context
+from werkzeug.serving import WSGIRequestHandler
+from calc.api import handlers
+from calc.api.handlers import SESSION_HEADER
+from calc.api.sessions import SessionStore
+from calc.core import metrics
+from calc.core.history import HistoryLog, SQLiteHistory
 from calc.core.session import CalculatorSession
-from calc.core.errors import CalcError
+
+# route logic lives in calc.api.handlers, shared with calc.api.async_server
 
 
-def create_app():
+def create_app(session_ttl=900, max_sessions=10000, history_path=None,
+               enable_metrics=False, history_factory=None, limits=handlers.DEFAULT_LIMITS,
+               history_size=10):
+    # limits is the calc.core.limits.Limits every evaluation is held to,
+    # None turns them off. history_size is how many entries each client's
+    # in-memory history keeps
     app = Flask(__name__)
-    # global session for API
-    session = CalculatorSession()
+
+    # metrics are process wide, see calc.core.metrics
+    if enable_metrics:
+        metrics.enable()
+
+    if history_factory is not None:
+        # history_factory(token) returns the history backend for a new
+        # client, e.g. a view of a store shared between worker processes
+        def factory(token):
+            return CalculatorSession(history=history_factory(token))
+    elif history_path is not None:
+        # with history_path, every client's history goes to one durable
+        # SQLite log and survives restarts and session eviction
+        history_log = HistoryLog(history_path)
+        app.config["HISTORY_LOG"] = history_log
+        # the writer is a daemon thread, rows it has not written yet would
+        # be lost at exit
+        atexit.register(history_log.close)
+
+        def factory(token):
+            return CalculatorSession(history=SQLiteHistory(history_log, token))
+    else:
+        def factory(token):
+            return CalculatorSession(history_size=history_size)
+
+    # one session per client, idle ones are dropped after session_ttl seconds
+    sessions = SessionStore(ttl=session_ttl, max_sessions=max_sessions, factory=factory)
+
+    def client_session():
+        token = request.headers.get(SESSION_HEADER) or request.remote_addr or "default"
+        return sessions.get(token)
+
+    @app.before_request
+    def start_timer():
+        if metrics.enabled:
+            g.request_start = perf_counter()
+
+    @app.after_request
+    def record_request(response):
+        start = g.pop("request_start", None)
+        if start is not None:
+            route = request.url_rule.rule if request.url_rule else "unmatched"
+            metrics.http_request_seconds.observe(perf_counter() - start, route, request.method)
+            metrics.http_requests_total.inc(route, request.method, str(response.status_code))
+        return response
     
     @app.route("/evaluate", methods=["POST"])
     def evaluate():
         data = request.get_json()
-        
-        if not data or "expression" not in data:
-            return jsonify({"error": "Missing 'expression' field"}), 400
-        
-        expr = data["expression"]
-        
+        body, status = handlers.evaluate(client_session(), data, limits)
+        return jsonify(body), status
+
+    @app.route("/evaluate/batch", methods=["POST"])
+    def evaluate_batch():
+        # evaluates many expressions and streams one JSON record per line,
+        # the NDJSON body form is read incrementally
         try:
-            result = session.evaluate(expr)
-            return jsonify({
-                "expression": expr,
-                "result": result,
-                "status": "success"
-            }), 200
-        except CalcError as e:
-            return jsonify({
-                "expression": expr,
-                "error": str(e),
-                "status": "error"
-            }), 400
+            if request.mimetype == "application/x-ndjson":
+                batch = handlers.batch_request(request.args, ndjson_lines=request.stream)
+            else:
+                batch = handlers.batch_request(request.args, request.get_json(silent=True))
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+
+        lines = handlers.batch_lines(client_session(), *batch, limits)
+        return Response(stream_with_context(lines), mimetype="application/x-ndjson")
+
+    @app.route("/validate", methods=["POST"])
+    def validate():
+        # no client_session(), validation has no session state
+        body, status = handlers.validate(request.get_json(), limits)
+        return jsonify(body), status
 
     @app.route("/history", methods=["GET"])
     def get_history():
-        # get last 10
-        history = session.get_history()
-        return jsonify({
-            "history": history,
-            "count": len(history)
-        }), 200
+        # ETag and If-None-Match, ?wait_for_version=N blocks this request's
+        # thread until the client's history changes past version N
+        session = client_session()
+        try:
+            wait = handlers.wait_params(request.args)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        if wait is not None:
+            session.wait_for_version(*wait)
+        status, data, headers = handlers.history_response(
+            session, request.args, request.headers.get("If-None-Match")
+        )
+        return Response(data, status, headers, mimetype="application/json")
 
     @app.route("/clear", methods=["POST"])
     def clear_history():
         # clear history
-        session.clear_history()
-        return jsonify({"status": "success", "message": "History cleared"}), 200
+        body, status = handlers.clear_history(client_session())
+        return jsonify(body), status
 
     @app.route("/reset", methods=["POST"])
     def reset():
         # reset calculator state
-        session.reset()
-        return jsonify({"status": "success", "message": "Calculator reset"}), 200
+        body, status = handlers.reset(client_session())
+        return jsonify(body), status
+
+    @app.route("/sessions", methods=["GET"])
+    def session_stats():
+        # session count, eviction counters and approximate memory use
+        return jsonify(sessions.stats()), 200
+
+    @app.route("/metrics", methods=["GET"])
+    def get_metrics():
+        # Prometheus text format, empty series until metrics are enabled
+        return Response(metrics.registry.render(), mimetype="text/plain; version=0.0.4")
 
     @app.route("/health", methods=["GET"])
     def health():
-        return jsonify({"status": "ok"}), 200
+        body, status = handlers.health()
+        return jsonify(body), status
 
     return app
+
+
+class KeepAliveRequestHandler(WSGIRequestHandler):
+    # for werkzeug's server: HTTP/1.1 keeps client connections open between
+    # requests instead of closing after every response
+    protocol_version = "HTTP/1.1"
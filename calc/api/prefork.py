@@ -0,0 +1,381 @@
+import argparse
+import os
+import signal
+import socket
+import struct
+import sys
+import threading
+import time
+import traceback
+from multiprocessing import shared_memory
+
+from flask import jsonify
+from werkzeug.serving import make_server
+
+from calc.api.main import create_app
+from calc.core.shared_history import ProcessLock, SharedHistory, SharedHistoryRing
+
+# pre-fork serving mode (POSIX only). the master process opens the
+# listening socket and the shared history ring, then forks N workers that
+# each run create_app() behind a threaded werkzeug server on the inherited
+# socket, so evaluation work spreads over N cores instead of one GIL.
+#
+# workers report into a shared table (pid, state, heartbeat, requests
+# served) that GET /workers on any worker returns. a worker's heartbeat
+# stops while one of its requests has been in flight for longer than
+# request_timeout (long polls and streamed responses included), so a worker
+# whose request threads are stuck goes stale. the master reaps and respawns
+# workers that exit, kills ones whose heartbeat stops, and on
+# SIGHUP replaces them one at a time: the new worker starts accepting
+# before the old one drains its in-flight requests and exits. SIGTERM or
+# SIGINT stops everything the same graceful way
+
+STARTING, READY, DRAINING = 1, 2, 3
+STATE_NAMES = {0: "stopped", STARTING: "starting", READY: "ready", DRAINING: "draining"}
+
+# pid, state, started, last heartbeat, requests served, restarts of the slot
+WORKER = struct.Struct("<qbddqq")
+
+HEARTBEAT_INTERVAL = 1.0
+# longer than the longest /history long poll, see calc.api.handlers
+REQUEST_TIMEOUT = 330.0
+# a worker that starts faster than this after its last start is held back
+# so a crashing worker cannot fork in a tight loop
+RESPAWN_DELAY = 1.0
+
+
+class WorkerTable:
+    # one WORKER record per worker slot in shared memory. only the process
+    # owning a slot (its pid matches) writes to it, apart from the master
+    # assigning the slot to a new worker
+
+    def __init__(self, size):
+        self.size = size
+        self.shm = shared_memory.SharedMemory(create=True, size=size * WORKER.size)
+        self.buf = self.shm.buf
+        self.lock = ProcessLock()
+        for index in range(size):
+            WORKER.pack_into(self.buf, index * WORKER.size, 0, 0, 0.0, 0.0, 0, 0)
+
+    def read(self, index):
+        with self.lock:
+            return WORKER.unpack_from(self.buf, index * WORKER.size)
+
+    def assign(self, index, pid, restarts):
+        now = time.time()
+        with self.lock:
+            WORKER.pack_into(self.buf, index * WORKER.size, pid, STARTING, now, now, 0, restarts)
+
+    def update(self, index, pid, state=None, heartbeat=False, requests=0):
+        # changes the slot if pid still owns it, returns the request count
+        with self.lock:
+            record = list(WORKER.unpack_from(self.buf, index * WORKER.size))
+            if record[0] != pid:
+                return None
+            if state is not None:
+                record[1] = state
+            if heartbeat:
+                record[3] = time.time()
+            record[4] += requests
+            WORKER.pack_into(self.buf, index * WORKER.size, *record)
+            return record[4]
+
+    def snapshot(self):
+        workers = []
+        for index in range(self.size):
+            pid, state, started, heartbeat, requests, restarts = self.read(index)
+            workers.append({
+                "index": index,
+                "pid": pid,
+                "state": STATE_NAMES[state],
+                "started": started,
+                "last_heartbeat": heartbeat,
+                "requests": requests,
+                "restarts": restarts,
+            })
+        return workers
+
+    def close(self):
+        self.buf = None
+        self.shm.close()
+        self.lock.close()
+
+    def unlink(self):
+        self.shm.unlink()
+
+
+class PreforkServer:
+
+    def __init__(self, host="127.0.0.1", port=5000, workers=4, history_capacity=100000,
+                 session_ttl=900, max_sessions=10000, max_requests=None,
+                 heartbeat_timeout=30.0, graceful_timeout=30.0, request_timeout=REQUEST_TIMEOUT):
+        if workers < 1:
+            raise ValueError("workers must be >= 1")
+        self.host = host
+        self.port = port
+        self.workers = workers
+        self.history_capacity = history_capacity
+        self.session_ttl = session_ttl
+        self.max_sessions = max_sessions
+        self.max_requests = max_requests # a worker is recycled after this many
+        self.heartbeat_timeout = heartbeat_timeout
+        self.graceful_timeout = graceful_timeout
+        self.request_timeout = request_timeout # a request running longer marks its worker stuck
+
+        self.sock = None
+        self.ring = None
+        self.table = None
+        self.pids = [None] * workers # current worker of each slot
+        self.draining = set() # replaced workers still finishing requests
+        self.terminating = {} # stale worker pid -> time.monotonic() to SIGKILL it
+        self.started = [0.0] * workers
+        self.restarts = [0] * workers
+        self.stopping = False
+        self.restart_requested = False
+
+    def run(self):
+        self.start()
+        try:
+            self.supervise()
+        finally:
+            self.shutdown()
+
+    def start(self):
+        self.sock = socket.create_server((self.host, self.port), backlog=2048)
+        self.sock.set_inheritable(True)
+        self.port = self.sock.getsockname()[1]
+        self.ring = SharedHistoryRing(self.history_capacity)
+        self.table = WorkerTable(self.workers)
+        signal.signal(signal.SIGTERM, self.request_stop)
+        signal.signal(signal.SIGINT, self.request_stop)
+        signal.signal(signal.SIGHUP, self.request_restart)
+        for index in range(self.workers):
+            self.spawn(index)
+        print(f"Listening on http://{self.host}:{self.port} with {self.workers} workers", flush=True)
+
+    def request_stop(self, signum, frame):
+        self.stopping = True
+
+    def request_restart(self, signum, frame):
+        self.restart_requested = True
+
+    def spawn(self, index):
+        self.started[index] = time.monotonic()
+        pid = os.fork()
+        if pid == 0:
+            code = 1
+            try:
+                code = Worker(self, index).run()
+            except BaseException:
+                traceback.print_exc()
+            finally:
+                os._exit(code)
+        self.pids[index] = pid
+        self.table.assign(index, pid, self.restarts[index])
+        return pid
+
+    def supervise(self):
+        while not self.stopping:
+            self.reap()
+            self.check_heartbeats()
+            if self.restart_requested:
+                self.restart_requested = False
+                self.rolling_restart()
+            time.sleep(0.1)
+
+    def reap(self):
+        # collects exited workers and respawns the slots they held
+        while True:
+            try:
+                pid, _ = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                return
+            if pid == 0:
+                return
+            self.draining.discard(pid)
+            self.terminating.pop(pid, None)
+            if pid in self.pids and not self.stopping:
+                index = self.pids.index(pid)
+                wait = self.started[index] + RESPAWN_DELAY - time.monotonic()
+                if wait > 0:
+                    time.sleep(wait)
+                self.restarts[index] += 1
+                self.spawn(index)
+
+    def check_heartbeats(self):
+        # a worker with a request stuck for request_timeout stops beating and
+        # is stopped, reap() then replaces it. SIGTERM comes first and SIGKILL
+        # only after graceful_timeout; the shared locks survive a SIGKILL
+        # (see ProcessLock), but a worker killed halfway through a write
+        # leaves a half-written record behind
+        now = time.time()
+        for index, pid in enumerate(self.pids):
+            record = self.table.read(index)
+            if (pid not in self.terminating and record[0] == pid and record[1] == READY
+                    and now - record[3] > self.heartbeat_timeout):
+                kill(pid, signal.SIGTERM)
+                self.terminating[pid] = time.monotonic() + self.graceful_timeout
+        for pid, deadline in list(self.terminating.items()):
+            if time.monotonic() > deadline:
+                kill(pid, signal.SIGKILL)
+                del self.terminating[pid]
+
+    def rolling_restart(self):
+        # replaces workers one at a time, there is always one accepting
+        for index in range(self.workers):
+            if self.stopping:
+                return
+            old = self.pids[index]
+            self.restarts[index] += 1
+            self.spawn(index)
+            self.wait_ready(index)
+            self.draining.add(old)
+            kill(old, signal.SIGTERM)
+
+    def wait_ready(self, index, timeout=10.0):
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline and not self.stopping:
+            if self.table.read(index)[1] == READY:
+                return True
+            time.sleep(0.02)
+        return False
+
+    def shutdown(self):
+        pids = [pid for pid in self.pids if pid] + list(self.draining)
+        for pid in pids:
+            kill(pid, signal.SIGTERM)
+        deadline = time.monotonic() + self.graceful_timeout
+        remaining = set(pids)
+        while remaining and time.monotonic() < deadline:
+            for pid in list(remaining):
+                try:
+                    if os.waitpid(pid, os.WNOHANG)[0]:
+                        remaining.discard(pid)
+                except ChildProcessError:
+                    remaining.discard(pid)
+            time.sleep(0.05)
+        for pid in remaining:
+            kill(pid, signal.SIGKILL)
+            os.waitpid(pid, 0)
+
+        self.sock.close()
+        self.ring.close()
+        self.ring.unlink()
+        self.table.close()
+        self.table.unlink()
+
+
+class Worker:
+    # runs in a forked child
+
+    def __init__(self, master, index):
+        self.master = master
+        self.index = index
+        self.pid = os.getpid()
+        self.table = master.table
+        self.stopping = threading.Event()
+        self.server = None
+        self.in_flight = {} # request thread id -> time.monotonic() it started
+
+    def run(self):
+        master = self.master
+        ring = master.ring
+        signal.signal(signal.SIGTERM, self.stop)
+        signal.signal(signal.SIGINT, signal.SIG_IGN) # the master handles ^C
+        signal.signal(signal.SIGHUP, signal.SIG_DFL)
+
+        app = create_app(
+            session_ttl=master.session_ttl, max_sessions=master.max_sessions,
+            history_factory=lambda token: SharedHistory(ring, token),
+        )
+
+        @app.before_request
+        def start_request():
+            self.in_flight[threading.get_ident()] = time.monotonic()
+
+        @app.teardown_request
+        def end_request(error=None):
+            self.in_flight.pop(threading.get_ident(), None)
+
+        @app.after_request
+        def count_request(response):
+            served = self.table.update(self.index, self.pid, requests=1)
+            if master.max_requests and served is not None and served >= master.max_requests:
+                self.stop()
+            return response
+
+        @app.route("/workers", methods=["GET"])
+        def workers():
+            # health of every worker, whichever one answers
+            return jsonify({"served_by": self.pid, "workers": self.table.snapshot()}), 200
+
+        self.server = make_server(
+            master.host, master.port, app, threaded=True, fd=master.sock.fileno()
+        )
+        # server_close() then waits for in-flight requests
+        self.server.daemon_threads = False
+        master.sock.close()
+
+        threading.Thread(target=self.beat, daemon=True).start()
+        self.table.update(self.index, self.pid, state=READY, heartbeat=True)
+        self.server.serve_forever()
+        self.server.server_close()
+        return 0
+
+    def stop(self, signum=None, frame=None):
+        # stop accepting, finish in-flight requests, then exit
+        if self.stopping.is_set():
+            return
+        self.stopping.set()
+        self.table.update(self.index, self.pid, state=DRAINING)
+        threading.Thread(target=self.server.shutdown, daemon=True).start()
+
+    def beat(self):
+        # runs on its own thread, so it only vouches for the worker while no
+        # request has been running for longer than request_timeout
+        while not self.stopping.wait(HEARTBEAT_INTERVAL):
+            if not self.stuck():
+                self.table.update(self.index, self.pid, heartbeat=True)
+
+    def stuck(self):
+        started = list(self.in_flight.values())
+        return bool(started) and time.monotonic() - min(started) > self.master.request_timeout
+
+
+def kill(pid, sig):
+    try:
+        os.kill(pid, sig)
+    except ProcessLookupError:
+        pass
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(prog="calc-prefork", description="pre-fork calculator API")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=5000)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--history-capacity", type=int, default=100000,
+                        help="history entries kept across all clients")
+    parser.add_argument("--max-requests", type=int, default=None,
+                        help="recycle a worker after this many requests")
+    parser.add_argument("--heartbeat-timeout", type=float, default=30.0)
+    parser.add_argument("--request-timeout", type=float, default=REQUEST_TIMEOUT,
+                        help="a request running longer marks its worker stuck")
+    parser.add_argument("--graceful-timeout", type=float, default=30.0)
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    if not hasattr(os, "fork"):
+        sys.exit("pre-fork mode needs os.fork")
+    args = parse_args(argv)
+    PreforkServer(
+        host=args.host, port=args.port, workers=args.workers,
+        history_capacity=args.history_capacity, max_requests=args.max_requests,
+        heartbeat_timeout=args.heartbeat_timeout, graceful_timeout=args.graceful_timeout,
+        request_timeout=args.request_timeout,
+    ).run()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,132 @@
+import threading
+import time
+from collections import OrderedDict
+
+from calc.core.session import CalculatorSession
+
+
+class SessionStore:
+    # per-client CalculatorSessions with idle-TTL and max-sessions eviction.
+    # clients are spread over independently locked shards so unrelated
+    # clients never wait on each other. each shard keeps its sessions in
+    # least recently used order, so expired and excess sessions are always
+    # at the front. max_sessions is split evenly between the shards and
+    # each one evicts on its own, so with uneven hashing a session can be
+    # evicted while the store as a whole holds fewer than max_sessions.
+    # there are never more shards than max_sessions
+
+    def __init__(self, ttl=900, max_sessions=10000, shards=16,
+                 factory=None, clock=time.monotonic):
+        if shards < 1:
+            raise ValueError("shards must be >= 1")
+        if max_sessions < 1:
+            raise ValueError("max_sessions must be >= 1")
+        self.ttl = ttl
+        self.max_sessions = max_sessions
+        # called with the client token to build a new session
+        self.factory = factory or new_session
+        self.clock = clock
+        # capacity is split evenly so each shard can evict on its own
+        shards = min(shards, max_sessions)
+        self.shard_capacity = -(-max_sessions // shards)
+        self.shards = [(threading.Lock(), OrderedDict()) for _ in range(shards)]
+        self.stats_lock = threading.Lock()
+        self.created = 0
+        self.expired = 0
+        self.evicted = 0
+
+    def get(self, token):
+        # returns the session for token, creating it if needed
+        lock, sessions = self._shard(token)
+        now = self.clock()
+        created = evicted = 0
+        with lock:
+            expired = self._expire(sessions, now)
+            entry = sessions.get(token)
+            if entry is not None:
+                entry[1] = now
+                sessions.move_to_end(token)
+        if entry is None:
+            # built without the lock, a slow factory (say a SQLite-backed
+            # history) must not hold up every client in the shard. if another
+            # request for token got there first, its session is used
+            session = self.factory(token)
+            with lock:
+                entry = sessions.setdefault(token, [session, now]) # session, last used
+                if entry[0] is session:
+                    created = 1
+                    while len(sessions) > self.shard_capacity:
+                        sessions.popitem(last=False)
+                        evicted += 1
+                else:
+                    entry[1] = now
+                    sessions.move_to_end(token)
+        if created or expired:
+            self._count(created, expired, evicted)
+        return entry[0]
+
+    def discard(self, token):
+        lock, sessions = self._shard(token)
+        with lock:
+            sessions.pop(token, None)
+
+    def sweep(self):
+        # drops idle sessions from every shard, returns how many were dropped
+        now = self.clock()
+        total = 0
+        for lock, sessions in self.shards:
+            with lock:
+                total += self._expire(sessions, now)
+        if total:
+            self._count(0, total, 0)
+        return total
+
+    def stats(self):
+        self.sweep()
+        count = 0
+        memory = 0
+        for lock, sessions in self.shards:
+            with lock:
+                entries = list(sessions.values())
+            count += len(entries)
+            # never waits for a session's lock, a busy one reports its last size
+            memory += sum(entry[0].memory_usage(blocking=False) for entry in entries)
+        with self.stats_lock:
+            return {
+                "sessions": count,
+                "max_sessions": self.max_sessions,
+                "ttl": self.ttl,
+                "created": self.created,
+                "expired": self.expired,
+                "evicted": self.evicted,
+                "memory_bytes": memory,
+            }
+
+    def __len__(self):
+        return sum(len(sessions) for _, sessions in self.shards)
+
+    def _shard(self, token):
+        return self.shards[hash(token) % len(self.shards)]
+
+    def _expire(self, sessions, now):
+        # caller holds the shard lock
+        if self.ttl is None:
+            return 0
+        expired = 0
+        while sessions:
+            token, entry = next(iter(sessions.items()))
+            if now - entry[1] < self.ttl:
+                break
+            del sessions[token]
+            expired += 1
+        return expired
+
+    def _count(self, created, expired, evicted):
+        with self.stats_lock:
+            self.created += created
+            self.expired += expired
+            self.evicted += evicted
+
+
+def new_session(token):
+    return CalculatorSession()
@@ -0,0 +1,265 @@
+import argparse
+import http.client
+import itertools
+import json
+import random
+import sys
+import threading
+import time
+from collections import Counter
+from urllib.parse import urlsplit
+
+# load generator for the calculator API:
+#
+#   python -m calc.bench.load --workload mixed --concurrency 16 --duration 30
+#   python -m calc.bench.load --url http://host:5000 --rate 500 --requests 20000
+#
+# without --url it serves create_app() from this process on a free port,
+# which shares the GIL with the load threads; point --url at a separately
+# started server for numbers worth comparing. every worker thread is one
+# client with its own keep-alive connection and X-Session-Token.
+#
+# without --rate each worker sends its next request as soon as the last one
+# is answered. with --rate requests are scheduled at that total rate and
+# latency counts from the scheduled time, so a server that falls behind
+# shows it in the percentiles instead of just receiving fewer requests.
+#
+# the report is one JSON object on stdout (or --output): throughput,
+# latency percentiles overall and per endpoint, status counts and errors
+# by CalcError code (HTTP_<status> or the exception name otherwise)
+
+WORKLOADS = ("evaluate", "history", "mixed")
+
+EXPRESSIONS = [
+    "2 + 3 * 4",
+    "(1 + 2) * (3 + 4) / 5",
+    "-(7.5 - 2.25) * 4",
+    "100 / 7",
+    "((2 + 3) * (4 - 1)) / (6 - 1)",
+    "1 + 2 + 3 + 4 + 5 + 6 + 7 + 8 + 9 + 10",
+    "3.14159 * 2 * 2",
+    "-(-(-1)) + 0.5",
+]
+
+# one of each error code
+INVALID_EXPRESSIONS = [
+    "2 * (3 + 4",
+    "1 / (2 - 2)",
+    "unknown + 1",
+]
+
+
+class LoadGenerator:
+
+    def __init__(self, url, workload="mixed", concurrency=8, rate=None, duration=10.0,
+                 requests=None, evaluate_share=0.8, invalid_share=0.0, expressions=None,
+                 seed=0, timeout=10.0):
+        if workload not in WORKLOADS:
+            raise ValueError(f"workload must be one of {', '.join(WORKLOADS)}")
+        if concurrency < 1:
+            raise ValueError("concurrency must be >= 1")
+        parts = urlsplit(url)
+        self.url = url
+        self.host = parts.hostname
+        self.port = parts.port or 80
+        self.prefix = parts.path.rstrip("/")
+        self.workload = workload
+        self.concurrency = concurrency
+        self.rate = rate # requests per second over all workers, None for no limit
+        self.duration = duration
+        self.requests = requests # stop after this many, even before duration
+        self.evaluate_share = evaluate_share # of a mixed workload
+        self.invalid_share = invalid_share # of evaluations
+        self.expressions = expressions or EXPRESSIONS
+        self.seed = seed
+        self.timeout = timeout
+        self.issued = itertools.count()
+
+    def run(self):
+        results = [[] for _ in range(self.concurrency)]
+        self.start = time.perf_counter()
+        self.deadline = self.start + self.duration
+        threads = [
+            threading.Thread(target=self.worker, args=(index, results[index]), daemon=True)
+            for index in range(self.concurrency)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - self.start
+        return self.report([r for worker in results for r in worker], elapsed)
+
+    def worker(self, index, results):
+        # appends (endpoint, latency, status, error) per request
+        rng = random.Random(self.seed * 1000 + index)
+        headers = {"X-Session-Token": f"load-{index}", "Content-Type": "application/json"}
+        connection = self.connect()
+        try:
+            while True:
+                number = next(self.issued)
+                if self.requests is not None and number >= self.requests:
+                    return
+                scheduled = time.perf_counter()
+                if self.rate:
+                    scheduled = self.start + number / self.rate
+                    if scheduled >= self.deadline:
+                        return
+                    delay = scheduled - time.perf_counter()
+                    if delay > 0:
+                        time.sleep(delay)
+                elif scheduled >= self.deadline:
+                    return
+
+                endpoint, method, path, body = self.next_request(rng)
+                try:
+                    connection.request(method, self.prefix + path, body=body, headers=headers)
+                    response = connection.getresponse()
+                    data = response.read()
+                    status, error = response.status, response_error(response.status, data)
+                except (OSError, http.client.HTTPException) as e:
+                    status, error = None, type(e).__name__
+                    connection.close()
+                    connection = self.connect()
+                results.append((endpoint, time.perf_counter() - scheduled, status, error))
+        finally:
+            connection.close()
+
+    def connect(self):
+        return http.client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+
+    def next_request(self, rng):
+        # (endpoint, method, path, body)
+        evaluate = self.workload == "evaluate" or (
+            self.workload == "mixed" and rng.random() < self.evaluate_share
+        )
+        if not evaluate:
+            return "history", "GET", "/history", None
+        if self.invalid_share and rng.random() < self.invalid_share:
+            expr = rng.choice(INVALID_EXPRESSIONS)
+        else:
+            expr = rng.choice(self.expressions)
+        return "evaluate", "POST", "/evaluate", json.dumps({"expression": expr})
+
+    def report(self, results, elapsed):
+        endpoints = {}
+        for endpoint in sorted({r[0] for r in results}):
+            latencies = [r[1] for r in results if r[0] == endpoint]
+            endpoints[endpoint] = {"requests": len(latencies), "latency_ms": percentiles(latencies)}
+        return {
+            "target": self.url,
+            "workload": self.workload,
+            "concurrency": self.concurrency,
+            "rate": self.rate,
+            "duration": round(elapsed, 3),
+            "requests": len(results),
+            "throughput": round(len(results) / elapsed, 1) if elapsed else 0.0,
+            "latency_ms": percentiles([r[1] for r in results]),
+            "endpoints": endpoints,
+            "status": dict(sorted(Counter(str(r[2]) for r in results).items())),
+            "errors": dict(sorted(Counter(r[3] for r in results if r[3]).items())),
+        }
+
+
+def response_error(status, data):
+    # None for a success, else the CalcError code of the response if it
+    # has one, else HTTP_<status>
+    if status < 400:
+        return None
+    try:
+        code = json.loads(data).get("code")
+    except (ValueError, AttributeError):
+        code = None
+    return code or f"HTTP_{status}"
+
+
+def percentiles(latencies):
+    # nearest-rank percentiles of latencies (seconds) in milliseconds
+    if not latencies:
+        return {"p50": None, "p95": None, "p99": None, "max": None, "mean": None}
+    ordered = sorted(latencies)
+
+    def rank(p):
+        return round(ordered[max(0, -(-len(ordered) * p // 100) - 1)] * 1000, 3)
+
+    return {
+        "p50": rank(50),
+        "p95": rank(95),
+        "p99": rank(99),
+        "max": round(ordered[-1] * 1000, 3),
+        "mean": round(sum(ordered) / len(ordered) * 1000, 3),
+    }
+
+
+def start_local_server():
+    # serves create_app() on a free port from a background thread, returns
+    # the server and its URL
+    from werkzeug.serving import make_server
+
+    from calc.api.main import KeepAliveRequestHandler, create_app
+
+    class QuietRequestHandler(KeepAliveRequestHandler):
+        # a log line per request would cost more than some of the requests
+        def log_request(self, code="-", size="-"):
+            pass
+
+    server = make_server(
+        "127.0.0.1", 0, create_app(), threaded=True, request_handler=QuietRequestHandler
+    )
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_port}"
+
+
+def read_expressions(path):
+    with open(path, encoding="utf-8") as f:
+        return [line.strip() for line in f if line.strip()]
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(prog="calc-load", description="calculator API load generator")
+    parser.add_argument("--url", help="server to target, default: start the Flask app locally")
+    parser.add_argument("--workload", choices=WORKLOADS, default="mixed")
+    parser.add_argument("--concurrency", type=int, default=8, help="worker threads")
+    parser.add_argument("--rate", type=float, default=None,
+                        help="total requests per second, default: as fast as answered")
+    parser.add_argument("--duration", type=float, default=10.0, help="seconds to run")
+    parser.add_argument("--requests", type=int, default=None, help="stop after this many")
+    parser.add_argument("--evaluate-share", type=float, default=0.8,
+                        help="fraction of /evaluate requests in the mixed workload")
+    parser.add_argument("--invalid-share", type=float, default=0.0,
+                        help="fraction of evaluations using invalid expressions")
+    parser.add_argument("--expressions", help="file with one expression per line")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="write the JSON report here instead of stdout")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    server = None
+    url = args.url
+    if url is None:
+        server, url = start_local_server()
+    try:
+        report = LoadGenerator(
+            url, workload=args.workload, concurrency=args.concurrency, rate=args.rate,
+            duration=args.duration, requests=args.requests,
+            evaluate_share=args.evaluate_share, invalid_share=args.invalid_share,
+            expressions=read_expressions(args.expressions) if args.expressions else None,
+            seed=args.seed,
+        ).run()
+    finally:
+        if server is not None:
+            server.shutdown()
+
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
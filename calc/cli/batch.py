@@ -0,0 +1,93 @@
+import json
+import sys
+import time
+
+from calc.core.errors import CalcError
+from calc.core.session import CalculatorSession
+
+# read and write in large blocks, results are flushed this many at a time
+BUFFER_SIZE = 1 << 20
+WRITE_CHUNK = 1024
+
+
+def read_expressions(lines):
+    # yields (line_number, expression) for every non-blank line
+    for number, line in enumerate(lines, 1):
+        expr = line.strip()
+        if expr:
+            yield number, expr
+
+
+def evaluate_expressions(numbered, session):
+    # yields (line_number, expression, result, error) without recording
+    # history, so memory stays flat however long the input is
+    for number, expr in numbered:
+        try:
+            yield number, expr, session.evaluate(expr, record_history=False), None
+        except CalcError as e:
+            yield number, expr, None, e
+
+
+def format_tsv(number, expr, result, error):
+    if error is None:
+        return f"{expr}\t{result}\n"
+    return f"{expr}\tError: {error}\n"
+
+
+def format_jsonl(number, expr, result, error):
+    if error is None:
+        record = {"line": number, "expression": expr, "result": result}
+    else:
+        record = {"line": number, "expression": expr, "error": error.message, "code": error.code}
+    return json.dumps(record) + "\n"
+
+
+FORMATS = {
+    "tsv": format_tsv,
+    "jsonl": format_jsonl,
+}
+
+
+def run_batch(infile, outfile, fmt="tsv", report=None):
+    # streams every line of infile through the evaluator into outfile and
+    # returns (count, errors, seconds). a summary goes to report if given
+    formatter = FORMATS[fmt]
+    session = CalculatorSession()
+    count = errors = 0
+    chunk = []
+    start = time.perf_counter()
+
+    results = evaluate_expressions(read_expressions(infile), session)
+    for number, expr, result, error in results:
+        count += 1
+        if error is not None:
+            errors += 1
+        chunk.append(formatter(number, expr, result, error))
+        if len(chunk) >= WRITE_CHUNK:
+            outfile.writelines(chunk)
+            chunk.clear()
+    outfile.writelines(chunk)
+    outfile.flush()
+
+    seconds = time.perf_counter() - start
+    if report is not None:
+        rate = count / seconds if seconds > 0 else 0.0
+        report.write(
+            f"Processed {count} expressions ({errors} errors) "
+            f"in {seconds:.2f}s, {rate:.0f} expr/s\n"
+        )
+    return count, errors, seconds
+
+
+def main_batch(path, fmt="tsv"):
+    # entry point used by calc.cli.main for --file / piped stdin
+    if path == "-":
+        infile = sys.stdin
+    else:
+        infile = open(path, "r", encoding="utf-8", buffering=BUFFER_SIZE)
+    try:
+        _, errors, _ = run_batch(infile, sys.stdout, fmt, report=sys.stderr)
+    finally:
+        if infile is not sys.stdin:
+            infile.close()
+    return 1 if errors else 0
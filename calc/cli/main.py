@@ -1,10 +1,14 @@
-from calc.core.session import CalculatorSession
+import argparse
+import sys
+
 from calc.core.errors import CalcError
 
 
 class CommandLoop:
 
     def __init__(self):
+        # imported here so one-shot and batch runs do not load the session
+        from calc.core.session import CalculatorSession
         self.session = CalculatorSession()
         self.running = True
 
@@ -75,8 +79,40 @@ Commands:
         """)
 
 
-def main():
+def parse_args(argv):
+    parser = argparse.ArgumentParser(prog="calc", description="Calculator CLI")
+    parser.add_argument(
+        "expression", nargs="*",
+        help="evaluate EXPRESSION, print the result and exit (1 on an error)"
+    )
+    parser.add_argument(
+        "--file", metavar="PATH",
+        help="evaluate one expression per line of PATH ('-' for stdin) and exit"
+    )
+    parser.add_argument(
+        "--format", choices=["tsv", "jsonl"], default="tsv",
+        help="batch output: expression<TAB>result lines or JSON Lines"
+    )
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
     # entry point
+    args = parse_args(argv)
+
+    if args.expression:
+        from calc.cli.oneshot import run
+        sys.exit(run(" ".join(args.expression)))
+
+    # piped input runs in batch mode too
+    path = args.file
+    if path is None and not sys.stdin.isatty():
+        path = "-"
+
+    if path is not None:
+        from calc.cli.batch import main_batch
+        sys.exit(main_batch(path, args.format))
+
     loop = CommandLoop()
     loop.run()
 
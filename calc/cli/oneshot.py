@@ -0,0 +1,21 @@
+import sys
+
+from calc.core.errors import CalcError
+from calc.core.expression import eval_expr
+from calc.core.formatting import default_formatter
+
+# one-shot evaluation for shell scripts, `python -m calc "2 + 3 * 4"`.
+# only the tokenizer, evaluator and formatter are imported on this path,
+# no session or history, so it starts about as fast as the interpreter
+
+
+def run(expr):
+    # prints the result of expr and returns the exit code: 0, or 1 with
+    # the error on stderr for a CalcError
+    try:
+        result = default_formatter.format(eval_expr(expr))
+    except CalcError as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 1
+    print(result)
+    return 0
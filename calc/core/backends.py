@@ -0,0 +1,247 @@
+from decimal import Context, Decimal, ROUND_HALF_EVEN, localcontext
+from fractions import Fraction
+from math import isqrt
+
+from calc.core.cache import ProgramCache
+from calc.core.errors import CalcMathError, CalcSyntaxError
+from calc.core.expression import call, lookup_variable, to_decimal
+from calc.core.operators import (
+    BINARY, CALLS, UNARY, arithmetic_error, floor_divide, power,
+)
+
+# numeric backends evaluate a postfix program in a number type of their own:
+#   "float"     float64, fastest, approximate
+#   "decimal"   Decimal, optionally with its own precision (significant
+#               digits) instead of the default context's 28
+#   "fraction"  exact rationals, 1 / 3 * 3 is exactly 1
+# a backend is chosen per call (eval_expr(expr, backend=...)), per session
+# (CalculatorSession(backend=...)) or per API request ("backend" and
+# "precision" in the body). without one, evaluation stays on the plain
+# Decimal path, calc.core.expression.eval_postfix.
+#
+# operators and functions are the ones in calc.core.operators, computed
+# with the backend's numbers; a backend only overrides those that would
+# leave its number type, like a fractional power of a Fraction
+
+BACKENDS = ("float", "decimal", "fraction")
+MAX_PRECISION = 10000
+
+# programs whose prepared steps each backend keeps
+PREPARED_CACHE_SIZE = 512
+
+# wide enough that rounding for display happens only in the formatter
+DISPLAY_CONTEXT = Context(prec=34, rounding=ROUND_HALF_EVEN)
+
+# largest exact power the fraction backend computes, in bits of the result
+MAX_EXACT_BITS = 1 << 16
+
+_backends = {}
+
+
+class NumericBackend:
+
+    def __init__(self, name, literal, convert, to_decimal, precision=None, overrides=None,
+                 context=None):
+        self.name = name
+        self.precision = precision
+        self.literal = literal # parsed Decimal literal -> number
+        self.convert = convert # variable value -> number
+        self.to_decimal = to_decimal # number -> Decimal, for formatting
+        # operator symbol or function name -> callable used instead of the
+        # registry's implementation
+        self.overrides = overrides or {}
+        self.context = context # decimal context to evaluate in, None for the current one
+        # prepared steps of recently evaluated programs, keyed by id(program)
+        self.prepared = ProgramCache(PREPARED_CACHE_SIZE)
+
+    def eval_postfix(self, rpn_tokens, variables=None, budget=None):
+        # same program and errors as calc.core.expression.eval_postfix
+        # budget is a calc.core.limits.Budget, checked with every result
+        try:
+            if self.context is None:
+                return self.run(rpn_tokens, variables, budget)
+            with localcontext(self.context):
+                return self.run(rpn_tokens, variables, budget)
+        except ArithmeticError as e:
+            raise arithmetic_error(e)
+
+    def run(self, rpn_tokens, variables, budget):
+        stack = []
+        slots = {}
+        push = stack.append
+        pop = stack.pop
+
+        for kind, value, text in self.steps(rpn_tokens):
+
+            if kind == "NUMBER":
+                push(value)
+                continue
+
+            if kind == "OP":
+                if len(stack) < 2:
+                    raise CalcSyntaxError(
+                        "Operator '" + text + "' missing operand(s)"
+                    )
+                if value is None:
+                    raise CalcSyntaxError("Unknown operator: " + text)
+                b = pop()
+                push(value(pop(), b))
+                if budget is not None:
+                    budget.check(stack[-1])
+                continue
+
+            if kind == "UNARY":
+                if not stack:
+                    raise CalcSyntaxError("Unary '-' missing operand")
+                push(value(pop()))
+                continue
+
+            if kind == "NAME":
+                push(self.convert(lookup_variable(variables, value)))
+                continue
+
+            if kind == "CALL":
+                push(call(value, text[0], text[1], stack))
+                if budget is not None:
+                    budget.check(stack[-1])
+                continue
+
+            if kind == "STORE" and stack:
+                slots[value] = stack[-1]
+                continue
+            if kind == "LOAD" and value in slots:
+                push(slots[value])
+                continue
+            raise CalcSyntaxError("Invalid token in RPN")
+
+        if len(stack) != 1:
+            raise CalcSyntaxError("Malformed expression")
+
+        return stack[0]
+
+    def steps(self, rpn_tokens):
+        # (kind, value, operator text) per token with literals already
+        # converted and operators looked up. programs come from the program
+        # cache, so the same ones are evaluated over and over. iterators,
+        # as from calc.core.streaming, are converted as they are consumed
+        if not isinstance(rpn_tokens, list):
+            return map(self.step, rpn_tokens)
+        key = id(rpn_tokens)
+        entry = self.prepared.get(key)
+        if entry is not None and entry[0] is rpn_tokens:
+            return entry[1]
+        steps = [self.step(token) for token in rpn_tokens]
+        # the entry keeps the program alive, so its id is not reused
+        self.prepared.put(key, (rpn_tokens, steps))
+        return steps
+
+    def step(self, token):
+        if token.kind == "NUMBER":
+            return "NUMBER", self.literal(token.value), None
+        if token.kind == "OP":
+            if token.value in UNARY:
+                return "UNARY", self.lookup(token.value, UNARY), token.value
+            return "OP", self.lookup(token.value, BINARY), token.value
+        if token.kind == "CALL":
+            # the text is (name, argument count)
+            return "CALL", self.lookup(token.value[0], CALLS), token.value
+        return token.kind, token.value, None
+
+    def lookup(self, key, table):
+        apply = self.overrides.get(key)
+        if apply is None:
+            apply = table.get(key)
+        return apply
+
+    def __repr__(self):
+        if self.precision is None:
+            return f"<NumericBackend {self.name}>"
+        return f"<NumericBackend {self.name} precision={self.precision}>"
+
+
+def get_backend(name="decimal", precision=None):
+    # shared backend instance for name (and precision, decimal only).
+    # raises ValueError for an unknown name or a bad precision
+    if not isinstance(name, str) or not (precision is None or isinstance(precision, int)):
+        # possibly unhashable, make_backend says what is wrong
+        return make_backend(name, precision)
+    key = (name, precision)
+    backend = _backends.get(key)
+    if backend is None:
+        backend = _backends[key] = make_backend(name, precision)
+    return backend
+
+
+def resolve_backend(backend):
+    # accepts a backend, a backend name or None (the default Decimal path)
+    if isinstance(backend, str):
+        return get_backend(backend)
+    return backend
+
+
+def make_backend(name, precision):
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown backend: {name!r}, expected one of {', '.join(BACKENDS)}")
+    if precision is not None:
+        if name != "decimal":
+            raise ValueError("'precision' only applies to the decimal backend")
+        if isinstance(precision, bool) or not isinstance(precision, int) \
+                or not 1 <= precision <= MAX_PRECISION:
+            raise ValueError(f"'precision' must be an integer between 1 and {MAX_PRECISION}")
+
+    if name == "float":
+        return NumericBackend(
+            "float", float, lambda value: float(to_decimal(value)),
+            lambda value: Decimal(repr(value)),
+        )
+
+    if name == "fraction":
+        return NumericBackend(
+            "fraction", Fraction, lambda value: Fraction(to_decimal(value)), fraction_to_decimal,
+            overrides={
+                "^": fraction_power,
+                "//": lambda a, b: Fraction(floor_divide(a, b)),
+                "sqrt": fraction_sqrt,
+            },
+        )
+
+    if precision is None:
+        # the default context, same results as the plain Decimal path
+        return NumericBackend("decimal", identity, to_decimal, identity)
+
+    # every operation is rounded to precision by evaluating in this context
+    context = Context(prec=precision, rounding=ROUND_HALF_EVEN)
+    return NumericBackend(
+        "decimal", context.plus, lambda value: context.plus(to_decimal(value)), identity,
+        precision, context=context,
+    )
+
+
+def fraction_to_decimal(value):
+    return DISPLAY_CONTEXT.divide(Decimal(value.numerator), Decimal(value.denominator))
+
+
+def fraction_power(a, b):
+    # exact for whole exponents, otherwise rounded to DISPLAY_CONTEXT
+    if b.denominator == 1:
+        bits = (max(a.numerator.bit_length(), a.denominator.bit_length()) - 1) * abs(b.numerator)
+        if bits > MAX_EXACT_BITS:
+            raise CalcMathError("Result is too large")
+        return power(a, b.numerator)
+    with localcontext(DISPLAY_CONTEXT):
+        return Fraction(power(fraction_to_decimal(a), fraction_to_decimal(b)))
+
+
+def fraction_sqrt(a):
+    # exact for squares of fractions, otherwise rounded to DISPLAY_CONTEXT
+    if a < 0:
+        raise CalcMathError("Square root of a negative number")
+    numerator, denominator = isqrt(a.numerator), isqrt(a.denominator)
+    if numerator * numerator == a.numerator and denominator * denominator == a.denominator:
+        return Fraction(numerator, denominator)
+    with localcontext(DISPLAY_CONTEXT):
+        return Fraction(fraction_to_decimal(a).sqrt())
+
+
+def identity(value):
+    return value
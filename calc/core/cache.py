@@ -0,0 +1,76 @@
+import threading
+from collections import OrderedDict
+
+
+class ProgramCache:
+    # bounded, thread-safe LRU cache of parsed programs keyed by expression text
+
+    def __init__(self, maxsize=512):
+        if maxsize < 0:
+            raise ValueError("maxsize must be >= 0")
+        self.maxsize = maxsize
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key):
+        # return cached program or None, marking it most recently used
+        with self._lock:
+            program = self._entries.get(key)
+            if program is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return program
+
+    def put(self, key, program):
+        with self._lock:
+            if self.maxsize == 0:
+                return
+            self._entries[key] = program
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def resize(self, maxsize):
+        # change capacity, evicting least recently used entries if shrinking
+        if maxsize < 0:
+            raise ValueError("maxsize must be >= 0")
+        with self._lock:
+            self.maxsize = maxsize
+            while len(self._entries) > maxsize:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        # drop all entries and reset counters
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
+            self.evictions = 0
+
+    def info(self):
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "size": len(self._entries),
+                "maxsize": self.maxsize,
+            }
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        return key in self._entries
+
+
+def normalize_expr(expr):
+    # collapse whitespace runs so "2+3", " 2+3 " share an entry but "1 2" != "12"
+    return " ".join(expr.split())
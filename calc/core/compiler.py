@@ -0,0 +1,150 @@
+import operator
+
+from calc.core.errors import CalcSyntaxError, CalcMathError
+from calc.core.expression import parse_expr, lookup_variable
+from calc.core.operators import BINARY, CALLS, UNARY, arithmetic_error, divide
+from calc.core.optimizer import optimize as optimize_program
+
+
+# python source for registry implementations that are plain arithmetic,
+# written inline instead of called. everything else is called through a
+# global of the generated function
+INLINE_SOURCE = {
+    operator.add: "{a} + {b}",
+    operator.sub: "{a} - {b}",
+    operator.mul: "{a} * {b}",
+    divide: "{a} / {b}",
+    operator.neg: "-{a}",
+}
+
+
+def compile_expr(expr, optimize=False):
+    # parses expr (through the program cache) and compiles it to a callable
+    # that returns a Decimal. variables are passed as keyword arguments.
+    # optimize runs calc.core.optimizer on the program first
+    program = parse_expr(expr)
+    if optimize:
+        program, _ = optimize_program(program)
+    return compile_postfix(program)
+
+
+def compile_postfix(rpn_tokens):
+    # turns a postfix program into straight-line python code, one local per
+    # intermediate result. the generated function only does Decimal arithmetic,
+    # holds no state between calls and is safe to share between threads
+    namespace = {
+        "CalcMathError": CalcMathError,
+        "arithmetic_error": arithmetic_error,
+        "lookup_variable": lookup_variable,
+    }
+    functions = {} # operator or function implementation -> global name
+    lines = []
+    stack = [] # names holding each pending operand
+    constants = {} # id of pooled Decimal -> global name
+    names = {} # variable name -> local it is loaded into
+    slots = {} # shared subexpression slot -> local holding its result
+
+    for token in rpn_tokens:
+
+        if token.kind == "NUMBER":
+            name = constants.get(id(token.value))
+            if name is None:
+                name = "c" + str(len(constants))
+                constants[id(token.value)] = name
+                namespace[name] = token.value
+            stack.append(name)
+            continue
+
+        if token.kind == "NAME":
+            local = names.get(token.value)
+            if local is None:
+                local = "v" + str(len(names))
+                names[token.value] = local
+            stack.append(local)
+            continue
+
+        result = "t" + str(len(lines))
+
+        if token.kind == "CALL":
+            name, count = token.value
+            apply = CALLS.get(name)
+            if apply is None:
+                raise CalcSyntaxError("Unknown function: " + name)
+            if len(stack) < count:
+                raise CalcSyntaxError("Function '" + name + "' missing argument(s)")
+            args = stack[len(stack) - count:]
+            del stack[len(stack) - count:]
+            function = global_name(namespace, functions, apply)
+            lines.append(f"    {result} = {function}({', '.join(args)})")
+            stack.append(result)
+            continue
+
+        if token.kind != "OP":
+            # shared subexpressions already live in a local, so slots
+            # cost nothing at run time
+            if token.kind == "STORE" and stack:
+                slots[token.value] = stack[-1]
+                continue
+            if token.kind == "LOAD" and token.value in slots:
+                stack.append(slots[token.value])
+                continue
+            raise CalcSyntaxError("Invalid token in RPN")
+
+        if token.value in UNARY:
+            if not stack:
+                raise CalcSyntaxError("Unary '-' missing operand")
+            a = stack.pop()
+            apply = UNARY[token.value]
+            source = INLINE_SOURCE.get(apply)
+            if source is None:
+                source = global_name(namespace, functions, apply) + "({a})"
+            lines.append(f"    {result} = " + source.format(a=a))
+            stack.append(result)
+            continue
+
+        # binary operators
+        if len(stack) < 2:
+            raise CalcSyntaxError(
+                "Operator '" + token.value + "' missing operand(s)"
+            )
+
+        apply = BINARY.get(token.value)
+        if apply is None:
+            raise CalcSyntaxError("Unknown operator: " + token.value)
+
+        b = stack.pop()
+        a = stack.pop()
+
+        source = INLINE_SOURCE.get(apply)
+        if source is None:
+            source = global_name(namespace, functions, apply) + "({a}, {b})"
+        elif apply is divide:
+            lines.append(f"    if {b} == 0: raise CalcMathError('Division by zero')")
+        lines.append(f"    {result} = " + source.format(a=a, b=b))
+        stack.append(result)
+
+    if len(stack) != 1:
+        raise CalcSyntaxError("Malformed expression")
+
+    # each variable is looked up once, before any arithmetic. plain
+    # arithmetic can raise the decimal context's Overflow, see
+    # calc.core.operators.arithmetic_error
+    header = ["def compiled(**variables):"]
+    for name, local in names.items():
+        header.append(f"    {local} = lookup_variable(variables, {name!r})")
+    lines.append(f"    return {stack[0]}")
+    lines = header + ["    try:"] + ["    " + line for line in lines] + [
+        "    except ArithmeticError as e:",
+        "        raise arithmetic_error(e)",
+    ]
+    exec(compile("\n".join(lines), "<calc>", "exec"), namespace)
+    return namespace["compiled"]
+
+
+def global_name(namespace, functions, apply):
+    # name of the generated function's global holding apply
+    name = functions.get(apply)
+    if name is None:
+        name = functions[apply] = "f" + str(len(functions))
+        namespace[name] = apply
+    return name
@@ -15,3 +15,25 @@ class CalcSyntaxError(CalcError):
 
 class CalcMathError(CalcError):
     code = "MATH_ERROR"
+
+
+class CalcNameError(CalcError):
+    code = "NAME_ERROR"
+
+
+class CalcLimitError(CalcError):
+    # input or evaluation went over a calc.core.limits.Limits budget,
+    # limit names which one ("length", "tokens", "digits", "depth",
+    # "magnitude" or "time")
+    code = "LIMIT_EXCEEDED"
+
+    def __init__(self, message, limit):
+        self.limit = limit
+        super().__init__(message)
+
+
+class CalcTimeoutError(CalcLimitError):
+    code = "TIMEOUT"
+
+    def __init__(self, message):
+        super().__init__(message, "time")
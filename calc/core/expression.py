@@ -1,78 +1,168 @@
+import re
 from decimal import Decimal
 
-from calc.core.errors import CalcSyntaxError, CalcMathError
+from calc.core import metrics
+from calc.core.cache import ProgramCache, normalize_expr
+from calc.core.errors import CalcSyntaxError, CalcNameError
+from calc.core import operators
+from calc.core.operators import (
+    BINARY, BINARY_OPS, CALLS, FUNCTIONS, OPERATORS, PRECEDENCE, UNARY, UNARY_NEG,
+    arithmetic_error,
+)
 
 
 class Token:
-    def __init__(self, kind, value):
-        # kind: "NUMBER", "OP", "LPAREN", "RPAREN"
-        # value: actual text like "12.3", "+", etc
+    __slots__ = ("kind", "value", "pos")
+
+    def __init__(self, kind, value, pos=None):
+        # kind: "NUMBER", "NAME", "FUNC", "OP", "LPAREN", "RPAREN", "COMMA",
+        # and in postfix programs "CALL"
+        # value: parsed Decimal for numbers, (function name, argument count)
+        # for calls, text like "x", "sqrt", "+" or "(" otherwise
+        # pos: offset of the token in the source expression, if known
         self.kind = kind
         self.value = value
+        self.pos = pos
 
-# Defining pemdas operator rules
-BINARY_OPS = {"+", "-", "*", "/"}
-UNARY_NEG = "NEGATIVE"
+# operators, their precedence and the functions come from the registry in
+# calc.core.operators. BINARY_OPS, PRECEDENCE and UNARY_NEG are the
+# registry's, re-exported here
+
+# parse error messages, also used by calc.core.incremental and
+# calc.core.validation so every front end reports the same text
+MISMATCHED_PARENTHESES = "Mismatched parentheses"
+UNEXPECTED_CHARACTER = "Unexpected character: "
+
+# parsed postfix programs, keyed by normalized expression text
+program_cache = ProgramCache()
 
-# Higher number = higher precedence
-PRECEDENCE = {
-    UNARY_NEG: 3, # unary minus is highest
-    "*": 2,
-    "/": 2,
-    "+": 1,
-    "-": 1,
-}
 
 # entry point for actual evaluation 
-def eval_expr(expr):
+def eval_expr(expr, variables=None, backend=None, limits=None):
     # evaluattes a math expression string and returns a Decimal
-    tokens = tokenize(expr)
-    postfix = convert_to_postfix(tokens)
-    return eval_postfix(postfix)
+    # variables maps identifier names used in expr to their values
+    # backend is a calc.core.backends.NumericBackend to evaluate in instead,
+    # the result is then of the backend's number type
+    # limits is a calc.core.limits.Limits, checked before parsing
+    if limits is not None:
+        evaluate = limits.start(expr, backend).eval_postfix
+    elif backend is not None:
+        evaluate = backend.eval_postfix
+    else:
+        evaluate = eval_postfix
+    program = parse_expr(expr)
+    if metrics.enabled:
+        return metrics.time_stage("evaluate", evaluate, program, variables)
+    return evaluate(program, variables)
+
+
+def parse_expr(expr):
+    # returns the postfix program for expr, reusing a cached one if possible
+    key = normalize_expr(expr)
+    program = program_cache.get(key)
+    if program is None:
+        # only successful parses are cached, errors re-raise every time
+        if metrics.enabled:
+            tokens = metrics.time_stage("tokenize", tokenize, expr)
+            program = metrics.time_stage("postfix", convert_to_postfix, tokens)
+        else:
+            program = convert_to_postfix(tokenize(expr))
+        program_cache.put(key, program)
+    return program
+
+
+def set_cache_size(maxsize):
+    program_cache.resize(maxsize)
+
+
+def cache_info():
+    # hit/miss/eviction counters plus current and max size
+    return program_cache.info()
+
+
+def clear_cache():
+    program_cache.clear()
 
 
 # tokenization process
-def tokenize(expr):
-    expr = expr.strip()
-    if expr == "":
-        raise CalcSyntaxError("Empty expression")
 
-    tokens = []
-    i = 0
+# single pass scanner, one group per token kind. anything else that is not
+# whitespace lands in the last group and is reported as an error. rebuilt
+# when operators are registered
+def build_scanner():
+    ops = "|".join(map(re.escape, operators.symbols()))
+    return re.compile(r"\s*(?:([\d.]+)|([^\W\d]\w*)|(" + ops + r")|(\()|(\))|(,)|(\S))")
 
-    while i < len(expr):
-        char = expr[i]
 
-        if char.isspace():
-            i += 1
-            continue
+SCANNER = build_scanner()
 
-        if char in BINARY_OPS:
-            tokens.append(Token("OP", char))
-            i += 1
-            continue
 
-        if char == "(":
-            tokens.append(Token("LPAREN", char))
-            i += 1
-            continue
+def registry_changed():
+    # cached programs may have been parsed with other operators
+    global SCANNER
+    SCANNER = build_scanner()
+    program_cache.clear()
 
-        if char == ")":
-            tokens.append(Token("RPAREN", char))
-            i += 1
-            continue
 
-        if char.isdigit() or char == ".":
-            number_str, i = read_number(expr, i)
-            validate_number(number_str)
-            tokens.append(Token("NUMBER", number_str))
-            continue
+operators.listeners.append(registry_changed)
+
 
-        raise CalcSyntaxError("Unexpected chararacter: " + repr(char))
+def tokenize(expr):
+    if expr.strip() == "":
+        raise CalcSyntaxError("Empty expression")
+    return scan_tokens(expr)
+
+
+def scan_tokens(expr, start=0):
+    # tokens of expr from offset start on. start must not fall inside a token
+    tokens = []
+    append = tokens.append
+    constants = {} # literal text -> Decimal, each literal parsed only once
+
+    for m in SCANNER.finditer(expr, start):
+        number_str, name, op, lparen, rparen, comma, other = m.groups()
+
+        if number_str is not None:
+            if "." in number_str:
+                check_decimal_points(number_str)
+            value = constants.get(number_str)
+            if value is None:
+                value = parse_number(number_str)
+                constants[number_str] = value
+            append(Token("NUMBER", value, m.start(1)))
+        elif name is not None and not name[0].isdigit():
+            # function names are reserved, they cannot name variables
+            append(Token("FUNC" if name in FUNCTIONS else "NAME", name, m.start(2)))
+        elif op is not None:
+            append(Token("OP", op, m.start(3)))
+        elif lparen is not None:
+            append(Token("LPAREN", lparen, m.start(4)))
+        elif rparen is not None:
+            append(Token("RPAREN", rparen, m.start(5)))
+        elif comma is not None:
+            append(Token("COMMA", comma, m.start(6)))
+        else:
+            # names cannot start with digit-like chars such as superscripts
+            start = m.start(7) if other is not None else m.start(2)
+            char = expr[start]
+            if char.isdigit():
+                # report the whole digit run like read_number would
+                while start > 0 and (expr[start - 1].isdigit() or expr[start - 1] == "."):
+                    start -= 1
+                parse_number(read_number(expr, start)[0])
+            raise CalcSyntaxError(UNEXPECTED_CHARACTER + repr(char))
 
     return tokens
 
 
+def check_decimal_points(num_str):
+    # reject a second decimal point, quoting the number up to and including it
+    first = num_str.find(".")
+    second = num_str.find(".", first + 1)
+    if second != -1:
+        raise CalcSyntaxError("Invalid number near: " + num_str[:second + 1])
+
+
 def read_number(expr, start_index):
     # reads a number from a string starting at start_index
 
@@ -95,49 +185,94 @@ def read_number(expr, start_index):
     return expr[start_index:i], i
 
 
-def validate_number(num_str):
+def parse_number(num_str):
+    # converts literal text to the Decimal the evaluator will use
     if num_str == ".":
         raise CalcSyntaxError("Invalid number '.'")
     try:
-        Decimal(num_str) # tries to conver to python recognized decimal
+        return Decimal(num_str) # tries to conver to python recognized decimal
     except Exception:
         raise CalcSyntaxError("Invalid number: " + num_str)
 
 
 def convert_to_postfix(tokens):
     # convert infix tokens into postfix tokens using shunting yard algorithm
+    return list(iter_postfix(tokens))
+
+
+def iter_postfix(tokens):
+    # yields the postfix tokens of an iterable of infix tokens as soon as
+    # they are known, holding only operators still waiting for operands.
+    # errors surface when the offending token is reached
 
-    output = [] # final postfix result
     op_stack = [] # operators waiting on stack for turn
+    # per open '(': None for grouping, else the number of commas seen so
+    # far in that function call's arguments
+    calls = []
     prev_token = None # previous token processed (for unary minus detection)
 
     for token in tokens:
 
-        # numbers go straight to output stack
-        if token.kind == "NUMBER":
-            output.append(token)
+        # a function name is only valid right before its '('
+        if prev_token is not None and prev_token.kind == "FUNC" and token.kind != "LPAREN":
+            raise CalcSyntaxError(f"Function '{prev_token.value}' must be followed by '('")
+
+        # numbers and variables go straight to output stack
+        if token.kind == "NUMBER" or token.kind == "NAME":
+            yield token
             prev_token = token
             continue
 
-        # '(' blocks operator popping
-        if token.kind == "LPAREN":
-            op_stack.append(token) # push '(' onto operator stack
+        # '(' blocks operator popping, functions wait below their '('
+        if token.kind == "LPAREN" or token.kind == "FUNC":
+            if token.kind == "LPAREN":
+                calls.append(0 if prev_token is not None and prev_token.kind == "FUNC" else None)
+            op_stack.append(token)
             prev_token = token
             continue
 
         # ')' pops all operators until matching '('
         if token.kind == "RPAREN":
             while op_stack and op_stack[-1].kind != "LPAREN":
-                output.append(op_stack.pop())
+                yield op_stack.pop()
 
             if not op_stack: # no matching '(' found
-                raise CalcSyntaxError("Mismatchared parentheses")
+                raise CalcSyntaxError(MISMATCHED_PARENTHESES)
 
             op_stack.pop()  # remove '(' from operator stack
+            commas = calls.pop()
+
+            # "(1 +)" and "min(1,)" end without an operand. only a call's
+            # '(' may be closed right away, its argument count is checked below
+            if is_unary_minus(prev_token) and not (
+                prev_token.kind == "LPAREN" and commas is not None
+            ):
+                raise CalcSyntaxError("Missing operand before ')'")
+
+            if commas is not None:
+                # no arguments at all if the '(' came right before
+                function = op_stack.pop()
+                count = 0 if prev_token.kind == "LPAREN" else commas + 1
+                error = FUNCTIONS[function.value].check_args(count)
+                if error is not None:
+                    raise CalcSyntaxError(error)
+                yield Token("CALL", (function.value, count), function.pos)
+            prev_token = token
+            continue
+
+        # ',' ends a function argument
+        if token.kind == "COMMA":
+            while op_stack and op_stack[-1].kind != "LPAREN":
+                yield op_stack.pop()
+            if not calls or calls[-1] is None:
+                raise CalcSyntaxError("Unexpected ','")
+            if is_unary_minus(prev_token):
+                raise CalcSyntaxError("Missing operand before ','")
+            calls[-1] += 1
             prev_token = token
             continue
 
-        # operators defined as: +, -, *, /
+        # operators from the registry, see calc.core.operators
         if token.kind == "OP":
             next_operator = token.value
 
@@ -145,36 +280,39 @@ def convert_to_postfix(tokens):
             if next_operator == "-" and is_unary_minus(prev_token):
                 next_operator = UNARY_NEG
 
-            # pop operators that should run before this one
-            while op_stack and op_stack[-1].kind == "OP":
-                top_op = op_stack[-1].value
+            # pop operators that should run before this one. a prefix
+            # operator pops nothing, its operand has not been read yet
+            op = OPERATORS[next_operator]
+            while op.arity == 2 and op_stack and op_stack[-1].kind == "OP":
+                top_precedence = PRECEDENCE[op_stack[-1].value]
 
                 # if it is higher precedence, run it first
-                if PRECEDENCE[top_op] > PRECEDENCE[next_operator]:
-                    output.append(op_stack.pop())
+                if top_precedence > op.precedence:
+                    yield op_stack.pop()
                     continue
 
-                # if it is same precedence and not unary, pop
-                if PRECEDENCE[top_op] == PRECEDENCE[next_operator] and next_operator != UNARY_NEG:
-                    output.append(op_stack.pop())
+                # if it is same precedence and left associative, pop
+                if top_precedence == op.precedence and not op.right:
+                    yield op_stack.pop()
                     continue
 
                 break
 
-            op_stack.append(Token("OP", next_operator))
+            op_stack.append(Token("OP", next_operator, token.pos))
             prev_token = token
             continue
 
         raise CalcSyntaxError("Unknown token type")
 
+    if prev_token is not None and prev_token.kind == "FUNC":
+        raise CalcSyntaxError(f"Function '{prev_token.value}' must be followed by '('")
+
     # pop remaining operators
     while op_stack:
         top = op_stack.pop()
         if top.kind == "LPAREN":
-            raise CalcSyntaxError("Mismatchared parentheses")
-        output.append(top)
-
-    return output
+            raise CalcSyntaxError(MISMATCHED_PARENTHESES)
+        yield top
 
 
 def is_unary_minus(prev_token):
@@ -185,51 +323,107 @@ def is_unary_minus(prev_token):
         return True
     if prev_token.kind == "LPAREN":
         return True
+    if prev_token.kind == "COMMA":
+        return True
     return False
 
 
 # postfix evaluation
-def eval_postfix(rpn_tokens):
+def eval_postfix(rpn_tokens, variables=None):
+    # operators and functions are looked up in the registry's dispatch
+    # tables. this is the hottest loop in the calculator, so the table and
+    # stack methods are bound to locals and a missing operand is detected
+    # by the failing pop rather than checked before it
     stack = []
+    slots = {} # shared subexpression results, see calc.core.optimizer
+    push = stack.append
+    pop = stack.pop
+    binary = BINARY.get
+    unary = UNARY.get
 
-    for token in rpn_tokens:
-
-        if token.kind == "NUMBER":
-            stack.append(Decimal(token.value))
-            continue
+    try:
+        for token in rpn_tokens:
+            kind = token.kind
+
+            if kind == "NUMBER":
+                push(token.value)
+                continue
+
+            if kind == "OP":
+                apply = binary(token.value)
+                if apply is not None:
+                    try:
+                        b = pop()
+                        a = pop()
+                    except IndexError:
+                        raise CalcSyntaxError(
+                            "Operator '" + token.value + "' missing operand(s)"
+                        )
+                    push(apply(a, b))
+                    continue
 
-        if token.kind != "OP":
+                apply = unary(token.value)
+                if apply is None:
+                    raise CalcSyntaxError("Unknown operator: " + token.value)
+                try:
+                    a = pop()
+                except IndexError:
+                    raise CalcSyntaxError("Unary '-' missing operand")
+                push(apply(a))
+                continue
+
+            if kind == "NAME":
+                push(lookup_variable(variables, token.value))
+                continue
+
+            if kind == "CALL":
+                name, count = token.value
+                push(call(CALLS.get(name), name, count, stack))
+                continue
+
+            if kind == "STORE" and stack:
+                slots[token.value] = stack[-1]
+                continue
+            if kind == "LOAD" and token.value in slots:
+                push(slots[token.value])
+                continue
             raise CalcSyntaxError("Invalid token in RPN")
-
-        if token.value == UNARY_NEG:
-            if not stack:
-                raise CalcSyntaxError("Unary '-' missing operand")
-            stack.append(-stack.pop())
-            continue
-
-        # binary operators
-        if len(stack) < 2:
-            raise CalcSyntaxError(
-                "Operator '" + token.value + "' missing operand(s)"
-            )
-
-        b = stack.pop()
-        a = stack.pop()
-
-        if token.value == "+":
-            stack.append(a + b)
-        elif token.value == "-":
-            stack.append(a - b)
-        elif token.value == "*":
-            stack.append(a * b)
-        elif token.value == "/":
-            if b == 0:
-                raise CalcMathError("Division by zero")
-            stack.append(a / b)
-        else:
-            raise CalcSyntaxError("Unknown operator: " + token.value)
+    except ArithmeticError as e:
+        raise arithmetic_error(e)
 
     if len(stack) != 1:
         raise CalcSyntaxError("Malformed expression")
 
     return stack[0]
+
+
+def call(apply, name, count, stack):
+    # applies a function to the top count values, which it takes off stack
+    if apply is None:
+        raise CalcSyntaxError("Unknown function: " + name)
+    if len(stack) < count:
+        raise CalcSyntaxError("Function '" + name + "' missing argument(s)")
+    if not count:
+        return apply()
+    args = stack[-count:]
+    del stack[-count:]
+    return apply(*args)
+
+
+def lookup_variable(variables, name):
+    # returns the value bound to name as a Decimal
+    if variables is None or name not in variables:
+        raise CalcNameError("Unknown variable: " + name)
+    return to_decimal(variables[name])
+
+
+def to_decimal(value):
+    if isinstance(value, Decimal):
+        return value
+    if isinstance(value, int):
+        return Decimal(value)
+    # floats and strings go through their text so 0.1 stays 0.1
+    try:
+        return Decimal(str(value))
+    except Exception:
+        raise CalcSyntaxError("Invalid number: " + str(value))
@@ -0,0 +1,90 @@
+from decimal import Context, Decimal, ROUND_HALF_EVEN
+
+# formats Decimal results directly, without going through float, so huge
+# values never overflow and no precision is lost before rounding. rounding
+# to a number of places is done by Decimal's own format(), which rounds
+# half-even under the default decimal context
+
+# significant digits a double reliably holds. the "auto" policy decides how
+# many places to show at this precision, so 10 / 3 * 3 = 9.99...9 still
+# counts as a whole number like it did with the old float based formatter
+DISPLAY_DIGITS = 15
+DISPLAY_CONTEXT = Context(prec=DISPLAY_DIGITS, rounding=ROUND_HALF_EVEN)
+
+POLICIES = ("auto", "fixed", "significant", "scientific")
+
+_rounding_contexts = {}
+
+
+def rounding_context(digits):
+    # contexts are immutable in use here, so one per precision is shared
+    context = _rounding_contexts.get(digits)
+    if context is None:
+        context = _rounding_contexts[digits] = Context(prec=digits, rounding=ROUND_HALF_EVEN)
+    return context
+
+
+class ResultFormatter:
+    # policy:
+    #   "auto"        whole numbers as is, otherwise 1 or 2 decimal places
+    #   "fixed"       always `places` decimal places
+    #   "significant" round to `digits` significant digits
+    #   "scientific"  always d.dddE+n with `digits` significant digits
+    # sci_exponent switches any policy to scientific for values whose
+    # decimal exponent is at least that far from zero (huge or tiny values)
+
+    def __init__(self, policy="auto", places=2, digits=6, sci_exponent=None):
+        if policy not in POLICIES:
+            raise ValueError(f"Unknown format policy: {policy!r}")
+        if places < 0 or digits < 1:
+            raise ValueError("places must be >= 0 and digits >= 1")
+        self.policy = policy
+        self.places = places
+        self.digits = digits
+        self.sci_exponent = sci_exponent
+        self.fixed_spec = f".{places}f"
+        self.sci_spec = f".{digits - 1}E"
+        self.context = rounding_context(digits)
+
+    def format(self, value):
+        if not value.is_finite():
+            return str(value)
+        if not value:
+            # includes -0, never shown with a sign
+            return self.format_zero()
+        if self.sci_exponent is not None and abs(value.adjusted()) >= self.sci_exponent:
+            return format(self.context.plus(value), self.sci_spec)
+
+        policy = self.policy
+        if policy == "auto":
+            return self.format_auto(value)
+        if policy == "fixed":
+            return format(value, self.fixed_spec)
+        if policy == "significant":
+            return format(self.context.plus(value), "f")
+        return format(self.context.plus(value), self.sci_spec)
+
+    def format_auto(self, value):
+        # smallest of 0, 1 or 2 decimal places that shows the value. the
+        # decision is made on the value rounded to DISPLAY_DIGITS, but the
+        # value itself is what gets formatted so whole numbers stay exact
+        if value == value.to_integral_value():
+            return format(value, ".0f")
+        approx = DISPLAY_CONTEXT.plus(value)
+        if approx == approx.to_integral_value():
+            return format(value, ".0f")
+        tenths = approx.scaleb(1)
+        if tenths == tenths.to_integral_value():
+            return format(value, ".1f")
+        return format(value, ".2f")
+
+    def format_zero(self):
+        if self.policy == "fixed":
+            return format(Decimal(0), self.fixed_spec)
+        if self.policy == "scientific":
+            mantissa = "0." + "0" * (self.digits - 1) if self.digits > 1 else "0"
+            return mantissa + "E+0"
+        return "0"
+
+
+default_formatter = ResultFormatter()
@@ -0,0 +1,449 @@
+import sqlite3
+import sys
+import threading
+import traceback
+from array import array
+from bisect import bisect_right
+from collections import deque
+
+from calc.core.formatting import default_formatter
+
+
+# every history backend provides:
+#   append(entry)       entry is a dict with expression, result and timestamp,
+#                       optionally the raw "value" and the evaluation
+#                       "duration" in seconds; the backend adds a
+#                       monotonically increasing "id" (HistoryLog once the
+#                       entry is written, reads write pending entries first)
+#   recent(limit)       last `limit` entries, oldest first
+#   page(cursor, limit, since, until)
+#                       entries with id > cursor and since <= timestamp < until,
+#                       oldest first, plus the cursor for the next page or None
+#   search(query, limit, prefix)
+#                       last `limit` entries whose expression contains query
+#                       (or starts with it), ignoring whitespace, oldest first
+#   clear(), memory_usage(), __len__()
+#   shared              True if other processes change it as well, so the
+#                       session's version does not track every change. such
+#                       a backend also provides version(), bumped by every
+#                       change in any process
+
+# search_key() of the expression column, for the whitespace SQL sees
+SQL_SEARCH_KEY = (
+    "replace(replace(replace(replace(expression,"
+    " ' ', ''), char(9), ''), char(10), ''), char(13), '')"
+)
+
+# entries per HistoryBlock, also the most MemoryHistory keeps past maxlen
+BLOCK_SIZE = 1024
+
+
+class MemoryHistory:
+    # default backend, a ring of the last maxlen entries in memory. entries
+    # live in fixed-size blocks of parallel arrays instead of one dict each,
+    # results are kept as raw values and only formatted when read. ids are
+    # consecutive, so an id maps straight to a position: appending is O(1)
+    # and a page of k entries costs O(k) wherever it starts, plus an
+    # O(log n) bisect for a since/until time range
+
+    shared = False
+
+    def __init__(self, maxlen=10, formatter=None):
+        if maxlen < 1:
+            raise ValueError("maxlen must be >= 1")
+        self.maxlen = maxlen
+        self.formatter = formatter or default_formatter
+        self.block_size = min(maxlen, BLOCK_SIZE)
+        self.blocks = deque()
+        self.skip = 0 # evicted entries at the start of blocks[0]
+        self.size = 0
+        self.next_id = 1
+
+    def append(self, entry):
+        entry["id"] = self.next_id
+        self.next_id += 1
+        if not self.blocks or len(self.blocks[-1]) == self.block_size:
+            self.blocks.append(HistoryBlock())
+        self.blocks[-1].append(entry)
+        if self.size < self.maxlen:
+            self.size += 1
+            return
+        # the oldest entry drops out
+        self.blocks[0].evict(self.skip)
+        self.skip += 1
+        if self.skip == self.block_size:
+            self.blocks.popleft()
+            self.skip = 0
+
+    def recent(self, limit=None):
+        if limit is None or limit >= self.size:
+            return self.entries(0, self.size)
+        return self.entries(self.size - limit, self.size)
+
+    def page(self, cursor=None, limit=50, since=None, until=None):
+        start = 0 if cursor is None else max(0, cursor + 1 - self.first_id())
+        stop = self.size
+        # entries are appended in time order, so a time range is a range
+        # of positions as well
+        if since is not None:
+            start = max(start, self.position(since))
+        if until is not None:
+            stop = self.position(until)
+        # fetch one extra entry to know whether another page exists
+        return page_result(self.entries(start, min(start + limit + 1, stop)), limit)
+
+    def search(self, query, limit=50, prefix=False):
+        # scans the blocks newest first with str.find over each block's
+        # joined search keys, see HistoryBlock.search_text
+        key = search_key(query)
+        needle = "\n" + key if prefix else key
+        found = [] # entry positions, newest first
+        for number in range(len(self.blocks) - 1, -1, -1):
+            first = self.skip if number == 0 else 0
+            lines = self.blocks[number].search(needle, first)
+            base = number * self.block_size - self.skip
+            for line in reversed(lines):
+                found.append(base + line)
+                if len(found) >= limit:
+                    break
+            if len(found) >= limit:
+                break
+        return [self.entry(index) for index in reversed(found)]
+
+    def entries(self, start, stop):
+        return [self.entry(index) for index in range(start, stop)]
+
+    def entry(self, index):
+        block, offset = self.locate(index)
+        value = block.values[offset]
+        return {
+            "id": self.first_id() + index,
+            "timestamp": block.timestamps[offset],
+            "expression": block.expressions[offset],
+            "result": value if isinstance(value, str) else self.formatter.format(value),
+            "duration": block.durations[offset],
+        }
+
+    def locate(self, index):
+        # (block, offset in block) of the entry at position index
+        block, offset = divmod(self.skip + index, self.block_size)
+        return self.blocks[block], offset
+
+    def position(self, timestamp):
+        # position of the first entry at or after timestamp, a bisect over
+        # the blocks' timestamps
+        low, high = 0, self.size
+        while low < high:
+            middle = (low + high) // 2
+            block, offset = self.locate(middle)
+            if block.timestamps[offset] < timestamp:
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+    def first_id(self):
+        return self.next_id - self.size
+
+    def clear(self):
+        self.blocks.clear()
+        self.skip = 0
+        self.size = 0
+
+    def memory_usage(self):
+        total = sys.getsizeof(self) + sys.getsizeof(self.blocks)
+        for block in self.blocks:
+            total += block.memory_usage()
+        return total
+
+    def __len__(self):
+        return self.size
+
+
+class HistoryBlock:
+    # up to BLOCK_SIZE entries of a MemoryHistory as parallel arrays
+
+    __slots__ = ("expressions", "values", "timestamps", "durations", "text", "starts")
+
+    def __init__(self):
+        self.expressions = []
+        self.values = [] # raw results, formatted on read
+        self.timestamps = array("d")
+        self.durations = array("d")
+        # search index, built on the first search after the block changed
+        self.text = None
+        self.starts = None
+
+    def append(self, entry):
+        self.expressions.append(entry["expression"])
+        self.values.append(entry.get("value", entry["result"]))
+        self.timestamps.append(entry["timestamp"])
+        self.durations.append(entry.get("duration", 0.0))
+        self.text = None
+
+    def evict(self, offset):
+        # drops the references an evicted entry holds
+        self.expressions[offset] = ""
+        self.values[offset] = None
+        self.text = None
+
+    def search(self, needle, first=0):
+        # offsets of entries from first on whose search key contains needle.
+        # keys hold no whitespace, so a match never spans two entries and
+        # "\n" + key only matches at the start of one
+        text, starts = self.search_text()
+        lines = []
+        position = text.find(needle, starts[first] - 1)
+        while position != -1:
+            line = bisect_right(starts, position + 1) - 1
+            lines.append(line)
+            if line + 1 == len(starts):
+                break
+            position = text.find(needle, starts[line + 1] - 1)
+        return lines
+
+    def search_text(self):
+        # every search key in one string, each after a newline, and where
+        # each one starts
+        if self.text is None:
+            keys = [search_key(expr) for expr in self.expressions]
+            starts = array("q")
+            position = 1
+            for key in keys:
+                starts.append(position)
+                position += len(key) + 1
+            self.text = "\n" + "\n".join(keys)
+            self.starts = starts
+        return self.text, self.starts
+
+    def memory_usage(self):
+        total = sys.getsizeof(self)
+        for items in (self.expressions, self.values, self.timestamps, self.durations):
+            total += sys.getsizeof(items)
+        total += sum(sys.getsizeof(e) for e in self.expressions)
+        total += sum(sys.getsizeof(v) for v in self.values)
+        if self.text is not None:
+            total += sys.getsizeof(self.text) + sys.getsizeof(self.starts)
+        return total
+
+    def __len__(self):
+        return len(self.expressions)
+
+
+class HistoryLog:
+    # append-only SQLite log shared by many clients. appends only touch an
+    # in-memory buffer; a background writer commits it in batches, so
+    # evaluation never waits on disk. reads flush the buffer first
+
+    def __init__(self, path, batch_size=256, flush_interval=0.5):
+        self.path = path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS history ("
+            " id INTEGER PRIMARY KEY,"
+            " client TEXT NOT NULL,"
+            " timestamp REAL NOT NULL,"
+            " expression TEXT NOT NULL,"
+            " result TEXT NOT NULL,"
+            " duration REAL NOT NULL DEFAULT 0)"
+        )
+        columns = [row[1] for row in self.db.execute("PRAGMA table_info(history)")]
+        if "duration" not in columns:
+            # a log written before durations were stored
+            self.db.execute("ALTER TABLE history ADD COLUMN duration REAL NOT NULL DEFAULT 0")
+        self.db.execute(
+            "CREATE INDEX IF NOT EXISTS history_client_id ON history (client, id)"
+        )
+        self.db.execute(
+            "CREATE INDEX IF NOT EXISTS history_client_time"
+            " ON history (client, timestamp)"
+        )
+        self.db.commit()
+
+        self.db_lock = threading.Lock()
+        self.pending_lock = threading.Lock()
+        self.pending = []
+        self.wakeup = threading.Event()
+        self.closed = False
+        self.writer = threading.Thread(target=self._write_behind, daemon=True)
+        self.writer.start()
+
+    def append(self, client, entry):
+        with self.pending_lock:
+            self.pending.append((client, entry))
+            full = len(self.pending) >= self.batch_size
+        if full:
+            self.wakeup.set()
+
+    def flush(self):
+        # writes everything buffered so far in one transaction. rows leave
+        # the buffer only once it commits, if it fails they are written by
+        # the next flush. appends only add to the end of the buffer and
+        # clear() waits for db_lock, so the first len(rows) are still these
+        with self.db_lock:
+            with self.pending_lock:
+                rows = self.pending[:]
+            if rows:
+                with self.db:
+                    # several processes may append to one file (that is what
+                    # WAL mode is for), so ids are handed out inside the
+                    # write transaction, not counted up in this process
+                    self.db.execute("BEGIN IMMEDIATE")
+                    last_id = self.db.execute("SELECT MAX(id) FROM history").fetchone()[0] or 0
+                    self.db.executemany(
+                        "INSERT INTO history (id, client, timestamp, expression, result, duration)"
+                        " VALUES (?, ?, ?, ?, ?, ?)", [
+                            (last_id + number, client, entry["timestamp"], entry["expression"],
+                             entry["result"], entry.get("duration", 0.0))
+                            for number, (client, entry) in enumerate(rows, 1)
+                        ]
+                    )
+                for number, (_, entry) in enumerate(rows, 1):
+                    entry["id"] = last_id + number
+                with self.pending_lock:
+                    del self.pending[:len(rows)]
+
+    def recent(self, client, limit):
+        self.flush()
+        with self.db_lock:
+            rows = self.db.execute(
+                "SELECT id, timestamp, expression, result, duration FROM history"
+                " WHERE client = ? ORDER BY id DESC LIMIT ?", (client, limit)
+            ).fetchall()
+        return [row_entry(row) for row in reversed(rows)]
+
+    def page(self, client, cursor=None, limit=50, since=None, until=None):
+        query = "SELECT id, timestamp, expression, result, duration FROM history WHERE client = ?"
+        params = [client]
+        if cursor is not None:
+            query += " AND id > ?"
+            params.append(cursor)
+        if since is not None:
+            query += " AND timestamp >= ?"
+            params.append(since)
+        if until is not None:
+            query += " AND timestamp < ?"
+            params.append(until)
+        query += " ORDER BY id LIMIT ?"
+        params.append(limit + 1)
+        self.flush()
+        with self.db_lock:
+            rows = self.db.execute(query, params).fetchall()
+        return page_result([row_entry(row) for row in rows], limit)
+
+    def search(self, client, query, limit=50, prefix=False):
+        key = search_key(query)
+        if prefix:
+            match = "substr(" + SQL_SEARCH_KEY + ", 1, length(?)) = ?"
+            params = [client, key, key, limit]
+        else:
+            match = "instr(" + SQL_SEARCH_KEY + ", ?) > 0"
+            params = [client, key, limit]
+        self.flush()
+        with self.db_lock:
+            rows = self.db.execute(
+                "SELECT id, timestamp, expression, result, duration FROM history"
+                " WHERE client = ? AND " + match + " ORDER BY id DESC LIMIT ?", params
+            ).fetchall()
+        return [row_entry(row) for row in reversed(rows)]
+
+    def count(self, client):
+        self.flush()
+        with self.db_lock:
+            return self.db.execute(
+                "SELECT COUNT(*) FROM history WHERE client = ?", (client,)
+            ).fetchone()[0]
+
+    def clear(self, client):
+        with self.db_lock:
+            with self.pending_lock:
+                self.pending = [row for row in self.pending if row[0] != client]
+            with self.db:
+                self.db.execute("DELETE FROM history WHERE client = ?", (client,))
+
+    def pending_bytes(self, client):
+        with self.pending_lock:
+            return sum(
+                sys.getsizeof(entry) + sum(sys.getsizeof(v) for v in entry.values())
+                for owner, entry in self.pending if owner == client
+            )
+
+    def close(self):
+        if self.closed:
+            return
+        self.closed = True
+        self.wakeup.set()
+        self.writer.join()
+        self.flush()
+        self.db.close()
+
+    def _write_behind(self):
+        # a failed flush (a locked or full disk) keeps its rows and is
+        # retried, it must not end the thread
+        while not self.closed:
+            self.wakeup.wait(self.flush_interval)
+            self.wakeup.clear()
+            try:
+                self.flush()
+            except sqlite3.Error:
+                traceback.print_exc()
+
+
+class SQLiteHistory:
+    # durable backend: one client's view of a shared HistoryLog
+
+    shared = False # the log is shared by clients, each has its own entries
+
+    def __init__(self, log, client="default", recent_limit=10):
+        self.log = log
+        self.client = client
+        self.recent_limit = recent_limit
+
+    def append(self, entry):
+        self.log.append(self.client, entry)
+
+    def recent(self, limit=None):
+        return self.log.recent(self.client, limit or self.recent_limit)
+
+    def page(self, cursor=None, limit=50, since=None, until=None):
+        return self.log.page(self.client, cursor, limit, since, until)
+
+    def search(self, query, limit=50, prefix=False):
+        return self.log.search(self.client, query, limit, prefix)
+
+    def clear(self):
+        self.log.clear(self.client)
+
+    def memory_usage(self):
+        # only entries still waiting for the writer live in memory
+        return sys.getsizeof(self) + self.log.pending_bytes(self.client)
+
+    def __len__(self):
+        return self.log.count(self.client)
+
+
+def row_entry(row):
+    entry_id, timestamp, expression, result, duration = row
+    return {
+        "id": entry_id,
+        "timestamp": timestamp,
+        "expression": expression,
+        "result": result,
+        "duration": duration,
+    }
+
+
+def page_result(entries, limit):
+    # entries holds up to limit + 1 items, the extra one means there is more
+    if len(entries) > limit:
+        entries = entries[:limit]
+        return entries, entries[-1]["id"] if entries else None
+    return entries, None
+
+
+def search_key(text):
+    # history search ignores whitespace, "1+2" finds "1 + 2"
+    return "".join(text.split())
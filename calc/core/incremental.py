@@ -0,0 +1,256 @@
+from bisect import bisect_left
+from operator import attrgetter
+
+from calc.core.errors import CalcError, CalcSyntaxError
+from calc.core.expression import (
+    MISMATCHED_PARENTHESES, Token, is_unary_minus, lookup_variable, scan_tokens,
+)
+from calc.core.operators import (
+    BINARY, CALLS, FUNCTIONS, OPERATORS, PRECEDENCE, UNARY, UNARY_NEG,
+    arithmetic_error,
+)
+
+# evaluates an expression that is edited a little at a time, like the GUI
+# display while typing. shunting yard and evaluation run as one pass, and
+# the parser state after every token is kept, so an edit only re-scans and
+# re-parses from the first token it touches. the stacks are immutable
+# linked lists of (head, rest) pairs, which makes keeping a state per token
+# cost O(1) instead of a copy of both stacks.
+#
+# results and errors match eval_expr. errors found while evaluating (like
+# division by zero) are held back until the whole expression has parsed,
+# because eval_expr reports parse errors first
+
+token_pos = attrgetter("pos")
+
+
+class ParseState:
+    __slots__ = ("values", "ops", "prev", "error")
+
+    def __init__(self, values=None, ops=None, prev=None, error=None):
+        self.values = values # linked list of Decimals, top first
+        # linked list of waiting OP and LPAREN tokens. the LPAREN of a
+        # function call holds (name, commas seen so far) instead of "("
+        self.ops = ops
+        self.prev = prev # previous token, for unary minus detection
+        self.error = error # first evaluation error, raised at the end
+
+
+class IncrementalEvaluator:
+
+    def __init__(self, variables=None):
+        self.variables = variables
+        self.text = ""
+        self.tokens = []
+        # states[i] is the state after tokens[:i]
+        self.states = [ParseState()]
+
+    def evaluate(self, text):
+        # returns the Decimal value of text, raising CalcError like eval_expr
+        if text.strip() == "":
+            self.reset()
+            raise CalcSyntaxError("Empty expression")
+
+        keep = self.reusable_tokens(text)
+        # scanning resumes where the first dropped token started
+        start = self.tokens[keep].pos if keep else 0
+        del self.tokens[keep:]
+        del self.states[keep + 1:]
+        self.text = text
+        self.tokens.extend(scan_tokens(text, start))
+
+        state = self.states[-1]
+        for token in self.tokens[len(self.states) - 1:]:
+            state = self.step(state, token)
+            self.states.append(state)
+        return self.finish(state)
+
+    def preview(self, text):
+        # value of text, or None if it is incomplete or invalid
+        try:
+            return self.evaluate(text)
+        except CalcError:
+            return None
+
+    def reset(self):
+        self.text = ""
+        self.tokens = []
+        self.states = [ParseState()]
+
+    def reusable_tokens(self, text):
+        # how many leading tokens are unaffected by the edit. a token is kept
+        # only if the next token starts before the first changed character,
+        # so the token and the character after it are unchanged. typing
+        # another digit re-scans the number it extends
+        changed = common_prefix(self.text, text)
+        # the states list may be shorter than tokens after an error
+        count = min(len(self.tokens) - 1, len(self.states) - 1)
+        if count <= 0:
+            return 0
+        return bisect_left(self.tokens, changed, 1, count + 1, key=token_pos) - 1
+
+    def step(self, state, token):
+        values, ops, prev, error = state.values, state.ops, state.prev, state.error
+
+        if prev is not None and prev.kind == "FUNC" and token.kind != "LPAREN":
+            raise CalcSyntaxError(f"Function '{prev.value}' must be followed by '('")
+
+        if token.kind == "NUMBER":
+            return ParseState((token.value, values), ops, token, error)
+
+        if token.kind == "NAME":
+            if error is None:
+                try:
+                    return ParseState(
+                        (lookup_variable(self.variables, token.value), values),
+                        ops, token, error,
+                    )
+                except CalcError as e:
+                    error = e
+            return ParseState(values, ops, token, error)
+
+        if token.kind == "FUNC":
+            return ParseState(values, ops, token, error)
+
+        if token.kind == "LPAREN":
+            if prev is not None and prev.kind == "FUNC":
+                token = Token("LPAREN", (prev.value, 0), token.pos)
+            return ParseState(values, (token, ops), token, error)
+
+        if token.kind == "RPAREN":
+            while ops is not None and ops[0].kind != "LPAREN":
+                values, error = apply(ops[0].value, values, error)
+                ops = ops[1]
+            if ops is None:
+                raise CalcSyntaxError(MISMATCHED_PARENTHESES)
+            call_paren = ops[0].value != "("
+            if is_unary_minus(prev) and not (prev.kind == "LPAREN" and call_paren):
+                raise CalcSyntaxError("Missing operand before ')'")
+            if call_paren:
+                # no arguments at all if the '(' came right before
+                name, commas = ops[0].value
+                count = 0 if prev.kind == "LPAREN" else commas + 1
+                message = FUNCTIONS[name].check_args(count)
+                if message is not None:
+                    raise CalcSyntaxError(message)
+                values, error = call(name, count, values, error)
+            return ParseState(values, ops[1], token, error)
+
+        if token.kind == "COMMA":
+            while ops is not None and ops[0].kind != "LPAREN":
+                values, error = apply(ops[0].value, values, error)
+                ops = ops[1]
+            if ops is None or ops[0].value == "(":
+                raise CalcSyntaxError("Unexpected ','")
+            if is_unary_minus(prev):
+                raise CalcSyntaxError("Missing operand before ','")
+            name, commas = ops[0].value
+            ops = (Token("LPAREN", (name, commas + 1), ops[0].pos), ops[1])
+            return ParseState(values, ops, token, error)
+
+        if token.kind == "OP":
+            next_operator = token.value
+            if next_operator == "-" and is_unary_minus(prev):
+                next_operator = UNARY_NEG
+
+            # a prefix operator applies nothing, its operand is still to come
+            op = OPERATORS[next_operator]
+            while op.arity == 2 and ops is not None and ops[0].kind == "OP":
+                top_precedence = PRECEDENCE[ops[0].value]
+                if top_precedence > op.precedence or (
+                    top_precedence == op.precedence and not op.right
+                ):
+                    values, error = apply(ops[0].value, values, error)
+                    ops = ops[1]
+                    continue
+                break
+
+            if next_operator != token.value:
+                token = Token("OP", next_operator, token.pos)
+            return ParseState(values, (token, ops), token, error)
+
+        raise CalcSyntaxError("Unknown token type")
+
+    def finish(self, state):
+        values, ops, error = state.values, state.ops, state.error
+        if state.prev is not None and state.prev.kind == "FUNC":
+            raise CalcSyntaxError(f"Function '{state.prev.value}' must be followed by '('")
+        while ops is not None:
+            if ops[0].kind == "LPAREN":
+                raise CalcSyntaxError(MISMATCHED_PARENTHESES)
+            values, error = apply(ops[0].value, values, error)
+            ops = ops[1]
+
+        if error is not None:
+            raise error
+        if values is None or values[1] is not None:
+            raise CalcSyntaxError("Malformed expression")
+        return values[0]
+
+
+def common_prefix(a, b):
+    # length of the common prefix, compared in slices rather than per
+    # character so long texts stay fast
+    if b.startswith(a):
+        return len(a)
+    lo, hi = 0, min(len(a), len(b))
+    while lo < hi:
+        mid = (lo + hi + 1) // 2
+        if a[:mid] == b[:mid]:
+            lo = mid
+        else:
+            hi = mid - 1
+    return lo
+
+
+def apply(op, values, error):
+    # applies op to the value stack, returns (values, error). once an error
+    # is recorded the values no longer matter and are left alone
+    if error is not None:
+        return values, error
+
+    if op in UNARY:
+        if values is None:
+            return values, CalcSyntaxError("Unary '-' missing operand")
+        try:
+            return (UNARY[op](values[0]), values[1]), None
+        except CalcError as e:
+            return values, e
+        except ArithmeticError as e:
+            return values, arithmetic_error(e)
+
+    if values is None or values[1] is None:
+        return values, CalcSyntaxError("Operator '" + op + "' missing operand(s)")
+
+    function = BINARY.get(op)
+    if function is None:
+        return values, CalcSyntaxError("Unknown operator: " + op)
+
+    b = values[0]
+    a, rest = values[1]
+    try:
+        return (function(a, b), rest), None
+    except CalcError as e:
+        return values, e
+    except ArithmeticError as e:
+        return values, arithmetic_error(e)
+
+
+def call(name, count, values, error):
+    # applies function name to the top count values, like apply
+    if error is not None:
+        return values, error
+    args = []
+    rest = values
+    while len(args) < count:
+        if rest is None:
+            return values, CalcSyntaxError("Function '" + name + "' missing argument(s)")
+        args.append(rest[0])
+        rest = rest[1]
+    args.reverse()
+    try:
+        return (CALLS[name](*args), rest), None
+    except CalcError as e:
+        return values, e
+    except ArithmeticError as e:
+        return values, arithmetic_error(e)
@@ -0,0 +1,97 @@
+import re
+import time
+from decimal import Decimal
+from itertools import accumulate
+
+from calc.core.backends import get_backend
+from calc.core.errors import CalcLimitError, CalcTimeoutError
+
+# complexity budgets for untrusted input. eval_expr(expr, limits=Limits())
+# first checks the text itself, in linear time and before tokenizing:
+#   max_length    characters in the expression
+#   max_tokens    numbers, names, operators and parentheses
+#   max_digits    digits in any one number literal
+#   max_depth     parentheses nesting
+# then evaluates with a budget that rejects any value, intermediate or
+# final, of magnitude 10 ** max_exponent or more, and gives up once
+# timeout seconds have passed since the checks began. the deadline is
+# cooperative, it is checked after every operator, so a single operation
+# is never interrupted. any limit can be None to turn it off
+#
+# violations raise CalcLimitError (or CalcTimeoutError for the deadline)
+# with .limit naming the one that was exceeded
+
+NUMBER_RE = re.compile(r"[\d.]+")
+TOKEN_RE = re.compile(r"[\d.]+|[^\W\d]\w*|\S")
+PAREN_RE = re.compile(r"[()]")
+PAREN_STEP = {"(": 1, ")": -1}
+
+
+class Limits:
+
+    def __init__(self, max_length=10000, max_tokens=5000, max_digits=1000, max_depth=100,
+                 max_exponent=1000, timeout=1.0):
+        self.max_length = max_length
+        self.max_tokens = max_tokens
+        self.max_digits = max_digits
+        self.max_depth = max_depth
+        self.max_exponent = max_exponent
+        self.timeout = timeout
+        self.max_magnitude = None if max_exponent is None else Decimal(f"1e{max_exponent}")
+
+    def start(self, expr, backend=None):
+        # checks expr and returns the Budget to evaluate it with
+        deadline = None if self.timeout is None else time.monotonic() + self.timeout
+        if isinstance(expr, str):
+            self.check_input(expr)
+        return Budget(self, deadline, backend)
+
+    def check_input(self, expr):
+        # the length check comes first and bounds the cost of the others
+        if self.max_length is not None and len(expr) > self.max_length:
+            raise CalcLimitError(
+                f"Expression is longer than {self.max_length} characters", "length"
+            )
+
+        if self.max_tokens is not None and len(TOKEN_RE.findall(expr)) > self.max_tokens:
+            raise CalcLimitError(f"Expression has more than {self.max_tokens} tokens", "tokens")
+
+        if self.max_digits is not None:
+            for literal in NUMBER_RE.findall(expr):
+                if len(literal) - literal.count(".") > self.max_digits:
+                    raise CalcLimitError(
+                        f"Number has more than {self.max_digits} digits", "digits"
+                    )
+
+        # cannot nest deeper than the number of "(", usually no scan needed
+        if self.max_depth is not None and expr.count("(") > self.max_depth:
+            steps = map(PAREN_STEP.__getitem__, PAREN_RE.findall(expr))
+            if max(accumulate(steps)) > self.max_depth:
+                raise CalcLimitError(
+                    f"Parentheses are nested more than {self.max_depth} deep", "depth"
+                )
+
+
+class Budget:
+    # one evaluation's share of a Limits
+
+    def __init__(self, limits, deadline, backend=None):
+        self.max_magnitude = limits.max_magnitude
+        self.max_exponent = limits.max_exponent
+        self.timeout = limits.timeout
+        self.deadline = deadline
+        # without a backend, plain Decimal in the default context, which
+        # is what calc.core.expression.eval_postfix computes
+        self.backend = backend or get_backend("decimal")
+
+    def eval_postfix(self, rpn_tokens, variables=None):
+        return self.backend.eval_postfix(rpn_tokens, variables, self)
+
+    def check(self, value):
+        # called by the evaluation loop with every value it computes
+        if self.max_magnitude is not None and abs(value) >= self.max_magnitude:
+            raise CalcLimitError(
+                f"Result magnitude exceeds 1e{self.max_exponent}", "magnitude"
+            )
+        if self.deadline is not None and time.monotonic() > self.deadline:
+            raise CalcTimeoutError(f"Evaluation took longer than {self.timeout} seconds")
@@ -0,0 +1,153 @@
+import threading
+from bisect import bisect_left
+from time import perf_counter
+
+# instrumentation is off by default; call sites check this flag before
+# taking any timestamps so the disabled cost is a single attribute lookup
+enabled = False
+
+# latency bucket upper bounds in seconds
+DEFAULT_BUCKETS = (
+    0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.0005,
+    0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0,
+)
+
+
+class Counter:
+
+    def __init__(self, name, help_text, labelnames=()):
+        self.name = name
+        self.help = help_text
+        self.labelnames = labelnames
+        self.values = {} # label values tuple -> count
+        self.lock = threading.Lock()
+
+    def inc(self, *labelvalues, amount=1):
+        with self.lock:
+            self.values[labelvalues] = self.values.get(labelvalues, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self.lock:
+            items = sorted(self.values.items())
+        for labelvalues, value in items:
+            lines.append(f"{self.name}{format_labels(self.labelnames, labelvalues)} {value}")
+        return lines
+
+    def clear(self):
+        with self.lock:
+            self.values.clear()
+
+
+class Histogram:
+
+    def __init__(self, name, help_text, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.labelnames = labelnames
+        self.buckets = tuple(buckets)
+        # label values tuple -> [per-bucket counts (last one is +Inf), sum]
+        self.series = {}
+        self.lock = threading.Lock()
+
+    def observe(self, value, *labelvalues):
+        index = bisect_left(self.buckets, value)
+        with self.lock:
+            series = self.series.get(labelvalues)
+            if series is None:
+                series = self.series[labelvalues] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][index] += 1
+            series[1] += value
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self.lock:
+            items = sorted((k, (list(v[0]), v[1])) for k, v in self.series.items())
+        bounds = [repr(b) for b in self.buckets] + ["+Inf"]
+        for labelvalues, (counts, total) in items:
+            cumulative = 0
+            for bound, count in zip(bounds, counts):
+                cumulative += count
+                labels = format_labels(self.labelnames + ("le",), labelvalues + (bound,))
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = format_labels(self.labelnames, labelvalues)
+            lines.append(f"{self.name}_sum{labels} {total!r}")
+            lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+    def clear(self):
+        with self.lock:
+            self.series.clear()
+
+
+class Registry:
+
+    def __init__(self):
+        self.metrics = []
+
+    def counter(self, name, help_text, labelnames=()):
+        metric = Counter(name, help_text, labelnames)
+        self.metrics.append(metric)
+        return metric
+
+    def histogram(self, name, help_text, labelnames=(), buckets=DEFAULT_BUCKETS):
+        metric = Histogram(name, help_text, labelnames, buckets)
+        self.metrics.append(metric)
+        return metric
+
+    def render(self):
+        # Prometheus text exposition format
+        lines = []
+        for metric in self.metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+    def clear(self):
+        for metric in self.metrics:
+            metric.clear()
+
+
+registry = Registry()
+
+stage_seconds = registry.histogram(
+    "calc_stage_seconds", "Time spent in each evaluation pipeline stage", ("stage",)
+)
+errors_total = registry.counter(
+    "calc_errors_total", "Evaluation errors by CalcError code", ("code",)
+)
+http_requests_total = registry.counter(
+    "calc_http_requests_total", "HTTP requests handled", ("route", "method", "status")
+)
+http_request_seconds = registry.histogram(
+    "calc_http_request_seconds", "HTTP request latency", ("route", "method")
+)
+
+
+def enable():
+    global enabled
+    enabled = True
+
+
+def disable():
+    global enabled
+    enabled = False
+
+
+def time_stage(stage, func, *args):
+    # calls func(*args) and records its latency under stage, even if it raises
+    start = perf_counter()
+    try:
+        return func(*args)
+    finally:
+        stage_seconds.observe(perf_counter() - start, stage)
+
+
+def format_labels(names, values):
+    if not names:
+        return ""
+    pairs = ",".join(f'{name}="{escape(str(value))}"' for name, value in zip(names, values))
+    return "{" + pairs + "}"
+
+
+def escape(value):
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
@@ -0,0 +1,207 @@
+import math
+import operator
+import re
+from decimal import Decimal, Overflow
+
+from calc.core.errors import CalcMathError
+
+# operator and function registry. the tokenizer, the shunting yard in
+# calc.core.expression and every evaluator in calc.core read operators and
+# functions from here instead of hard-coding them.
+#
+#   operator    arity  precedence  associativity
+#   ^           2      4           right          2 ^ 3 ^ 2 is 2 ^ 9
+#   NEGATIVE    1      3           prefix         unary minus, -2 ^ 2 is -4
+#   * / % //    2      2           left           % and // round down, like python
+#   + -         2      1           left
+#
+#   function    arguments
+#   sqrt, abs   1
+#   min, max    1 or more
+#
+# implementations get and return numbers of whatever type is being
+# evaluated (Decimal, float or Fraction, see calc.core.backends), use the
+# current decimal context, and raise CalcMathError for undefined results.
+# register_operator and register_function add or replace entries; programs
+# parsed before that are dropped from the program cache
+
+UNARY_NEG = "NEGATIVE"
+
+
+class Operator:
+    __slots__ = ("symbol", "arity", "precedence", "right", "apply")
+
+    def __init__(self, symbol, arity, precedence, apply, right=False):
+        self.symbol = symbol
+        self.arity = arity # 2 for binary, 1 for prefix operators
+        self.precedence = precedence # higher binds tighter
+        self.right = right # right associative, binary only
+        self.apply = apply
+
+
+class Function:
+    __slots__ = ("name", "min_args", "max_args", "apply")
+
+    def __init__(self, name, apply, min_args=1, max_args=1):
+        self.name = name
+        self.min_args = min_args
+        self.max_args = max_args # None for any number
+        self.apply = apply
+
+    def check_args(self, count):
+        # message for a wrong number of arguments, None if count is fine
+        if self.min_args <= count and (self.max_args is None or count <= self.max_args):
+            return None
+        if self.max_args is None:
+            expected = f"at least {self.min_args}"
+        elif self.min_args == self.max_args:
+            expected = str(self.min_args)
+        else:
+            expected = f"{self.min_args} to {self.max_args}"
+        return f"Function '{self.name}' takes {expected} argument(s), got {count}"
+
+
+OPERATORS = {} # symbol -> Operator
+FUNCTIONS = {} # name -> Function
+
+# dispatch tables derived from the registry, kept up to date by it
+PRECEDENCE = {} # symbol -> precedence
+BINARY_OPS = set() # binary operator symbols
+BINARY = {} # binary symbol -> apply
+UNARY = {} # prefix symbol -> apply
+CALLS = {} # function name -> apply
+
+# called without arguments after every registration
+listeners = []
+
+
+def register_operator(symbol, arity, precedence, apply, right=False):
+    # symbols are punctuation, so they never run into numbers or names
+    if arity not in (1, 2):
+        raise ValueError("arity must be 1 or 2")
+    if symbol != UNARY_NEG and (not symbol or re.search(r"[\w\s().,]", symbol)):
+        raise ValueError(f"Invalid operator symbol: {symbol!r}")
+    OPERATORS[symbol] = Operator(symbol, arity, precedence, apply, right)
+    rebuild()
+
+
+def register_function(name, apply, min_args=1, max_args=1):
+    if not name.isidentifier():
+        raise ValueError(f"Invalid function name: {name!r}")
+    FUNCTIONS[name] = Function(name, apply, min_args, max_args)
+    rebuild()
+
+
+def rebuild():
+    PRECEDENCE.clear()
+    BINARY_OPS.clear()
+    BINARY.clear()
+    UNARY.clear()
+    CALLS.clear()
+    for symbol, op in OPERATORS.items():
+        PRECEDENCE[symbol] = op.precedence
+        if op.arity == 2:
+            BINARY_OPS.add(symbol)
+            BINARY[symbol] = op.apply
+        else:
+            UNARY[symbol] = op.apply
+    for name, function in FUNCTIONS.items():
+        CALLS[name] = function.apply
+    for listener in listeners:
+        listener()
+
+
+def symbols():
+    # operator symbols as they appear in expressions, longest first so
+    # "//" is not read as two "/"
+    return sorted((s for s in OPERATORS if s != UNARY_NEG), key=len, reverse=True)
+
+
+# implementations
+
+def arithmetic_error(error):
+    # CalcMathError for an ArithmeticError that came out of plain arithmetic.
+    # + - * / are left to the number type for speed, so the decimal
+    # context's Overflow from 10 ^ 999999 * 10 reaches the evaluators, which
+    # convert it with this
+    if isinstance(error, ZeroDivisionError):
+        return CalcMathError("Division by zero")
+    return CalcMathError("Result is too large")
+
+
+def divide(a, b):
+    if b == 0:
+        raise CalcMathError("Division by zero")
+    return a / b
+
+
+def floor_divide(a, b):
+    return floor_divmod(a, b)[0]
+
+
+def modulo(a, b):
+    return floor_divmod(a, b)[1]
+
+
+def floor_divmod(a, b):
+    # Decimal's divmod truncates, this rounds the quotient down for every type
+    if b == 0:
+        raise CalcMathError("Division by zero")
+    try:
+        quotient, remainder = divmod(a, b)
+    except ArithmeticError:
+        raise CalcMathError("Quotient is too large")
+    if remainder and (remainder < 0) != (b < 0):
+        quotient -= 1
+        remainder += b
+    return quotient, remainder
+
+
+def power(a, b):
+    # Decimal gives Infinity for zero to a negative power
+    if a == 0 and b < 0:
+        raise CalcMathError("Division by zero")
+    try:
+        result = a ** b
+    except ZeroDivisionError:
+        raise CalcMathError("Division by zero")
+    except (OverflowError, Overflow):
+        raise CalcMathError("Result is too large")
+    except ArithmeticError:
+        raise CalcMathError("Power is undefined")
+    if isinstance(result, complex):
+        # float: a negative number to a fractional power
+        raise CalcMathError("Power is undefined")
+    return result
+
+
+def sqrt(a):
+    if a < 0:
+        raise CalcMathError("Square root of a negative number")
+    if isinstance(a, Decimal):
+        return a.sqrt()
+    return math.sqrt(a)
+
+
+def minimum(*args):
+    # builtin min(x) would iterate over x
+    return min(args)
+
+
+def maximum(*args):
+    return max(args)
+
+
+register_operator("+", 2, 1, operator.add)
+register_operator("-", 2, 1, operator.sub)
+register_operator("*", 2, 2, operator.mul)
+register_operator("/", 2, 2, divide)
+register_operator("%", 2, 2, modulo)
+register_operator("//", 2, 2, floor_divide)
+register_operator(UNARY_NEG, 1, 3, operator.neg)
+register_operator("^", 2, 4, power, right=True)
+
+register_function("sqrt", sqrt)
+register_function("abs", abs)
+register_function("min", minimum, 1, None)
+register_function("max", maximum, 1, None)
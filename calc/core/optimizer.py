@@ -0,0 +1,203 @@
+from calc.core.errors import CalcError, CalcSyntaxError
+from calc.core.expression import Token, UNARY_NEG, parse_expr
+from calc.core.operators import BINARY, CALLS, UNARY
+
+# expression tree stage between parsing and evaluation. the postfix program
+# is rebuilt into a tree with identical subtrees merged, simplified, then
+# flattened back into postfix that eval_postfix and compile_postfix accept.
+# subtrees used more than once are computed once and kept in a slot:
+#   Token("STORE", n)  copy the top of the stack into slot n
+#   Token("LOAD", n)   push the value held in slot n
+
+
+class Node:
+    __slots__ = ("token", "children", "uses", "slot")
+
+    def __init__(self, token, children=()):
+        self.token = token # NUMBER, NAME, OP or CALL token
+        self.children = children
+        self.uses = 0 # how many parents refer to this node
+        self.slot = None
+
+
+class OptimizeStats:
+
+    def __init__(self):
+        self.tokens_before = 0
+        self.tokens_after = 0
+        self.folded = 0 # operators replaced by their constant result
+        self.negations_removed = 0 # pairs of unary minus dropped
+        self.shared = 0 # subtrees stored in a slot
+        self.reused = 0 # times a slot was loaded instead of recomputed
+
+    def as_dict(self):
+        return {
+            "tokens_before": self.tokens_before,
+            "tokens_after": self.tokens_after,
+            "folded": self.folded,
+            "negations_removed": self.negations_removed,
+            "shared": self.shared,
+            "reused": self.reused,
+        }
+
+
+def optimize_expr(expr):
+    # parses expr through the program cache and returns (program, stats)
+    return optimize(parse_expr(expr))
+
+
+def optimize(rpn_tokens):
+    # returns an optimized copy of a postfix program and its OptimizeStats
+    stats = OptimizeStats()
+    stats.tokens_before = len(rpn_tokens)
+    root = build_tree(rpn_tokens, stats)
+    program = flatten(root, stats)
+    stats.tokens_after = len(program)
+    return program, stats
+
+
+def build_tree(rpn_tokens, stats):
+    stack = []
+    interned = {} # structural key -> Node, merges identical subtrees
+
+    for token in rpn_tokens:
+
+        if token.kind == "NUMBER":
+            stack.append(constant(interned, token))
+            continue
+
+        if token.kind == "NAME":
+            stack.append(intern(interned, ("NAME", token.value), token, ()))
+            continue
+
+        if token.kind == "CALL":
+            name, count = token.value
+            if len(stack) < count:
+                raise CalcSyntaxError("Function '" + name + "' missing argument(s)")
+            args = tuple(stack[len(stack) - count:])
+            del stack[len(stack) - count:]
+            stack.append(apply_node(interned, token, CALLS.get(name), args, stats))
+            continue
+
+        if token.kind != "OP":
+            raise CalcSyntaxError("Invalid token in RPN")
+
+        if token.value in UNARY:
+            if not stack:
+                raise CalcSyntaxError("Unary '-' missing operand")
+            if token.value == UNARY_NEG:
+                stack.append(negate(interned, token, stack.pop(), stats))
+            else:
+                stack.append(apply_node(interned, token, UNARY[token.value], (stack.pop(),), stats))
+            continue
+
+        # binary operators
+        if len(stack) < 2:
+            raise CalcSyntaxError(
+                "Operator '" + token.value + "' missing operand(s)"
+            )
+
+        b = stack.pop()
+        a = stack.pop()
+        stack.append(apply_node(interned, token, BINARY.get(token.value), (a, b), stats))
+
+    if len(stack) != 1:
+        raise CalcSyntaxError("Malformed expression")
+
+    count_uses(stack[0])
+    return stack[0]
+
+
+def negate(interned, token, child, stats):
+    if child.token.kind == "NUMBER":
+        stats.folded += 1
+        return constant(interned, Token("NUMBER", -child.token.value, token.pos))
+    if child.token.kind == "OP" and child.token.value == UNARY_NEG:
+        # -(-x) is x
+        stats.negations_removed += 1
+        return child.children[0]
+    return intern(interned, (UNARY_NEG, id(child)), token, (child,))
+
+
+def apply_node(interned, token, apply, args, stats):
+    # operator or call node over args, folded when they are all numbers
+    value = fold(apply, args)
+    if value is not None:
+        stats.folded += 1
+        return constant(interned, Token("NUMBER", value, token.pos))
+    key = (token.kind, token.value) + tuple(id(arg) for arg in args)
+    return intern(interned, key, token, args)
+
+
+def fold(apply, args):
+    # constant result of an operator or function implementation on
+    # numbers, or None. errors such as division by zero or an overflow are
+    # left in place so they still raise at run time
+    if apply is None or any(arg.token.kind != "NUMBER" for arg in args):
+        return None
+    try:
+        return apply(*(arg.token.value for arg in args))
+    except (CalcError, ArithmeticError):
+        return None
+
+
+def constant(interned, token):
+    # keyed by text so 2 and 2.0 stay distinct, they format differently
+    return intern(interned, ("NUMBER", str(token.value)), token, ())
+
+
+def intern(interned, key, token, children):
+    # children are already interned, so equal keys mean equal subtrees
+    node = interned.get(key)
+    if node is None:
+        node = interned[key] = Node(token, children)
+    return node
+
+
+def count_uses(root):
+    # number of parents of every node reachable from root
+    seen = set()
+    todo = [root]
+    while todo:
+        node = todo.pop()
+        for child in node.children:
+            child.uses += 1
+            if id(child) not in seen:
+                seen.add(id(child))
+                todo.append(child)
+
+
+def flatten(root, stats):
+    # post-order walk without recursion, so long chains cannot hit the
+    # recursion limit. nodes used more than once are stored on first
+    # visit and loaded afterwards
+    program = []
+    todo = [(root, False)]
+    emitted = set()
+
+    while todo:
+        node, children_done = todo.pop()
+
+        if node.slot is not None and id(node) in emitted:
+            program.append(Token("LOAD", node.slot, node.token.pos))
+            stats.reused += 1
+            continue
+
+        if not node.children:
+            program.append(node.token)
+            continue
+
+        if not children_done:
+            todo.append((node, True))
+            for child in reversed(node.children):
+                todo.append((child, False))
+            continue
+
+        program.append(node.token)
+        if node.uses > 1:
+            node.slot = stats.shared
+            stats.shared += 1
+            emitted.add(id(node))
+            program.append(Token("STORE", node.slot, node.token.pos))
+
+    return program
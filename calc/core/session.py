@@ -1,52 +1,197 @@
-from collections import deque
+import sys
+import threading
+import time
 from decimal import Decimal
 
-from calc.core.expression import eval_expr
+from calc.core import metrics
+from calc.core.backends import resolve_backend
+from calc.core.errors import CalcError, CalcSyntaxError
+from calc.core.expression import eval_expr, clear_cache
+from calc.core.formatting import default_formatter
+from calc.core.history import MemoryHistory
+
+# how often a long poll on history that other processes change checks for
+# their changes, changes made through this session wake it right away
+SHARED_POLL_INTERVAL = 0.1
 
 
 class CalculatorSession:
     # manages calculator state, history, and formatting
 
-    def __init__(self):
-        # initialize session
-        self.history = deque(maxlen=10)
+    def __init__(self, history=None, formatter=None, backend=None, limits=None,
+                 history_size=10):
+        # initialize session, history defaults to the last history_size in memory
+        # backend is a numeric backend or its name (see calc.core.backends),
+        # None evaluates with plain Decimal
+        # limits is a calc.core.limits.Limits every evaluation must stay in
+        self.formatter = formatter or default_formatter
+        if history is None:
+            history = MemoryHistory(maxlen=history_size, formatter=self.formatter)
+        self.history = history
+        self.backend = resolve_backend(backend)
+        self.limits = limits
         self.current_value = Decimal("0")
+        # guards current_value and history when shared between threads
+        self.lock = threading.RLock()
+        # bumped by every change to current_value or history, see wait_for_version
+        self.version = 0
+        self.changed = threading.Condition(self.lock)
+        # callbacks from watch_version, under their own lock so watching
+        # never waits for an evaluation to finish
+        self.watchers = []
+        self.watch_lock = threading.Lock()
+        # encoded responses for the current version, kept by calc.api.handlers
+        self.response_cache = {}
+        # what memory_usage() last measured, see memory_usage(blocking=False)
+        self.memory_bytes = 0
 
-    def evaluate(self, expr):
+    def evaluate(self, expr, record_history=True, backend=None, limits=None):
         # evaluate expression and record in history
-        result = eval_expr(expr)
+        # backend and limits override the session's for this call
+        backend = resolve_backend(backend) or self.backend
+        limits = limits or self.limits
+        with self.lock:
+            try:
+                return self._evaluate(expr, record_history, backend, limits)
+            except CalcError as e:
+                if metrics.enabled:
+                    metrics.errors_total.inc(e.code)
+                raise
+
+    def evaluate_many(self, exprs, record_history=True, backend=None, limits=None):
+        # lazily evaluates an iterable of expressions under one lock
+        # acquisition, yielding (expr, formatted_result, error) per item.
+        # the lock is held until the generator is exhausted or closed
+        backend = resolve_backend(backend) or self.backend
+        limits = limits or self.limits
+        with self.lock:
+            for expr in exprs:
+                try:
+                    yield expr, self._evaluate(expr, record_history, backend, limits), None
+                except CalcError as e:
+                    if metrics.enabled:
+                        metrics.errors_total.inc(e.code)
+                    yield expr, None, e
+
+    def _evaluate(self, expr, record_history, backend, limits):
+        if not isinstance(expr, str):
+            raise CalcSyntaxError("Expression must be a string")
+        start = time.perf_counter()
+        result = eval_expr(expr, backend=backend, limits=limits)
+        duration = time.perf_counter() - start
+        if backend is not None:
+            result = backend.to_decimal(result)
         self.current_value = result
-        formatted_result = self.format_result(result)
-        self.history.append({
-            "expression": expr,
-            "result": formatted_result
-        })
+        if metrics.enabled:
+            formatted_result = metrics.time_stage("format", self.format_result, result)
+        else:
+            formatted_result = self.format_result(result)
+        if record_history:
+            self.history.append({
+                "expression": expr,
+                "result": formatted_result,
+                "value": result,
+                "duration": duration,
+                "timestamp": time.time()
+            })
+        self.bump_version()
         return formatted_result
 
     def format_result(self, value):
         # format to smallest decimal place that makes sense:
         # 0 if whole number, 1 if one decimal, 2 if more
-        float_val = float(value)
-        
-        # check if whole number
-        if float_val == int(float_val):
-            return str(int(float_val))
-        
-        # check if one decimal place is enough
-        one_decimal = round(float_val, 1)
-        if one_decimal == float_val:
-            return f"{float_val:.1f}"
-        
-        # use two decimal places
-        return f"{float_val:.2f}"
+        # (or whatever policy the session's formatter uses)
+        return self.formatter.format(value)
 
     def get_history(self):
         # return list of last 10 evaluations
-        return list(self.history)
+        with self.lock:
+            return self.history.recent(10)
+
+    def get_history_page(self, cursor=None, limit=50, since=None, until=None):
+        # returns (entries, next_cursor), see calc.core.history
+        with self.lock:
+            return self.history.page(cursor, limit, since, until)
+
+    def search_history(self, query, limit=50, prefix=False):
+        # last limit entries whose expression contains (or starts with) query
+        with self.lock:
+            return self.history.search(query, limit, prefix)
+
+    def memory_usage(self, blocking=True):
+        # approximate bytes held by this session's state and history. with
+        # blocking=False a session that is busy, e.g. streaming a batch to a
+        # slow reader, reports what was last measured instead of waiting
+        if not self.lock.acquire(blocking):
+            return self.memory_bytes
+        try:
+            total = sys.getsizeof(self) + sys.getsizeof(self.current_value)
+            self.memory_bytes = total + self.history.memory_usage()
+            return self.memory_bytes
+        finally:
+            self.lock.release()
 
     def clear_history(self):
-        self.history.clear()
+        with self.lock:
+            self.history.clear()
+            self.bump_version()
 
     def reset(self):
-        self.current_value = Decimal("0")
-        self.clear_history()
+        with self.lock:
+            self.current_value = Decimal("0")
+            self.clear_history()
+        clear_cache()
+
+    def bump_version(self):
+        # caller holds the lock
+        self.version += 1
+        self.response_cache.clear()
+        self.changed.notify_all()
+        with self.watch_lock:
+            watchers, self.watchers = self.watchers, []
+        for callback in watchers:
+            callback()
+
+    def current_version(self):
+        # the version clients see. history that other processes change has
+        # its own version, which this session's counter would not track
+        if getattr(self.history, "shared", False):
+            return self.history.version()
+        return self.version
+
+    def wait_for_version(self, version, timeout=None):
+        # blocks until the version is past version or timeout seconds have
+        # passed, returns the current version
+        with self.changed:
+            if not getattr(self.history, "shared", False):
+                self.changed.wait_for(lambda: self.version > version, timeout)
+                return self.version
+            # other processes cannot notify this one, check every
+            # SHARED_POLL_INTERVAL seconds
+            deadline = None if timeout is None else time.monotonic() + timeout
+            current = self.history.version()
+            while current <= version:
+                wait = SHARED_POLL_INTERVAL
+                if deadline is not None:
+                    wait = min(wait, deadline - time.monotonic())
+                    if wait <= 0:
+                        break
+                self.changed.wait(wait)
+                current = self.history.version()
+            return current
+
+    def watch_version(self, version, callback):
+        # calls callback() once, from the thread that changes the session,
+        # when the version is past version; right away if it already is.
+        # for waiting without a thread, undo with unwatch_version. only sees
+        # changes made through this session, not those of other processes
+        with self.watch_lock:
+            if self.version <= version:
+                self.watchers.append(callback)
+                return
+        callback()
+
+    def unwatch_version(self, callback):
+        with self.watch_lock:
+            if callback in self.watchers:
+                self.watchers.remove(callback)
@@ -0,0 +1,328 @@
+import multiprocessing
+import struct
+import sys
+import tempfile
+import threading
+from hashlib import blake2b
+from multiprocessing import shared_memory
+
+try:
+    import fcntl
+except ImportError: # windows has no fork, so no pre-fork server either
+    fcntl = None
+
+from calc.core.history import page_result, row_entry, search_key
+
+# history shared between processes, for the pre-fork server in
+# calc.api.prefork. every client's entries go into one fixed-size ring of
+# records in a multiprocessing.shared_memory block, so a client sees the
+# same history whichever worker process answers. the ring is created before
+# the workers are forked and they inherit the mapping and the lock.
+#
+# records have a fixed size, so very long expressions and results are
+# stored truncated, ending in "...". once the ring is full the oldest
+# entries, of any client, are overwritten.
+#
+# reads hold the lock that every worker's appends wait for, so they must not
+# scan the whole ring. clients are hashed into buckets, each with the id of
+# its newest record, and every record keeps the id of the one before it in
+# the same bucket. a read walks that chain, which only holds the client's
+# records and those of clients that share the bucket, and stops at the first
+# id that has been overwritten.
+#
+# every append or clear also bumps its bucket's version. a worker cannot
+# wake long polls waiting in other workers, they poll version() instead. a
+# client that shares a bucket sees the other client's changes bump it too
+
+# capacity, next id
+HEADER = struct.Struct("<qq")
+# newest id of a bucket (or 0), version of the bucket
+HEAD = struct.Struct("<qq")
+# client key (0 for a free or cleared slot), id, previous id in the bucket,
+# timestamp, byte lengths of client, expression and result
+RECORD = struct.Struct("<Qqqdhhh")
+KEY = struct.Struct("<Q")
+PREV = struct.Struct("<q")
+PREV_OFFSET = 16
+
+TRUNCATED = b"..."
+
+
+class ProcessLock:
+    # a lock for forked processes that is let go when its holder dies. a
+    # multiprocessing.Lock held by a worker killed with SIGKILL stays held,
+    # and every other process deadlocks on it. a POSIX record lock on a
+    # temporary file is dropped by the kernel with the process that holds
+    # it. record locks belong to a process, not a thread, so a thread lock
+    # keeps the threads of one process apart
+
+    def __init__(self):
+        self.file = None
+        if fcntl is None:
+            self.threads = multiprocessing.Lock()
+            return
+        self.file = tempfile.TemporaryFile()
+        self.threads = threading.Lock()
+
+    def __enter__(self):
+        self.threads.acquire()
+        if self.file is not None:
+            try:
+                fcntl.lockf(self.file, fcntl.LOCK_EX)
+            except BaseException:
+                self.threads.release()
+                raise
+        return self
+
+    def __exit__(self, *exc_info):
+        if self.file is not None:
+            fcntl.lockf(self.file, fcntl.LOCK_UN)
+        self.threads.release()
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+
+
+class SharedHistoryRing:
+
+    def __init__(self, capacity=100000, max_client=64, max_expression=256, max_result=128):
+        if capacity < 1:
+            raise ValueError("capacity must be >= 1")
+        self.capacity = capacity
+        self.max_client = max_client
+        self.max_expression = max_expression
+        self.max_result = max_result
+        self.record_size = RECORD.size + max_client + max_expression + max_result
+        # one bucket per slot keeps chains about one client long
+        self.buckets = capacity
+        self.records = HEADER.size + self.buckets * HEAD.size
+        self.shm = shared_memory.SharedMemory(
+            create=True, size=self.records + capacity * self.record_size
+        )
+        self.buf = self.shm.buf
+        self.lock = ProcessLock()
+        HEADER.pack_into(self.buf, 0, capacity, 1)
+        self.buf[HEADER.size:self.records] = bytes(self.records - HEADER.size)
+
+    def append(self, client, entry):
+        key = client_key(client)
+        client_bytes = fit(client, self.max_client)
+        expression = fit(entry["expression"], self.max_expression)
+        result = fit(entry["result"], self.max_result)
+        with self.lock:
+            entry_id = self.next_id()
+            offset = self.offset(entry_id)
+            head = self.head(key)
+            prev, version = HEAD.unpack_from(self.buf, head)
+            RECORD.pack_into(
+                self.buf, offset, key, entry_id, prev,
+                entry["timestamp"], len(client_bytes), len(expression), len(result)
+            )
+            start = offset + RECORD.size
+            self.buf[start:start + len(client_bytes)] = client_bytes
+            start += self.max_client
+            self.buf[start:start + len(expression)] = expression
+            start += self.max_expression
+            self.buf[start:start + len(result)] = result
+            HEAD.pack_into(self.buf, head, entry_id, version + 1)
+            HEADER.pack_into(self.buf, 0, self.capacity, entry_id + 1)
+        entry["id"] = entry_id
+
+    def recent(self, client, limit):
+        key = client_key(client)
+        client_bytes = fit(client, self.max_client)
+        entries = []
+        with self.lock:
+            for entry_id in self.chain(key):
+                entry = self.read(entry_id, key, client_bytes)
+                if entry is not None:
+                    entries.append(entry)
+                    if len(entries) >= limit:
+                        break
+        entries.reverse()
+        return entries
+
+    def page(self, client, cursor=None, limit=50, since=None, until=None):
+        key = client_key(client)
+        client_bytes = fit(client, self.max_client)
+        entries = []
+        with self.lock:
+            # the chain runs newest first, a page oldest first
+            for entry_id in self.chain(key):
+                if entry_id <= (cursor or 0):
+                    break
+                entry = self.read(entry_id, key, client_bytes)
+                if entry is None:
+                    continue
+                if since is not None and entry["timestamp"] < since:
+                    continue
+                if until is not None and entry["timestamp"] >= until:
+                    continue
+                entries.append(entry)
+        entries.reverse()
+        # one extra entry tells whether there is another page
+        return page_result(entries[:limit + 1], limit)
+
+    def search(self, client, query, limit=50, prefix=False):
+        # a scan of the client's entries, newest first. stored expressions
+        # may be truncated, so only their first part can match
+        needle = search_key(query)
+        key = client_key(client)
+        client_bytes = fit(client, self.max_client)
+        entries = []
+        with self.lock:
+            for entry_id in self.chain(key):
+                entry = self.read(entry_id, key, client_bytes)
+                if entry is None:
+                    continue
+                text = search_key(entry["expression"])
+                if text.startswith(needle) if prefix else needle in text:
+                    entries.append(entry)
+                    if len(entries) >= limit:
+                        break
+        entries.reverse()
+        return entries
+
+    def count(self, client):
+        key = client_key(client)
+        client_bytes = fit(client, self.max_client)
+        with self.lock:
+            return sum(self.owns(entry_id, key, client_bytes) for entry_id in self.chain(key))
+
+    def clear(self, client):
+        # frees the client's slots, they are reused in ring order, and takes
+        # them out of the bucket's chain
+        key = client_key(client)
+        client_bytes = fit(client, self.max_client)
+        with self.lock:
+            link = self.head(key)
+            for entry_id in list(self.chain(key)):
+                offset = self.offset(entry_id)
+                if self.owns(entry_id, key, client_bytes):
+                    KEY.pack_into(self.buf, offset, 0)
+                else:
+                    PREV.pack_into(self.buf, link, entry_id)
+                    link = offset + PREV_OFFSET
+            PREV.pack_into(self.buf, link, 0)
+            head = self.head(key)
+            newest, version = HEAD.unpack_from(self.buf, head)
+            HEAD.pack_into(self.buf, head, newest, version + 1)
+
+    def version(self, client):
+        # bumped by every change to the client's history, in any process
+        with self.lock:
+            return HEAD.unpack_from(self.buf, self.head(client_key(client)))[1]
+
+    def pending_bytes(self, client):
+        # nothing is buffered outside shared memory
+        return 0
+
+    def close(self):
+        # detaches this process, call unlink() once from the creator as well
+        self.buf = None
+        self.shm.close()
+        self.lock.close()
+
+    def unlink(self):
+        self.shm.unlink()
+
+    def next_id(self):
+        return HEADER.unpack_from(self.buf, 0)[1]
+
+    def offset(self, entry_id):
+        return self.records + (entry_id - 1) % self.capacity * self.record_size
+
+    def head(self, key):
+        # offset of the newest id in the key's bucket
+        return HEADER.size + key % self.buckets * HEAD.size
+
+    def chain(self, key):
+        # ids in the key's bucket, newest first, while they are still in the
+        # ring. caller holds the lock
+        oldest = max(1, self.next_id() - self.capacity)
+        entry_id = HEAD.unpack_from(self.buf, self.head(key))[0]
+        while entry_id >= oldest:
+            yield entry_id
+            prev = PREV.unpack_from(self.buf, self.offset(entry_id) + PREV_OFFSET)[0]
+            # ids only go down, a torn record must not loop forever
+            if prev >= entry_id:
+                return
+            entry_id = prev
+
+    def owns(self, entry_id, key, client_bytes):
+        # whether the record with entry_id belongs to the client. a bucket
+        # also holds other clients, and in rare cases another client's key
+        offset = self.offset(entry_id)
+        stored_key, stored_id, _, _, client_len = RECORD.unpack_from(self.buf, offset)[:5]
+        start = offset + RECORD.size
+        return (
+            stored_key == key and stored_id == entry_id
+            and bytes(self.buf[start:start + client_len]) == client_bytes
+        )
+
+    def read(self, entry_id, key, client_bytes):
+        # the entry with entry_id if it belongs to the client, else None.
+        # caller holds the lock
+        if not self.owns(entry_id, key, client_bytes):
+            return None
+        offset = self.offset(entry_id)
+        _, _, _, timestamp, _, expr_len, result_len = RECORD.unpack_from(self.buf, offset)
+        start = offset + RECORD.size + self.max_client
+        # a writer killed halfway can leave a mix of old and new bytes
+        expression = bytes(self.buf[start:start + expr_len]).decode("utf-8", "replace")
+        start += self.max_expression
+        result = bytes(self.buf[start:start + result_len]).decode("utf-8", "replace")
+        # durations are not kept in the ring
+        return row_entry((entry_id, timestamp, expression, result, 0.0))
+
+
+class SharedHistory:
+    # one client's view of a SharedHistoryRing
+
+    shared = True
+
+    def __init__(self, ring, client="default", recent_limit=10):
+        self.ring = ring
+        self.client = client
+        self.recent_limit = recent_limit
+
+    def append(self, entry):
+        self.ring.append(self.client, entry)
+
+    def recent(self, limit=None):
+        return self.ring.recent(self.client, limit or self.recent_limit)
+
+    def page(self, cursor=None, limit=50, since=None, until=None):
+        return self.ring.page(self.client, cursor, limit, since, until)
+
+    def search(self, query, limit=50, prefix=False):
+        return self.ring.search(self.client, query, limit, prefix)
+
+    def clear(self):
+        self.ring.clear(self.client)
+
+    def version(self):
+        return self.ring.version(self.client)
+
+    def memory_usage(self):
+        # entries live in shared memory, not in this process
+        return sys.getsizeof(self)
+
+    def __len__(self):
+        return self.ring.count(self.client)
+
+
+def client_key(client):
+    # stable across processes, unlike hash(). never 0, which marks free slots
+    key = KEY.unpack(blake2b(client.encode("utf-8"), digest_size=8).digest())[0]
+    return key or 1
+
+
+def fit(text, size):
+    # text as UTF-8 in at most size bytes, cut on a character boundary
+    data = text.encode("utf-8")
+    if len(data) <= size:
+        return data
+    data = data[:size - len(TRUNCATED)].decode("utf-8", "ignore").encode("utf-8")
+    return data + TRUNCATED
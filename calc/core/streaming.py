@@ -0,0 +1,106 @@
+import codecs
+
+from calc.core.errors import CalcSyntaxError
+from calc.core.expression import eval_postfix, iter_postfix, scan_tokens
+
+# constant-memory evaluation of one very long expression, e.g. a generated
+# sum over an exported ledger. the source is read in chunks, tokens are
+# scanned per chunk, fed through iter_postfix and evaluated as they come,
+# so memory grows with the nesting depth of the expression, not its length.
+#
+# unlike eval_expr nothing is cached, and since the input is never held in
+# full an error is reported when the evaluation reaches it: "1 / 0 + (" is
+# a division by zero here, where eval_expr reports the parentheses
+
+CHUNK_SIZE = 65536
+
+# a token at the very end of a chunk may continue in the next one: a run
+# of word characters and dots (a number or name), or of operator
+# characters, since a "/" may be the start of "//"
+WORD = "word"
+OPERATOR = "operator"
+
+
+def eval_stream(source, variables=None, backend=None, chunk_size=CHUNK_SIZE):
+    # evaluates the expression in source, a string or a file-like object
+    # opened in text or binary (UTF-8) mode. backend is a
+    # calc.core.backends.NumericBackend, None evaluates with Decimal
+    program = iter_postfix(iter_tokens(source, chunk_size))
+    if backend is None:
+        return eval_postfix(program, variables)
+    return backend.eval_postfix(program, variables)
+
+
+def iter_tokens(source, chunk_size=CHUNK_SIZE):
+    # yields the tokens of source, reading chunk_size characters at a time.
+    # token positions are offsets into the whole input
+    offset = 0 # position of buffer[0] in the input
+    buffer = ""
+    found = False
+
+    for chunk in iter_chunks(source, chunk_size):
+        held = len(buffer)
+        buffer += chunk
+        # hold back a number, name or operator that may not be complete yet
+        cut = tail_start(buffer, held) if chunk else len(buffer)
+        if cut:
+            for token in scan_tokens(buffer[:cut]):
+                token.pos += offset
+                yield token
+                found = True
+            buffer = buffer[cut:]
+            offset += cut
+
+    if not found:
+        raise CalcSyntaxError("Empty expression")
+
+
+def tail_start(buffer, held=0):
+    # where the run of word or operator characters at the end of buffer
+    # starts, len(buffer) if it ends in anything else. buffer[:held] is the
+    # run held back from the last chunk, so only the rest is scanned,
+    # backward from the end, which keeps a literal spanning many chunks
+    # linear in its length
+    end = len(buffer)
+    kind = char_kind(buffer[-1]) if end else None
+    if kind is None:
+        return end
+    start = end
+    while start > held and char_kind(buffer[start - 1]) == kind:
+        start -= 1
+    if start == held and held and char_kind(buffer[held - 1]) == kind:
+        return 0
+    return start
+
+
+def char_kind(char):
+    if char.isalnum() or char == "_" or char == ".":
+        return WORD
+    if char.isspace() or char in "(),":
+        return None
+    return OPERATOR
+
+
+def iter_chunks(source, chunk_size):
+    # text chunks of source, ending with one empty string
+    if isinstance(source, str):
+        for start in range(0, len(source), chunk_size):
+            yield source[start:start + chunk_size]
+        yield ""
+        return
+
+    decoder = codecs.getincrementaldecoder("utf-8")()
+    while True:
+        data = source.read(chunk_size)
+        chunk = data
+        if isinstance(data, bytes):
+            try:
+                chunk = decoder.decode(data, final=not data)
+            except UnicodeDecodeError:
+                raise CalcSyntaxError("Input is not valid UTF-8")
+        if not data:
+            yield ""
+            return
+        # a chunk ending inside a character can decode to nothing
+        if chunk:
+            yield chunk
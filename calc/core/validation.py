@@ -0,0 +1,175 @@
+from calc.core.cache import normalize_expr
+from calc.core.errors import CalcLimitError, CalcSyntaxError
+from calc.core import expression
+from calc.core.expression import (
+    MISMATCHED_PARENTHESES, UNEXPECTED_CHARACTER, Token, check_decimal_points,
+    convert_to_postfix, parse_number, program_cache,
+)
+from calc.core.operators import FUNCTIONS
+
+# parse-only checking for front ends that validate on every keystroke.
+# validate_expr scans and parses like parse_expr, without evaluating, but
+# keeps going after an error, so it reports every problem it can find with
+# its offsets instead of only the first. a valid expression's program goes
+# into the program cache, so evaluating it next does not parse it again.
+#
+# a problem is a dict:
+#   code      CalcError code, "SYNTAX_ERROR" or "LIMIT_EXCEEDED"
+#   message   what is wrong
+#   start     offset of the first character it concerns
+#   end       offset after the last one, start == end at the very end
+# an empty list means eval_expr parses the expression. it can still fail
+# while evaluating, on an unknown variable or a division by zero. the check
+# is stricter than evaluation, which computes a few malformed inputs such
+# as "+2 3" anyway; those are reported as problems
+
+
+def validate_expr(expr, limits=None):
+    # problems of expr, sorted by offset. limits is a
+    # calc.core.limits.Limits whose input checks run first; when one fails
+    # nothing else is looked at
+    if limits is not None:
+        try:
+            limits.check_input(expr)
+        except CalcLimitError as e:
+            return [problem(e, 0, len(expr))]
+
+    if expr.strip() == "":
+        return [problem(CalcSyntaxError("Empty expression"), 0, len(expr))]
+
+    tokens, ends, problems = scan_checked(expr)
+    problems.extend(check_structure(tokens, ends, len(expr.rstrip())))
+    if problems:
+        problems.sort(key=lambda p: p["start"])
+        return problems
+
+    # a membership test, get() would count every keystroke as a cache miss
+    key = normalize_expr(expr)
+    if key not in program_cache:
+        program_cache.put(key, convert_to_postfix(tokens))
+    return []
+
+
+def scan_checked(expr):
+    # like calc.core.expression.scan_tokens, but bad characters and numbers
+    # become problems and INVALID tokens, which stand in for an operand so
+    # one typo is reported once. also returns where each token ends
+    tokens = []
+    ends = []
+    problems = []
+
+    for m in expression.SCANNER.finditer(expr):
+        number_str, name, op, lparen, rparen, comma, other = m.groups()
+
+        if number_str is not None:
+            try:
+                if "." in number_str:
+                    check_decimal_points(number_str)
+                tokens.append(Token("NUMBER", parse_number(number_str), m.start(1)))
+            except CalcSyntaxError as e:
+                problems.append(problem(e, m.start(1), m.end(1)))
+                tokens.append(Token("INVALID", number_str, m.start(1)))
+        elif name is not None and not name[0].isdigit():
+            tokens.append(Token("FUNC" if name in FUNCTIONS else "NAME", name, m.start(2)))
+        elif op is not None:
+            tokens.append(Token("OP", op, m.start(3)))
+        elif lparen is not None:
+            tokens.append(Token("LPAREN", lparen, m.start(4)))
+        elif rparen is not None:
+            tokens.append(Token("RPAREN", rparen, m.start(5)))
+        elif comma is not None:
+            tokens.append(Token("COMMA", comma, m.start(6)))
+        else:
+            # digit-like characters such as superscripts, here or starting a name
+            start, end = (m.start(7), m.end(7)) if other is not None else (m.start(2), m.end(2))
+            error = CalcSyntaxError(UNEXPECTED_CHARACTER + repr(expr[start]))
+            problems.append(problem(error, start, end))
+            tokens.append(Token("INVALID", expr[start:end], start))
+        ends.append(m.end())
+
+    return tokens, ends, problems
+
+
+def check_structure(tokens, ends, end):
+    # problems with the order of tokens: operands and binary operators must
+    # alternate, with any number of unary minuses and parentheses around
+    # operands, and a function name needs a '(' and the right number of
+    # arguments. end is where a missing final operand is reported
+    problems = []
+    open_parens = [] # [LPAREN token, FUNC token or None, commas] per open '('
+    expect_operand = True
+    prev = None
+
+    for token, token_end in zip(tokens, ends):
+        kind = token.kind
+        span = token.pos, token_end
+
+        if prev is not None and prev.kind == "FUNC" and kind != "LPAREN":
+            problems.append(function_problem(prev))
+            expect_operand = False # the name stands in for its call
+
+        if kind == "NUMBER" or kind == "NAME" or kind == "FUNC":
+            if not expect_operand:
+                # two operands in a row, there is no implicit multiplication
+                problems.append(syntax_problem("Missing operator", *span))
+            # a function name still needs its '('
+            expect_operand = kind == "FUNC"
+        elif kind == "INVALID":
+            expect_operand = False
+        elif kind == "LPAREN":
+            if not expect_operand:
+                problems.append(syntax_problem("Missing operator", *span))
+            function = prev if prev is not None and prev.kind == "FUNC" else None
+            open_parens.append([token, function, 0])
+            expect_operand = True
+        elif kind == "OP":
+            if expect_operand and token.value != "-":
+                problems.append(syntax_problem(
+                    f"Operator '{token.value}' missing operand(s)", *span
+                ))
+            expect_operand = True
+        elif kind == "COMMA":
+            if not open_parens or open_parens[-1][1] is None:
+                problems.append(syntax_problem("Unexpected ','", *span))
+            else:
+                if expect_operand:
+                    problems.append(syntax_problem("Missing operand before ','", *span))
+                open_parens[-1][2] += 1
+            expect_operand = True
+        elif kind == "RPAREN":
+            if not open_parens:
+                problems.append(syntax_problem(MISMATCHED_PARENTHESES, *span))
+            else:
+                paren, function, commas = open_parens.pop()
+                empty = prev is paren
+                if function is not None:
+                    message = FUNCTIONS[function.value].check_args(0 if empty else commas + 1)
+                    if message is not None:
+                        problems.append(syntax_problem(message, function.pos, token_end))
+                if expect_operand and not (empty and function is not None):
+                    problems.append(syntax_problem("Missing operand before ')'", *span))
+            expect_operand = False
+        prev = token
+
+    if prev is not None and prev.kind == "FUNC":
+        problems.append(function_problem(prev))
+    elif expect_operand and tokens:
+        problems.append(syntax_problem("Expression ends without an operand", end, end))
+    for paren, _, _ in open_parens:
+        problems.append(syntax_problem(MISMATCHED_PARENTHESES, paren.pos, paren.pos + 1))
+    return problems
+
+
+def function_problem(token):
+    return syntax_problem(
+        f"Function '{token.value}' must be followed by '('",
+        token.pos, token.pos + len(token.value),
+    )
+
+
+def syntax_problem(message, start, end):
+    return problem(CalcSyntaxError(message), start, end)
+
+
+def problem(error, start, end):
+    return {"code": error.code, "message": error.message, "start": start, "end": end}
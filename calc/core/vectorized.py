@@ -0,0 +1,150 @@
+import math
+import operator
+from collections import namedtuple
+from decimal import Decimal
+
+import numpy as np
+
+from calc.core import operators
+from calc.core.errors import CalcSyntaxError, CalcNameError, CalcMathError
+from calc.core.expression import parse_expr, to_decimal
+from calc.core.operators import BINARY, CALLS, UNARY
+
+
+# values: result array, errors: boolean mask of rows with a math error,
+# such as a division by zero
+VectorResult = namedtuple("VectorResult", ["values", "errors"])
+
+# implementations that work on whole arrays as they are. other operators
+# and functions are applied row by row, see apply_rows
+ARRAY_SAFE = {operator.add, operator.sub, operator.mul, operator.neg}
+
+# elementwise conversion used to build Decimal object arrays
+decimal_array = np.frompyfunc(to_decimal, 1, 1)
+
+
+def eval_vectorized(expr, exact=False, **columns):
+    # evaluates expr once per operator over whole arrays. variables in expr
+    # are bound to the matching keyword argument (any array-like)
+    # exact=False uses float64, exact=True uses Decimal object arrays
+    # expr may also be an already parsed (or optimized) postfix program
+    program = parse_expr(expr) if isinstance(expr, str) else expr
+    arrays = {name: as_column(values, exact) for name, values in columns.items()}
+    shape = np.broadcast_shapes(*(a.shape for a in arrays.values()))
+    errors = np.zeros(shape, dtype=bool)
+    stack = []
+    slots = {} # shared subexpression results, see calc.core.optimizer
+
+    for token in program:
+
+        if token.kind == "NUMBER":
+            stack.append(token.value if exact else float(token.value))
+            continue
+
+        if token.kind == "NAME":
+            if token.value not in arrays:
+                raise CalcNameError("Unknown variable: " + token.value)
+            stack.append(arrays[token.value])
+            continue
+
+        if token.kind == "CALL":
+            name, count = token.value
+            if name not in CALLS:
+                raise CalcSyntaxError("Unknown function: " + name)
+            if len(stack) < count:
+                raise CalcSyntaxError("Function '" + name + "' missing argument(s)")
+            args = stack[len(stack) - count:]
+            del stack[len(stack) - count:]
+            stack.append(apply_rows(CALLS[name], args, errors, exact))
+            continue
+
+        if token.kind != "OP":
+            if token.kind == "STORE" and stack:
+                slots[token.value] = stack[-1]
+                continue
+            if token.kind == "LOAD" and token.value in slots:
+                stack.append(slots[token.value])
+                continue
+            raise CalcSyntaxError("Invalid token in RPN")
+
+        if token.value in UNARY:
+            if not stack:
+                raise CalcSyntaxError("Unary '-' missing operand")
+            stack.append(apply_array(UNARY[token.value], [stack.pop()], errors, exact))
+            continue
+
+        # binary operators
+        if len(stack) < 2:
+            raise CalcSyntaxError(
+                "Operator '" + token.value + "' missing operand(s)"
+            )
+
+        apply = BINARY.get(token.value)
+        if apply is None:
+            raise CalcSyntaxError("Unknown operator: " + token.value)
+
+        b = stack.pop()
+        a = stack.pop()
+        stack.append(apply_array(apply, [a, b], errors, exact))
+
+    if len(stack) != 1:
+        raise CalcSyntaxError("Malformed expression")
+
+    values = np.asarray(stack[0], dtype=object if exact else np.float64)
+    if values.shape != shape:
+        # constant subexpressions stay scalar until the end
+        values = np.broadcast_to(values, shape).copy()
+    return VectorResult(values, errors)
+
+
+def as_column(values, exact):
+    if not exact:
+        return np.asarray(values, dtype=np.float64)
+    return np.asarray(decimal_array(np.asarray(values, dtype=object)), dtype=object)
+
+
+def apply_array(apply, args, errors, exact):
+    if apply in ARRAY_SAFE:
+        try:
+            return apply(*args)
+        except ArithmeticError:
+            # a Decimal row overflowed, find out which one by one
+            pass
+    if apply is operators.divide:
+        return divide(*args, errors, exact)
+    return apply_rows(apply, args, errors, exact)
+
+
+def apply_rows(apply, args, errors, exact):
+    # calls apply once per row of the broadcast args. rows raising
+    # CalcMathError or an ArithmeticError such as the decimal context's
+    # Overflow are flagged in errors (in place) and become NaN
+    dtype = object if exact else np.float64
+    arrays = np.broadcast_arrays(*(np.asarray(arg, dtype=dtype) for arg in args))
+    shape = arrays[0].shape if arrays else ()
+    rows = zip(*(array.ravel().tolist() for array in arrays)) if arrays else [()]
+    nan = Decimal("NaN") if exact else math.nan
+    values = []
+    failed = []
+    for row in rows:
+        try:
+            values.append(apply(*row))
+            failed.append(False)
+        except (CalcMathError, ArithmeticError):
+            values.append(nan)
+            failed.append(True)
+    errors |= np.array(failed, dtype=bool).reshape(shape)
+    return np.array(values, dtype=dtype).reshape(shape)
+
+
+def divide(a, b, errors, exact):
+    # rows dividing by zero are flagged in errors (in place) and become NaN
+    zero = np.asarray(b == 0)
+    if not zero.any():
+        return a / b
+    errors |= zero
+    if exact:
+        result = a / np.where(zero, Decimal(1), b)
+        return np.where(zero, Decimal("NaN"), result)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return np.where(zero, np.nan, np.divide(a, b))
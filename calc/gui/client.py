@@ -0,0 +1,175 @@
+import itertools
+import queue
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+
+# talks to the API server for the GUI from a background thread. the Tk
+# thread only ever puts jobs on a queue and, from an after() callback,
+# runs the callbacks of finished jobs, so it never waits on the network.
+#
+# jobs submitted with a key replace older ones with the same key: a queued
+# job that has been superseded is dropped without being sent, and the
+# result of one already in flight is discarded when it comes back
+
+POOL_SIZE = 4
+REQUEST_TIMEOUT = 5
+
+# retry policy for failed requests, delays double up to MAX_DELAY
+RETRIES = 3
+BASE_DELAY = 0.1
+MAX_DELAY = 2.0
+RETRY_STATUSES = {502, 503, 504}
+
+# how long start() keeps polling /health before giving up on the server
+READY_TIMEOUT = 10.0
+
+
+class Job:
+    __slots__ = ("method", "path", "payload", "on_success", "on_error", "key", "seq")
+
+    def __init__(self, method, path, payload, on_success, on_error, key, seq):
+        self.method = method
+        self.path = path
+        self.payload = payload
+        self.on_success = on_success # called with the decoded JSON body
+        self.on_error = on_error # called with the exception
+        self.key = key
+        self.seq = seq
+
+
+class ApiWorker:
+
+    def __init__(self, api_url, ready_timeout=READY_TIMEOUT, retries=RETRIES,
+                 base_delay=BASE_DELAY, max_delay=MAX_DELAY):
+        self.api_url = api_url.rstrip("/")
+        self.ready_timeout = ready_timeout
+        self.retries = retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+        # one pooled session, used only by the worker thread
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=POOL_SIZE)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+        self.jobs = queue.Queue()
+        self.results = queue.Queue() # (callback, argument, job)
+        self.counter = itertools.count(1)
+        self.latest = {} # key -> seq of the newest job submitted for it
+        self.latest_lock = threading.Lock()
+        self.ready = threading.Event()
+        self.stopping = threading.Event()
+        self.thread = threading.Thread(target=self.run, name="calc-api-worker", daemon=True)
+
+    def start(self):
+        self.thread.start()
+
+    def stop(self, timeout=None):
+        self.stopping.set()
+        self.jobs.put(None)
+        self.thread.join(timeout)
+        self.session.close()
+
+    def submit(self, method, path, payload=None, on_success=None, on_error=None, key=None):
+        # queues a request and returns its sequence number
+        seq = next(self.counter)
+        if key is not None:
+            with self.latest_lock:
+                self.latest[key] = seq
+        self.jobs.put(Job(method, path, payload, on_success, on_error, key, seq))
+        return seq
+
+    def cancel(self, key):
+        # drops queued and in-flight jobs submitted with key so far
+        with self.latest_lock:
+            self.latest[key] = next(self.counter)
+
+    def is_stale(self, job):
+        if job.key is None:
+            return False
+        with self.latest_lock:
+            return self.latest.get(job.key) != job.seq
+
+    def drain(self):
+        # runs callbacks of finished jobs, call from the Tk thread. returns
+        # how many callbacks ran
+        count = 0
+        while True:
+            try:
+                callback, argument, job = self.results.get_nowait()
+            except queue.Empty:
+                return count
+            if callback is not None and not self.is_stale(job):
+                callback(argument)
+                count += 1
+
+    def run(self):
+        self.wait_until_ready()
+        while True:
+            job = self.jobs.get()
+            if job is None or self.stopping.is_set():
+                return
+            if self.is_stale(job):
+                continue
+            try:
+                data = self.send(job)
+            except Exception as e:
+                self.results.put((job.on_error, e, job))
+            else:
+                if data is not None:
+                    self.results.put((job.on_success, data, job))
+
+    def wait_until_ready(self):
+        # polls /health with backoff until the server answers. jobs submitted
+        # meanwhile stay queued instead of failing
+        deadline = time.monotonic() + self.ready_timeout
+        delay = self.base_delay
+        while not self.stopping.is_set():
+            try:
+                response = self.session.get(self.api_url + "/health", timeout=REQUEST_TIMEOUT)
+                if response.status_code == 200:
+                    self.ready.set()
+                    return True
+            except requests.exceptions.RequestException:
+                pass
+            if time.monotonic() + delay > deadline:
+                return False
+            self.stopping.wait(delay)
+            delay = min(delay * 2, self.max_delay)
+        return False
+
+    def send(self, job):
+        # performs job with retries. returns the decoded JSON body, or None
+        # if the job went stale while waiting to retry
+        delay = self.base_delay
+        attempt = 0
+        while True:
+            try:
+                response = self.session.request(
+                    job.method, self.api_url + job.path,
+                    json=job.payload, timeout=REQUEST_TIMEOUT,
+                )
+                if response.status_code not in RETRY_STATUSES:
+                    return response.json()
+                error = requests.exceptions.HTTPError(
+                    f"{response.status_code} from {job.path}", response=response
+                )
+            except requests.exceptions.ConnectionError as e:
+                # the request never reached the server, always safe to resend
+                error = e
+            except requests.exceptions.Timeout as e:
+                # the server may have acted on it, only resend reads
+                if job.method != "GET":
+                    raise
+                error = e
+
+            attempt += 1
+            if attempt > self.retries or self.stopping.is_set():
+                raise error
+            if self.stopping.wait(delay) or self.is_stale(job):
+                return None
+            delay = min(delay * 2, self.max_delay)
@@ -1,16 +1,25 @@
+import argparse
 import tkinter as tk
 from tkinter import font
 import threading
-import requests
 import json
-from calc.api.main import create_app
+from calc.api.main import KeepAliveRequestHandler, create_app
+from calc.gui.client import ApiWorker
+from calc.core.errors import CalcError
+from calc.core.formatting import default_formatter
+from calc.core.incremental import IncrementalEvaluator
+from calc.core.session import CalculatorSession
+
+# how often the Tk thread picks up finished API requests, in milliseconds
+POLL_MS = 20
 
 
 class CalculatorGUI:
     # MacBook calculator style GUI
 
-    def __init__(self, root):
+    def __init__(self, root, local=False):
         # Initialize GUI
+        # local=True evaluates in process instead of through the API server
         self.root = root
         self.root.title("Calculator")
         self.root.geometry("400x500")
@@ -20,6 +29,16 @@ class CalculatorGUI:
         self.api_url = "http://localhost:5001"
         self.expression = ""
         self.just_evaluated = False  # Track if we just got a result
+        self.local = local
+        self.session = CalculatorSession() if local else None
+        # live preview of the result while typing, always computed in process
+        self.previewer = IncrementalEvaluator()
+        # API requests run on a background thread, see calc.gui.client
+        self.worker = None
+        if not local:
+            self.worker = ApiWorker(self.api_url)
+            self.worker.start()
+            self.root.after(POLL_MS, self.poll_worker)
         
         self.setup_ui()
         self.root.bind("<Key>", self.on_key_press)
@@ -47,6 +66,17 @@ class CalculatorGUI:
         )
         self.display.pack(fill=tk.BOTH, expand=True)
 
+        self.preview = tk.Label(
+            display_frame,
+            text="",
+            font=("Helvetica", 18),
+            bg="#333333",
+            fg="#a0a0a0",
+            anchor="e",
+            justify="right"
+        )
+        self.preview.pack(fill=tk.BOTH, expand=True)
+
     def create_buttons(self):
         # Button layout (MacBook style)
         button_frame = tk.Frame(self.root, bg="#333333")
@@ -143,6 +173,10 @@ class CalculatorGUI:
 
     def on_button_click(self, char):
         # Handle button clicks
+        if char not in ("=", "H"):
+            # a result for the old expression is no longer wanted
+            self.cancel_pending()
+
         if char == "C":
             self.expression = ""
             self.just_evaluated = False
@@ -209,6 +243,7 @@ class CalculatorGUI:
             self.on_button_click("C")
         elif event.keysym == "BackSpace":
             # Delete last character
+            self.cancel_pending()
             self.expression = self.expression[:-1]
             self.update_display(self.expression or "0")
             self.just_evaluated = False
@@ -221,124 +256,175 @@ class CalculatorGUI:
         self.just_evaluated = False
 
     def evaluate(self):
-        # Evaluate the expression via API
+        # Evaluate the expression in process or via API
         if not self.expression:
             return
+
+        if self.local:
+            try:
+                self.show_result(self.session.evaluate(self.expression))
+            except CalcError:
+                self.show_error("Error")
+            return
         
-        try:
-            response = requests.post(
-                f"{self.api_url}/evaluate",
-                json={"expression": self.expression},
-                timeout=5
-            )
-            data = response.json()
-            
-            if data.get("status") == "success":
-                result = data.get("result")
-                self.expression = result
-                self.update_display(result)
-                self.just_evaluated = True
-            else:
-                self.update_display("Error")
-                self.expression = ""
-                self.just_evaluated = False
-        except requests.exceptions.RequestException as e:
-            self.update_display("API Error")
-            self.expression = ""
-            self.just_evaluated = False
+        # answered later through on_evaluated or on_api_error. a newer
+        # evaluation or any edit to the expression drops this one
+        self.worker.submit(
+            "POST", "/evaluate", {"expression": self.expression},
+            on_success=self.on_evaluated, on_error=self.on_api_error, key="evaluate",
+        )
+
+    def on_evaluated(self, data):
+        if data.get("status") == "success":
+            self.show_result(data.get("result"))
+        else:
+            self.show_error("Error")
+
+    def on_api_error(self, error):
+        self.show_error("API Error")
+
+    def show_result(self, result):
+        self.expression = result
+        self.update_display(result)
+        self.just_evaluated = True
+
+    def show_error(self, text):
+        self.expression = ""
+        self.update_display(text)
+        self.just_evaluated = False
 
     def show_history(self):
         # Show history in a popup window
-        try:
-            response = requests.get(f"{self.api_url}/history", timeout=5)
-            data = response.json()
-            history = data.get("history", [])
-            
-            # Create popup window
-            history_window = tk.Toplevel(self.root)
-            history_window.title("History")
-            history_window.geometry("400x400")
-            history_window.configure(bg="#333333")
-            
-            # Title label
-            title_label = tk.Label(
+        if self.local:
+            self.open_history_window(self.session.get_history())
+            return
+
+        self.worker.submit(
+            "GET", "/history",
+            on_success=lambda data: self.open_history_window(data.get("history", [])),
+            # Show error in main display briefly
+            on_error=lambda error: self.update_display("History Error"),
+            key="history",
+        )
+
+    def poll_worker(self):
+        # runs callbacks of finished API requests on the Tk thread
+        self.worker.drain()
+        self.root.after(POLL_MS, self.poll_worker)
+
+    def cancel_pending(self):
+        if self.worker is not None:
+            self.worker.cancel("evaluate")
+
+    def open_history_window(self, history):
+        # Create popup window listing history entries
+        history_window = tk.Toplevel(self.root)
+        history_window.title("History")
+        history_window.geometry("400x400")
+        history_window.configure(bg="#333333")
+        
+        # Title label
+        title_label = tk.Label(
+            history_window,
+            text="Last 10 Calculations",
+            font=("Helvetica", 16, "bold"),
+            bg="#333333",
+            fg="white",
+            pady=10
+        )
+        title_label.pack()
+        
+        # History list
+        if not history:
+            no_history_label = tk.Label(
                 history_window,
-                text="Last 10 Calculations",
-                font=("Helvetica", 16, "bold"),
+                text="No history available",
+                font=("Helvetica", 14),
                 bg="#333333",
-                fg="white",
-                pady=10
+                fg="white"
             )
-            title_label.pack()
+            no_history_label.pack(pady=20)
+        else:
+            # Create scrollable frame
+            canvas = tk.Canvas(history_window, bg="#333333", highlightthickness=0)
+            scrollbar = tk.Scrollbar(history_window, orient="vertical", command=canvas.yview)
+            scrollable_frame = tk.Frame(canvas, bg="#333333")
             
-            # History list
-            if not history:
-                no_history_label = tk.Label(
-                    history_window,
-                    text="No history available",
-                    font=("Helvetica", 14),
-                    bg="#333333",
-                    fg="white"
-                )
-                no_history_label.pack(pady=20)
-            else:
-                # Create scrollable frame
-                canvas = tk.Canvas(history_window, bg="#333333", highlightthickness=0)
-                scrollbar = tk.Scrollbar(history_window, orient="vertical", command=canvas.yview)
-                scrollable_frame = tk.Frame(canvas, bg="#333333")
-                
-                scrollable_frame.bind(
-                    "<Configure>",
-                    lambda e: canvas.configure(scrollregion=canvas.bbox("all"))
-                )
-                
-                canvas.create_window((0, 0), window=scrollable_frame, anchor="nw")
-                canvas.configure(yscrollcommand=scrollbar.set)
+            scrollable_frame.bind(
+                "<Configure>",
+                lambda e: canvas.configure(scrollregion=canvas.bbox("all"))
+            )
+            
+            canvas.create_window((0, 0), window=scrollable_frame, anchor="nw")
+            canvas.configure(yscrollcommand=scrollbar.set)
+            
+            # Add history items
+            for i, entry in enumerate(history, 1):
+                expr = entry.get("expression", "")
+                result = entry.get("result", "")
                 
-                # Add history items
-                for i, entry in enumerate(history, 1):
-                    expr = entry.get("expression", "")
-                    result = entry.get("result", "")
-                    
-                    entry_frame = tk.Frame(scrollable_frame, bg="#333333")
-                    entry_frame.pack(fill=tk.X, padx=20, pady=5)
-                    
-                    history_label = tk.Label(
-                        entry_frame,
-                        text=f"{i}. {expr} = {result}",
-                        font=("Helvetica", 12),
-                        bg="#333333",
-                        fg="white",
-                        anchor="w"
-                    )
-                    history_label.pack(fill=tk.X)
+                entry_frame = tk.Frame(scrollable_frame, bg="#333333")
+                entry_frame.pack(fill=tk.X, padx=20, pady=5)
                 
-                canvas.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
-                scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+                history_label = tk.Label(
+                    entry_frame,
+                    text=f"{i}. {expr} = {result}",
+                    font=("Helvetica", 12),
+                    bg="#333333",
+                    fg="white",
+                    anchor="w"
+                )
+                history_label.pack(fill=tk.X)
             
-        except requests.exceptions.RequestException as e:
-            # Show error in main display briefly
-            self.update_display("History Error")
+            canvas.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+            scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
 
     def update_display(self, text):
         # Update display label
         self.display.config(text=text)
+        self.update_preview()
+
+    def update_preview(self):
+        # result of the expression typed so far. only the part of the
+        # expression after the last edit is re-parsed, so this stays cheap
+        # on every keystroke however long the expression gets
+        value = self.previewer.preview(self.expression)
+        text = "" if value is None else default_formatter.format(value)
+        if text == self.expression.strip():
+            text = ""
+        self.preview.config(text=text and "= " + text)
 
 
 def start_api_server():
-    # Start Flask API in background thread
+    # Start Flask API in background thread. HTTP/1.1 keeps the worker's
+    # pooled connections open between requests
     app = create_app()
-    app.run(debug=False, host="0.0.0.0", port=5001, use_reloader=False)
+    app.run(
+        debug=False, host="0.0.0.0", port=5001, use_reloader=False,
+        request_handler=KeepAliveRequestHandler,
+    )
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(prog="calc-gui", description="Calculator GUI")
+    parser.add_argument(
+        "--local", action="store_true",
+        help="evaluate in process without starting the API server",
+    )
+    return parser.parse_args(argv)
+
 
+def main(argv=None):
+    args = parse_args(argv)
 
-def main():
-    # Start API server in background thread
-    api_thread = threading.Thread(target=start_api_server, daemon=True)
-    api_thread.start()
+    if not args.local:
+        # Start API server in background thread
+        api_thread = threading.Thread(target=start_api_server, daemon=True)
+        api_thread.start()
     
     # Start GUI
     root = tk.Tk()
-    app = CalculatorGUI(root)
+    app = CalculatorGUI(root, local=args.local)
     root.mainloop()
 
 
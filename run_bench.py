@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+"""
+Run the microbenchmark suite and compare it against the stored baseline.
+
+    python run_bench.py                    # compare, exit 1 on regression
+    python run_bench.py --update-baseline  # record new baseline timings
+    python run_bench.py --only tokenize    # run a subset of benchmarks
+"""
+
+import argparse
+import json
+import sys
+import timeit
+from pathlib import Path
+
+# Add project root and the bench package to path
+project_root = Path(__file__).parent
+sys.path.insert(0, str(project_root))
+sys.path.insert(0, str(project_root / "tests" / "bench"))
+
+from bench_core import BENCHMARKS
+from corpus import CORPORA
+
+BASELINE_PATH = project_root / "tests" / "bench" / "baseline.json"
+
+
+def measure(run, repeat, min_time):
+    # best of `repeat` rounds, each round long enough to time reliably
+    number, _ = timeit.Timer(run).autorange()
+    number = max(1, int(number * min_time / 0.2))
+    best = min(timeit.repeat(run, number=number, repeat=repeat))
+    return best / number
+
+
+def run_suite(only=None, repeat=5, min_time=0.2):
+    # returns {"stage/corpus": microseconds per expression}
+    results = {}
+    for name, (corpora, setup) in BENCHMARKS.items():
+        if only and name not in only:
+            continue
+        for corpus in corpora:
+            exprs = CORPORA[corpus]
+            seconds = measure(setup(exprs), repeat, min_time)
+            results[f"{name}/{corpus}"] = seconds / len(exprs) * 1e6
+    return results
+
+
+def compare(results, baseline, threshold):
+    # prints a table and returns the keys that regressed past threshold
+    regressions = []
+    print(f"{'benchmark':40} {'baseline us':>12} {'current us':>12} {'change':>8}")
+    for key, current in results.items():
+        base = baseline.get(key)
+        if not base:
+            print(f"{key:40} {'-':>12} {current:12.2f} {'new':>8}")
+            continue
+        change = (current - base) / base
+        flag = ""
+        if change > threshold:
+            regressions.append(key)
+            flag = "  REGRESSION"
+        print(f"{key:40} {base:12.2f} {current:12.2f} {change:+8.1%}{flag}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Calculator microbenchmarks")
+    parser.add_argument("--update-baseline", action="store_true",
+                        help="store the timings of this run as the new baseline")
+    parser.add_argument("--threshold", type=float, default=0.3,
+                        help="allowed slowdown before failing (0.3 = 30%%)")
+    parser.add_argument("--only", nargs="+", metavar="NAME",
+                        help="only run these benchmarks")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--baseline", default=str(BASELINE_PATH))
+    args = parser.parse_args()
+
+    results = run_suite(args.only, args.repeat)
+    baseline_path = Path(args.baseline)
+
+    if args.update_baseline:
+        baseline = {}
+        if baseline_path.exists():
+            baseline = json.loads(baseline_path.read_text())
+        baseline.update(results)
+        baseline_path.write_text(json.dumps(baseline, indent=2, sort_keys=True) + "\n")
+        compare(results, {}, args.threshold)
+        print(f"Baseline written to {baseline_path}")
+        return 0
+
+    if not baseline_path.exists():
+        compare(results, {}, args.threshold)
+        print(f"No baseline at {baseline_path}, run with --update-baseline")
+        return 1
+
+    regressions = compare(results, json.loads(baseline_path.read_text()), args.threshold)
+    if regressions:
+        print(f"\n{len(regressions)} benchmark(s) regressed by more than "
+              f"{args.threshold:.0%}:")
+        for key in regressions:
+            print(f"  {key}")
+        return 1
+    print("\nNo regressions")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,137 @@
+import asyncio
+import http.client
+import threading
+from json import dumps
+from urllib.parse import urlencode
+import pytest
+
+from calc.api.async_server import AsyncApp
+from calc.api.main import create_app
+
+
+class AsyncServer:
+    # runs an AsyncApp on its own event loop thread, on a free port
+
+    def __init__(self, app):
+        self.app = app
+        self.loop = asyncio.new_event_loop()
+        self.server = self.loop.run_until_complete(app.serve("127.0.0.1", 0))
+        self.port = self.server.sockets[0].getsockname()[1]
+        self.thread = threading.Thread(target=self.loop.run_forever, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        async def shutdown():
+            # stop listening, then drop connections that are still open
+            self.server.close()
+            tasks = [t for t in asyncio.all_tasks() if t is not asyncio.current_task()]
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            await self.server.wait_closed()
+        asyncio.run_coroutine_threadsafe(shutdown(), self.loop).result(5)
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join(5)
+        self.loop.close()
+        self.app.close()
+
+
+class HttpResponse:
+
+    def __init__(self, response):
+        self.status_code = response.status
+        self.headers = response.headers
+        self.data = response.read()
+        self.mimetype = response.headers.get("Content-Type", "").split(";")[0].strip()
+
+
+class HttpClient:
+    # the parts of Flask's test client the API tests use, over one real
+    # keep-alive connection
+
+    def __init__(self, port):
+        self.connection = http.client.HTTPConnection("127.0.0.1", port, timeout=10)
+
+    def open(self, method, path, json=None, data=None, content_type=None, headers=None,
+             query_string=None):
+        headers = dict(headers or {})
+        body = data
+        if json is not None:
+            body = dumps(json)
+            content_type = content_type or "application/json"
+        if content_type is not None:
+            headers["Content-Type"] = content_type
+        if isinstance(body, str):
+            body = body.encode()
+        if query_string:
+            path += "?" + urlencode(query_string)
+        self.connection.request(method, path, body=body, headers=headers)
+        return HttpResponse(self.connection.getresponse())
+
+    def get(self, path, **kwargs):
+        return self.open("GET", path, **kwargs)
+
+    def post(self, path, **kwargs):
+        return self.open("POST", path, **kwargs)
+
+    def close(self):
+        self.connection.close()
+
+
+@pytest.fixture
+def make_async_server():
+    # make_async_server(**AsyncApp kwargs) starts an AsyncServer, those not
+    # stopped by the test are stopped afterwards
+    servers = []
+
+    def make(**kwargs):
+        server = AsyncServer(AsyncApp(**kwargs))
+        servers.append(server)
+        return server
+
+    yield make
+    for server in servers:
+        if not server.loop.is_closed():
+            server.stop()
+
+
+@pytest.fixture
+def make_http_client():
+    # make_http_client(port) connects an HttpClient, closed afterwards
+    clients = []
+
+    def make(port):
+        client = HttpClient(port)
+        clients.append(client)
+        return client
+
+    yield make
+    for client in clients:
+        client.close()
+
+
+@pytest.fixture(params=["flask", "asyncio"])
+def make_client(request):
+    # make_client(**create_app kwargs) returns a client for a fresh app on
+    # the server under test. every test using it runs against both
+    cleanup = []
+
+    def make(**kwargs):
+        if request.param == "flask":
+            app = create_app(**kwargs)
+            app.config['TESTING'] = True
+            return app.test_client()
+        server = AsyncServer(AsyncApp(**kwargs))
+        client = HttpClient(server.port)
+        cleanup.append((server, client))
+        return client
+
+    yield make
+    for server, client in cleanup:
+        client.close()
+        server.stop()
+
+
+@pytest.fixture
+def client(make_client):
+    return make_client()
@@ -1,16 +1,16 @@
 import json
+import subprocess
+import sys
+import time
+from pathlib import Path
 import pytest
 
 from calc.api.main import create_app
+from calc.core.limits import Limits
 
 
-@pytest.fixture
-def client():
-    # Create test client
-    app = create_app()
-    app.config['TESTING'] = True
-    with app.test_client() as client:
-        yield client
+# the client fixture (tests/api/conftest.py) runs every test that uses it
+# against both the Flask app and the asyncio server
 
 
 def test_api_evaluate(client):
@@ -119,3 +119,252 @@ def test_api_parentheses(client):
     assert response.status_code == 200
     data = json.loads(response.data)
     assert data["result"] == "20"
+
+
+def read_ndjson(response):
+    return [json.loads(line) for line in response.data.decode().splitlines()]
+
+
+def test_api_evaluate_batch(client):
+    response = client.post('/evaluate/batch',
+        json={"expressions": ["1 + 1", "2 * (3", "10 / 0", 5, "4 / 8"]},
+        content_type='application/json'
+    )
+    assert response.status_code == 200
+    assert response.mimetype == "application/x-ndjson"
+    records = read_ndjson(response)
+    assert [r["status"] for r in records] == ["success", "error", "error", "error", "success"]
+    assert records[0]["result"] == "2"
+    assert records[1]["code"] == "SYNTAX_ERROR"
+    assert records[2]["code"] == "MATH_ERROR"
+    assert records[4] == {"index": 4, "expression": "4 / 8", "result": "0.5", "status": "success"}
+
+    history = json.loads(client.get('/history').data)["history"]
+    assert [h["expression"] for h in history] == ["1 + 1", "4 / 8"]
+
+
+def test_api_evaluate_batch_skip_history(client):
+    client.post('/evaluate/batch',
+        json={"expressions": ["1 + 1"], "record_history": False},
+        content_type='application/json'
+    )
+    assert json.loads(client.get('/history').data)["count"] == 0
+
+
+def test_api_evaluate_batch_ndjson_body(client):
+    body = '"1 + 2"\n{"expression": "3 * 3"}\n\nnot json\n'
+    response = client.post('/evaluate/batch?record_history=false',
+        data=body,
+        content_type='application/x-ndjson'
+    )
+    records = read_ndjson(response)
+    assert [r.get("result") for r in records] == ["3", "9", None]
+    assert records[2]["status"] == "error"
+    assert json.loads(client.get('/history').data)["count"] == 0
+
+
+def test_api_evaluate_batch_missing_expressions(client):
+    response = client.post('/evaluate/batch', json={}, content_type='application/json')
+    assert response.status_code == 400
+
+
+@pytest.mark.parametrize("body", [[1], "expressions", 5])
+def test_api_evaluate_batch_body_not_an_object(client, body):
+    response = client.post('/evaluate/batch', json=body)
+    assert response.status_code == 400
+    assert json.loads(response.data)["error"] == "Missing 'expressions' list"
+
+
+def test_api_numeric_backend(client):
+    def evaluate(**data):
+        response = client.post('/evaluate', json={"expression": "2 / 3", **data})
+        return response.status_code, json.loads(response.data)
+
+    assert evaluate()[1]["result"] == "0.67"
+    assert evaluate(backend="decimal", precision=1)[1]["result"] == "0.7"
+    assert evaluate(precision=1)[1]["result"] == "0.7"
+    assert evaluate(backend="fraction")[1]["result"] == "0.67"
+    assert evaluate(backend="float")[1]["result"] == "0.67"
+    for data in [{"backend": "double"}, {"backend": "float", "precision": 5},
+                 {"precision": "high"}, {"backend": ["float"]}]:
+        status, body = evaluate(**data)
+        assert status == 400
+        assert "error" in body
+
+    response = client.post('/evaluate/batch?record_history=false&precision=1',
+        data='"2 / 3"\n', content_type='application/x-ndjson'
+    )
+    assert read_ndjson(response)[0]["result"] == "0.7"
+    response = client.post('/evaluate/batch',
+        json={"expressions": ["1"], "backend": "bogus"}, content_type='application/json'
+    )
+    assert response.status_code == 400
+
+
+def test_api_complexity_limits(make_client):
+    client = make_client(limits=Limits(max_length=50, max_depth=3, max_exponent=6))
+
+    def evaluate(expr):
+        response = client.post('/evaluate', json={"expression": expr})
+        return response.status_code, json.loads(response.data)
+
+    status, body = evaluate("1 + " * 20 + "1")
+    assert status == 413
+    assert body["error"].startswith("LIMIT_EXCEEDED")
+    assert evaluate("((((1))))")[0] == 422
+    assert evaluate("9999 * 9999")[0] == 422
+    assert evaluate("(1 + 2) * 3")[0] == 200
+
+    response = client.post('/evaluate/batch',
+        json={"expressions": ["((((1))))", "1 + 1"]}, content_type='application/json'
+    )
+    assert [r.get("code") for r in read_ndjson(response)] == ["LIMIT_EXCEEDED", None]
+
+    client = make_client(limits=None)
+    assert client.post('/evaluate', json={"expression": "9999 * 9999"}).status_code == 200
+
+
+def test_api_validate(client):
+    response = client.post('/validate', json={"expression": "2 * (3 + 4)"})
+    assert response.status_code == 200
+    assert json.loads(response.data) == {"expression": "2 * (3 + 4)", "valid": True, "problems": []}
+
+    data = json.loads(client.post('/validate', json={"expression": "2 + * (3"}).data)
+    assert data["valid"] is False
+    assert [(p["code"], p["start"], p["end"]) for p in data["problems"]] == [
+        ("SYNTAX_ERROR", 4, 5), ("SYNTAX_ERROR", 6, 7),
+    ]
+    assert client.post('/validate', json={}).status_code == 400
+    assert client.post('/validate', json={"expression": 12}).status_code == 400
+    assert client.post('/validate', json="expression").status_code == 400
+    assert client.post('/validate', json=["expression"]).status_code == 400
+
+    # validation leaves the session alone
+    assert json.loads(client.get('/history').data)["history"] == []
+
+
+def test_api_history_pagination(client):
+    for i in range(7):
+        client.post('/evaluate', json={"expression": f"{i} + 0"})
+
+    response = client.get('/history?limit=3')
+    data = json.loads(response.data)
+    assert [h["result"] for h in data["history"]] == ["0", "1", "2"]
+
+    response = client.get(f'/history?limit=3&cursor={data["next_cursor"]}')
+    data = json.loads(response.data)
+    assert [h["result"] for h in data["history"]] == ["3", "4", "5"]
+
+    response = client.get(f'/history?limit=3&cursor={data["next_cursor"]}')
+    data = json.loads(response.data)
+    assert [h["result"] for h in data["history"]] == ["6"]
+    assert data["next_cursor"] is None
+
+
+def test_api_history_search(make_client):
+    client = make_client(history_size=1000)
+    for i in range(30):
+        client.post('/evaluate', json={"expression": f"{i} * 2"})
+
+    data = json.loads(client.get('/history?q=1*&limit=2').data)
+    assert [h["expression"] for h in data["history"]] == ["11 * 2", "21 * 2"]
+    assert data["query"] == "1*"
+    data = json.loads(client.get('/history?q=2&match=prefix&limit=100').data)
+    assert data["count"] == 11
+    assert data["history"][0]["result"] == "4"
+    assert json.loads(client.get('/history?q=x').data)["count"] == 0
+    assert client.get('/history?q=1&match=fuzzy').status_code == 400
+    assert client.get('/history?q=1&limit=0').status_code == 400
+
+
+def test_api_history_etag(client):
+    client.post('/evaluate', json={"expression": "1 + 1"})
+    first = client.get('/history')
+    etag = first.headers["ETag"]
+    version = json.loads(first.data)["version"]
+    assert json.loads(first.data)["history"][0]["result"] == "2"
+
+    response = client.get('/history', headers={"If-None-Match": etag})
+    assert response.status_code == 304
+    assert response.data == b""
+    assert response.headers["ETag"] == etag
+    assert client.get('/history', headers={"If-None-Match": f'"x", W/{etag}'}).status_code == 304
+    # other query strings are different responses
+    assert client.get('/history?limit=5', headers={"If-None-Match": etag}).status_code == 200
+
+    client.post('/evaluate', json={"expression": "2 + 2"})
+    response = client.get('/history', headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.headers["ETag"] != etag
+    assert json.loads(response.data)["version"] == version + 1
+    client.post('/clear')
+    assert json.loads(client.get('/history').data)["version"] == version + 2
+
+
+def test_api_history_long_poll_times_out(client):
+    version = json.loads(client.get('/history').data)["version"]
+    start = time.monotonic()
+    response = client.get(f'/history?wait_for_version={version}&timeout=0.2')
+    assert time.monotonic() - start >= 0.2
+    assert json.loads(response.data)["version"] == version
+    # a client that is behind gets an answer right away
+    start = time.monotonic()
+    client.get(f'/history?wait_for_version={version - 1}&timeout=5')
+    assert time.monotonic() - start < 1
+    assert client.get('/history?wait_for_version=x').status_code == 400
+    assert client.get('/history?wait_for_version=1&timeout=-1').status_code == 400
+
+
+def test_api_history_bad_parameters(client):
+    assert client.get('/history?limit=abc').status_code == 400
+    assert client.get('/history?limit=0').status_code == 400
+    assert client.get('/history?since=yesterday').status_code == 400
+
+
+def test_api_durable_history(tmp_path):
+    path = str(tmp_path / "history.db")
+    app = create_app(history_path=path)
+    app.test_client().post('/evaluate', json={"expression": "6 * 7"})
+    app.config["HISTORY_LOG"].close()
+
+    app = create_app(history_path=path)
+    data = json.loads(app.test_client().get('/history').data)
+    assert data["history"][0]["result"] == "42"
+    app.config["HISTORY_LOG"].close()
+
+
+def test_api_durable_history_is_written_at_exit(tmp_path):
+    # a process that exits right after evaluating, before the writer runs
+    path = str(tmp_path / "history.db")
+    script = (
+        "from calc.api.main import create_app\n"
+        f"app = create_app(history_path={path!r})\n"
+        "app.test_client().post('/evaluate', json={'expression': '6 * 7'})\n"
+    )
+    root = Path(__file__).resolve().parents[2]
+    subprocess.run([sys.executable, "-c", script], cwd=root, check=True, timeout=30)
+
+    app = create_app(history_path=path)
+    data = json.loads(app.test_client().get('/history').data)
+    assert data["history"][0]["result"] == "42"
+    app.config["HISTORY_LOG"].close()
+
+
+def test_api_metrics_endpoint(make_client):
+    from calc.core import metrics
+    metrics.registry.clear()
+    client = make_client(enable_metrics=True)
+    try:
+        client.post('/evaluate', json={"expression": "1 + 1"})
+        client.post('/evaluate', json={"expression": "1 / 0"})
+        response = client.get('/metrics')
+    finally:
+        metrics.disable()
+        metrics.registry.clear()
+    assert response.status_code == 200
+    assert response.mimetype == "text/plain"
+    text = response.data.decode()
+    assert 'calc_errors_total{code="MATH_ERROR"} 1' in text
+    assert 'calc_http_requests_total{route="/evaluate",method="POST",status="200"} 1' in text
+    assert 'calc_http_request_seconds_count{route="/evaluate",method="POST"} 2' in text
+    assert 'calc_stage_seconds_count{stage="evaluate"}' in text
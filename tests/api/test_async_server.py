@@ -0,0 +1,185 @@
+import json
+import socket
+import threading
+import time
+import pytest
+
+from calc.api import handlers
+
+
+@pytest.fixture
+def server(make_async_server):
+    return make_async_server()
+
+
+def connect(server):
+    sock = socket.create_connection(("127.0.0.1", server.port), timeout=5)
+    return sock, sock.makefile("rb")
+
+
+def request_bytes(method, path, body=None, headers=""):
+    if body is None:
+        return f"{method} {path} HTTP/1.1\r\nHost: x\r\n{headers}\r\n".encode()
+    data = json.dumps(body).encode()
+    head = (f"{method} {path} HTTP/1.1\r\nHost: x\r\nContent-Type: application/json\r\n"
+            f"Content-Length: {len(data)}\r\n{headers}\r\n")
+    return head.encode() + data
+
+
+def read_response(stream):
+    # returns (status, headers, body) for one Content-Length response
+    status = int(stream.readline().split()[1])
+    headers = {}
+    while True:
+        line = stream.readline().decode().strip()
+        if not line:
+            break
+        name, _, value = line.partition(":")
+        headers[name.lower()] = value.strip()
+    body = stream.read(int(headers.get("content-length", 0)))
+    return status, headers, body
+
+
+def test_keep_alive_reuses_connection(server):
+    sock, stream = connect(server)
+    for expr, result in [("1 + 1", "2"), ("2 * 3", "6"), ("9 / 3", "3")]:
+        sock.sendall(request_bytes("POST", "/evaluate", {"expression": expr}))
+        status, headers, body = read_response(stream)
+        assert status == 200
+        assert headers["connection"] == "keep-alive"
+        assert json.loads(body)["result"] == result
+    sock.close()
+
+
+def test_pipelined_requests_are_answered_in_order(server):
+    sock, stream = connect(server)
+    sock.sendall(
+        request_bytes("POST", "/evaluate", {"expression": "1 + 1"})
+        + request_bytes("POST", "/evaluate", {"expression": "2 + 2"})
+        + request_bytes("GET", "/history")
+    )
+    assert json.loads(read_response(stream)[2])["result"] == "2"
+    assert json.loads(read_response(stream)[2])["result"] == "4"
+    history = json.loads(read_response(stream)[2])["history"]
+    assert [h["expression"] for h in history] == ["1 + 1", "2 + 2"]
+    sock.close()
+
+
+def test_connection_close_and_http_1_0(server):
+    sock, stream = connect(server)
+    sock.sendall(request_bytes("GET", "/health", headers="Connection: close\r\n"))
+    assert read_response(stream)[1]["connection"] == "close"
+    assert stream.read() == b""
+    sock.close()
+
+    sock, stream = connect(server)
+    sock.sendall(b"GET /health HTTP/1.0\r\n\r\n")
+    assert read_response(stream)[0] == 200
+    assert stream.read() == b""
+    sock.close()
+
+
+def test_chunked_request_body(server):
+    sock, stream = connect(server)
+    data = b'{"expression": "6 * 7"}'
+    sock.sendall(
+        b"POST /evaluate HTTP/1.1\r\nHost: x\r\nContent-Type: application/json\r\n"
+        b"Transfer-Encoding: chunked\r\n\r\n"
+        + b"%x\r\n%b\r\n" % (5, data[:5]) + b"%x\r\n%b\r\n" % (len(data) - 5, data[5:])
+        + b"0\r\n\r\n"
+    )
+    assert json.loads(read_response(stream)[2])["result"] == "42"
+    sock.close()
+
+
+def test_unknown_routes_and_methods(server):
+    sock, stream = connect(server)
+    sock.sendall(request_bytes("GET", "/nope"))
+    assert read_response(stream)[0] == 404
+    sock.sendall(request_bytes("GET", "/evaluate"))
+    status, headers, _ = read_response(stream)
+    assert status == 405
+    assert headers["allow"] == "POST"
+    sock.close()
+
+
+def test_malformed_request_closes_connection(server):
+    sock, stream = connect(server)
+    sock.sendall(b"nonsense\r\n\r\n")
+    assert read_response(stream)[0] == 400
+    assert stream.read() == b""
+    sock.close()
+
+
+def test_route_error_is_a_500(server, monkeypatch):
+    def broken():
+        raise RuntimeError("broken")
+    monkeypatch.setattr(handlers, "health", broken)
+    sock, stream = connect(server)
+    sock.sendall(request_bytes("GET", "/health") + request_bytes("GET", "/health"))
+    for _ in range(2):
+        status, _, body = read_response(stream)
+        assert status == 500
+        assert json.loads(body) == {"error": "Internal Server Error"}
+    sock.close()
+
+
+def test_body_size_limit(make_async_server):
+    server = make_async_server(max_body=16)
+    sock, stream = connect(server)
+    sock.sendall(request_bytes("POST", "/evaluate", {"expression": "1 + 1 + 1 + 1"}))
+    assert read_response(stream)[0] == 413
+    sock.close()
+
+
+def test_many_idle_connections(server):
+    idle = [socket.create_connection(("127.0.0.1", server.port)) for _ in range(1000)]
+    try:
+        sock, stream = connect(server)
+        sock.sendall(request_bytes("POST", "/evaluate", {"expression": "2 + 3"}))
+        assert json.loads(read_response(stream)[2])["result"] == "5"
+        assert server.app.connections >= 1001
+        sock.close()
+    finally:
+        for s in idle:
+            s.close()
+
+
+def test_durable_history(tmp_path, make_async_server):
+    path = str(tmp_path / "history.db")
+    server = make_async_server(history_path=path)
+    sock, stream = connect(server)
+    sock.sendall(request_bytes("POST", "/evaluate", {"expression": "6 * 7"}))
+    read_response(stream)
+    sock.close()
+    server.stop()
+
+    server = make_async_server(history_path=path)
+    sock, stream = connect(server)
+    sock.sendall(request_bytes("GET", "/history"))
+    assert json.loads(read_response(stream)[2])["history"][0]["result"] == "42"
+    sock.close()
+    server.stop()
+
+
+def test_long_poll_wakes_on_change(server, make_http_client):
+    # two connections of the same client, one waits while the other evaluates
+    headers = {"X-Session-Token": "poller"}
+    waiting, writer = make_http_client(server.port), make_http_client(server.port)
+    version = json.loads(waiting.get("/history", headers=headers).data)["version"]
+    result = {}
+
+    def poll():
+        start = time.monotonic()
+        response = waiting.get(f"/history?wait_for_version={version}&timeout=10", headers=headers)
+        result["elapsed"] = time.monotonic() - start
+        result["body"] = json.loads(response.data)
+
+    thread = threading.Thread(target=poll)
+    thread.start()
+    time.sleep(0.2)
+    writer.post("/evaluate", json={"expression": "6 * 7"}, headers=headers)
+    thread.join(5)
+    assert result["elapsed"] < 5
+    assert result["body"]["version"] == version + 1
+    assert result["body"]["history"][0]["result"] == "42"
@@ -0,0 +1,172 @@
+import http.client
+import json
+import os
+import signal
+import subprocess
+import sys
+import time
+from pathlib import Path
+import pytest
+
+pytestmark = pytest.mark.skipif(not hasattr(os, "fork"), reason="pre-fork mode needs os.fork")
+
+ROOT = Path(__file__).resolve().parents[2]
+
+
+@pytest.fixture
+def server():
+    process, port = start_server()
+    yield process, port
+    stop_server(process)
+
+
+def start_server(*args):
+    # the master forks, so it runs in its own process rather than under pytest
+    process = subprocess.Popen(
+        [sys.executable, "-m", "calc.api.prefork", "--port", "0", "--workers", "2",
+         "--heartbeat-timeout", "5", "--graceful-timeout", "5", *args],
+        cwd=ROOT, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True,
+        env={**os.environ, "PYTHONPATH": str(ROOT)},
+    )
+    line = process.stdout.readline()
+    port = int(line.split(":")[2].split()[0])
+    wait_for_workers(port, 2)
+    return process, port
+
+
+def stop_server(process):
+    if process.poll() is None:
+        process.terminate()
+        process.wait(10)
+
+
+def call(port, method, path, body=None):
+    # a new connection per call, so the kernel spreads them over workers
+    connection = http.client.HTTPConnection("127.0.0.1", port, timeout=10)
+    headers = {"Connection": "close"}
+    if body is not None:
+        headers["Content-Type"] = "application/json"
+        body = json.dumps(body)
+    connection.request(method, path, body=body, headers=headers)
+    response = connection.getresponse()
+    data = json.loads(response.read())
+    connection.close()
+    return response.status, data
+
+
+def workers(port):
+    return call(port, "GET", "/workers")[1]["workers"]
+
+
+def wait_for_workers(port, count, exclude=(), timeout=10):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            ready = [w for w in workers(port) if w["state"] == "ready" and w["pid"] not in exclude]
+            if len(ready) == count:
+                return ready
+        except (OSError, ValueError):
+            pass
+        time.sleep(0.05)
+    raise AssertionError("workers did not become ready")
+
+
+def test_history_is_shared_between_workers(server):
+    _, port = server
+    served_by = set()
+    for i in range(20):
+        status, _ = call(port, "POST", "/evaluate", {"expression": f"{i} + 0"})
+        assert status == 200
+        served_by.add(call(port, "GET", "/workers")[1]["served_by"])
+        history = call(port, "GET", "/history?limit=100")[1]["history"]
+        assert [h["result"] for h in history] == [str(n) for n in range(i + 1)]
+    assert len(served_by) == 2
+
+
+def test_history_version_is_shared_between_workers(server):
+    _, port = server
+    call(port, "POST", "/evaluate", {"expression": "1 + 1"})
+    versions = {call(port, "GET", "/history")[1]["version"] for _ in range(10)}
+    assert len(versions) == 1
+    version = versions.pop()
+    # the poll waits in one worker while the other may take the append
+    connection = http.client.HTTPConnection("127.0.0.1", port, timeout=10)
+    connection.request("GET", f"/history?wait_for_version={version}&timeout=5")
+    start = time.monotonic()
+    for _ in range(4):
+        call(port, "POST", "/evaluate", {"expression": "2 + 2"})
+    body = json.loads(connection.getresponse().read())
+    connection.close()
+    assert body["version"] > version
+    assert time.monotonic() - start < 4
+
+
+def test_worker_health_table(server):
+    _, port = server
+    call(port, "GET", "/health")
+    table = workers(port)
+    assert len(table) == 2
+    assert all(w["state"] == "ready" and w["pid"] > 0 for w in table)
+    assert sum(w["requests"] for w in table) >= 1
+
+
+def test_killed_worker_is_replaced(server):
+    _, port = server
+    victim = workers(port)[0]
+    os.kill(victim["pid"], signal.SIGKILL)
+    ready = wait_for_workers(port, 2, exclude=[victim["pid"]])
+    replacement = next(w for w in ready if w["index"] == victim["index"])
+    assert replacement["restarts"] == 1
+
+
+def test_worker_with_a_stuck_request_is_replaced():
+    # a long poll stands in for a request thread that never finishes. the
+    # worker's heartbeat thread keeps running but stops vouching for it
+    process, port = start_server(
+        "--request-timeout", "1", "--heartbeat-timeout", "2", "--graceful-timeout", "2"
+    )
+    try:
+        before = workers(port)
+        connection = http.client.HTTPConnection("127.0.0.1", port, timeout=30)
+        connection.request("GET", "/history?wait_for_version=1000&timeout=60")
+        deadline = time.monotonic() + 20
+        while time.monotonic() < deadline:
+            after = workers(port)
+            if any(w["restarts"] for w in after):
+                break
+            time.sleep(0.2)
+        else:
+            raise AssertionError("the stuck worker was not replaced")
+        replaced = next(w for w in after if w["restarts"])
+        assert replaced["pid"] != before[replaced["index"]]["pid"]
+        connection.close()
+    finally:
+        stop_server(process)
+
+
+def test_rolling_restart_keeps_serving(server):
+    process, port = server
+    call(port, "POST", "/evaluate", {"expression": "6 * 7"})
+    old = {w["pid"] for w in workers(port)}
+    process.send_signal(signal.SIGHUP)
+    deadline = time.monotonic() + 10
+    while time.monotonic() < deadline:
+        status, _ = call(port, "GET", "/health")
+        assert status == 200
+        current = {w["pid"] for w in workers(port) if w["state"] == "ready"}
+        if len(current) == 2 and not current & old:
+            break
+    else:
+        raise AssertionError("workers were not replaced")
+    # history lives in shared memory, not in the replaced workers
+    assert call(port, "GET", "/history")[1]["history"][0]["result"] == "42"
+
+
+def test_graceful_stop(server):
+    process, port = server
+    pids = [w["pid"] for w in workers(port)]
+    process.terminate()
+    assert process.wait(10) == 0
+    for pid in pids:
+        with pytest.raises(ProcessLookupError):
+            os.kill(pid, 0)
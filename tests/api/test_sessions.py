@@ -0,0 +1,150 @@
+import json
+import threading
+
+from calc.api.sessions import SessionStore, new_session
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_store_returns_same_session_per_token():
+    store = SessionStore()
+    assert store.get("a") is store.get("a")
+    assert store.get("a") is not store.get("b")
+    assert len(store) == 2
+
+
+def test_store_ttl_eviction():
+    clock = FakeClock()
+    store = SessionStore(ttl=10, shards=1, clock=clock)
+    first = store.get("a")
+    clock.now = 5
+    store.get("b")
+    clock.now = 12
+    # "a" has been idle for 12s, "b" only 7s
+    assert store.sweep() == 1
+    assert store.get("b") is not None
+    assert store.get("a") is not first
+    assert store.stats()["expired"] == 1
+
+
+def test_store_access_refreshes_ttl():
+    clock = FakeClock()
+    store = SessionStore(ttl=10, shards=1, clock=clock)
+    session = store.get("a")
+    clock.now = 8
+    store.get("a")
+    clock.now = 16
+    assert store.get("a") is session
+
+
+def test_store_max_sessions_evicts_least_recently_used():
+    store = SessionStore(max_sessions=2, shards=1)
+    store.get("a")
+    store.get("b")
+    store.get("a")
+    store.get("c")
+    assert len(store) == 2
+    stats = store.stats()
+    assert stats["evicted"] == 1
+    assert stats["created"] == 3
+
+
+def test_store_never_has_more_shards_than_sessions():
+    store = SessionStore(max_sessions=4)
+    assert len(store.shards) == 4
+    assert store.shard_capacity == 1
+
+
+def test_store_builds_sessions_outside_the_shard_lock():
+    release = threading.Event()
+
+    def factory(token):
+        if token == "slow":
+            release.wait(5)
+        return new_session(token)
+
+    store = SessionStore(shards=1, factory=factory)
+    slow = threading.Thread(target=store.get, args=("slow",))
+    slow.start()
+    other = []
+    getter = threading.Thread(target=lambda: other.append(store.get("other")))
+    getter.start()
+    getter.join(2)
+    release.set()
+    slow.join()
+    assert other
+    assert len(store) == 2
+
+
+def test_store_memory_accounting():
+    store = SessionStore()
+    empty = store.stats()["memory_bytes"]
+    store.get("a").evaluate("1 + 1")
+    store.get("a").evaluate("2 + 2")
+    assert store.stats()["memory_bytes"] > empty
+
+
+def test_store_stats_do_not_wait_for_busy_sessions():
+    store = SessionStore()
+    session = store.get("a")
+    session.evaluate("1 + 1")
+    measured = store.stats()["memory_bytes"]
+    # a batch stream holds the session's lock between lines
+    lines = session.evaluate_many(iter(["2 + 2", "3 + 3"]))
+    next(lines)
+    stats = []
+    reader = threading.Thread(target=lambda: stats.append(store.stats()))
+    reader.start()
+    reader.join(5)
+    lines.close()
+    assert stats and stats[0]["memory_bytes"] == measured
+
+
+def test_store_concurrent_clients():
+    store = SessionStore(shards=4)
+
+    def worker(n):
+        for i in range(50):
+            store.get(f"client-{n}").evaluate(f"{i} + 1")
+
+    threads = [threading.Thread(target=worker, args=(n,)) for n in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert len(store) == 8
+    assert all(len(store.get(f"client-{n}").get_history()) == 10 for n in range(8))
+
+
+def test_api_sessions_are_isolated_per_client(make_client):
+    client = make_client()
+    client.post('/evaluate', json={"expression": "1 + 1"}, headers={"X-Session-Token": "alice"})
+    client.post('/evaluate', json={"expression": "2 + 2"}, headers={"X-Session-Token": "bob"})
+    client.post('/evaluate', json={"expression": "3 + 3"}, headers={"X-Session-Token": "bob"})
+
+    alice = json.loads(client.get('/history', headers={"X-Session-Token": "alice"}).data)
+    bob = json.loads(client.get('/history', headers={"X-Session-Token": "bob"}).data)
+    assert alice["count"] == 1
+    assert bob["count"] == 2
+
+    client.post('/reset', headers={"X-Session-Token": "bob"})
+    alice = json.loads(client.get('/history', headers={"X-Session-Token": "alice"}).data)
+    assert alice["count"] == 1
+
+
+def test_api_session_stats_endpoint(make_client):
+    client = make_client(max_sessions=100)
+    for name in ["a", "b", "c"]:
+        client.post('/evaluate', json={"expression": "1 + 1"}, headers={"X-Session-Token": name})
+    response = client.get('/sessions')
+    assert response.status_code == 200
+    data = json.loads(response.data)
+    assert data["sessions"] == 3
+    assert data["max_sessions"] == 100
+    assert data["memory_bytes"] > 0
@@ -0,0 +1,276 @@
+from calc.api.main import create_app
+from calc.core.backends import get_backend
+from calc.core.expression import tokenize, convert_to_postfix, eval_postfix
+from calc.core.history import MemoryHistory
+from calc.core.incremental import IncrementalEvaluator
+from calc.core.optimizer import optimize
+from calc.core.session import CalculatorSession
+from calc.core.streaming import eval_stream
+from calc.core.validation import validate_expr
+
+# name -> (corpora it runs on, setup). setup takes a list of expressions,
+# does any untimed preparation and returns the callable that gets timed.
+# one call of that callable processes the whole corpus once
+BENCHMARKS = {}
+
+
+def benchmark(name, corpora=("short", "nested", "long_chain", "large_literal")):
+    def register(setup):
+        BENCHMARKS[name] = (corpora, setup)
+        return setup
+    return register
+
+
+@benchmark("tokenize")
+def bench_tokenize(exprs):
+    def run():
+        for expr in exprs:
+            tokenize(expr)
+    return run
+
+
+@benchmark("convert_to_postfix")
+def bench_convert_to_postfix(exprs):
+    token_lists = [tokenize(expr) for expr in exprs]
+
+    def run():
+        for tokens in token_lists:
+            convert_to_postfix(tokens)
+    return run
+
+
+@benchmark("eval_postfix")
+def bench_eval_postfix(exprs):
+    programs = [convert_to_postfix(tokenize(expr)) for expr in exprs]
+
+    def run():
+        for program in programs:
+            eval_postfix(program)
+    return run
+
+
+@benchmark("eval_stream", corpora=("nested", "long_chain"))
+def bench_eval_stream(exprs):
+    # tokenize, postfix and evaluate in one pass without the program cache,
+    # compare with tokenize + convert_to_postfix + eval_postfix
+    def run():
+        for expr in exprs:
+            eval_stream(expr)
+    return run
+
+
+@benchmark("validate")
+def bench_validate(exprs):
+    # scan and parse checks on every call, the program is cached the first
+    # time, compare with tokenize + convert_to_postfix
+    def run():
+        for expr in exprs:
+            validate_expr(expr)
+    return run
+
+
+@benchmark("optimize")
+def bench_optimize(exprs):
+    programs = [convert_to_postfix(tokenize(expr)) for expr in exprs]
+
+    def run():
+        for program in programs:
+            optimize(program)
+    return run
+
+
+@benchmark("eval_optimized")
+def bench_eval_optimized(exprs):
+    # compare with eval_postfix on the same corpus
+    programs = [optimize(convert_to_postfix(tokenize(expr)))[0] for expr in exprs]
+
+    def run():
+        for program in programs:
+            eval_postfix(program)
+    return run
+
+
+def backend_benchmark(name, backend, corpora=("short", "nested", "long_chain")):
+    # the same programs evaluated in each numeric backend, compare with
+    # eval_postfix. large_literal is left out, its values overflow float
+    @benchmark(name, corpora)
+    def bench_backend(exprs):
+        programs = [convert_to_postfix(tokenize(expr)) for expr in exprs]
+
+        def run():
+            for program in programs:
+                backend.eval_postfix(program)
+        return run
+    return bench_backend
+
+
+backend_benchmark("backend_float", get_backend("float"))
+backend_benchmark("backend_decimal", get_backend("decimal"))
+backend_benchmark("backend_decimal_50", get_backend("decimal", 50))
+backend_benchmark("backend_fraction", get_backend("fraction"))
+
+
+def dispatch_benchmark(name, symbol, right=None):
+    # one program applying symbol between all operands (or between the
+    # first and right, repeated), so the time per operand is about the cost
+    # of dispatching and applying that operator once in eval_postfix
+    @benchmark(name, corpora=("operands",))
+    def bench_dispatch(exprs):
+        expr = exprs[0] + "".join(f" {symbol} {right or operand}" for operand in exprs[1:])
+        program = convert_to_postfix(tokenize(expr))
+
+        def run():
+            eval_postfix(program)
+        return run
+    return bench_dispatch
+
+
+def call_benchmark(name, function, arity):
+    # nested calls taking one more operand each, sqrt(sqrt(a)) or
+    # min(min(a, b), c), timed like dispatch_benchmark
+    @benchmark(name, corpora=("operands",))
+    def bench_call(exprs):
+        if arity == 1:
+            expr = f"{function}(" * len(exprs) + exprs[0] + ")" * len(exprs)
+        else:
+            expr = f"{function}(" * (len(exprs) - 1) + exprs[0]
+            expr += "".join(f", {operand})" for operand in exprs[1:])
+        program = convert_to_postfix(tokenize(expr))
+
+        def run():
+            eval_postfix(program)
+        return run
+    return bench_call
+
+
+dispatch_benchmark("dispatch_add", "+")
+dispatch_benchmark("dispatch_sub", "-")
+dispatch_benchmark("dispatch_mul", "*")
+dispatch_benchmark("dispatch_div", "/")
+dispatch_benchmark("dispatch_mod", "%")
+dispatch_benchmark("dispatch_floordiv", "//")
+# a ^ 1 ^ 1 ^ ... keeps the numbers small, ^ groups to the right
+dispatch_benchmark("dispatch_pow", "^", right="1")
+call_benchmark("dispatch_sqrt", "sqrt", 1)
+call_benchmark("dispatch_abs", "abs", 1)
+call_benchmark("dispatch_min", "min", 2)
+call_benchmark("dispatch_max", "max", 2)
+
+
+@benchmark("incremental_keystroke", corpora=("short", "long_chain"))
+def bench_incremental_keystroke(exprs):
+    # one typed digit then one backspace per expression, the GUI preview
+    # path. compare with tokenize + convert_to_postfix + eval_postfix
+    evaluators = []
+    for expr in exprs:
+        evaluator = IncrementalEvaluator()
+        evaluator.evaluate(expr)
+        evaluators.append((evaluator, expr, expr + "7"))
+
+    def run():
+        for evaluator, expr, typed in evaluators:
+            evaluator.evaluate(typed)
+            evaluator.evaluate(expr)
+    return run
+
+
+@benchmark("session_evaluate")
+def bench_session_evaluate(exprs):
+    session = CalculatorSession()
+
+    def run():
+        for expr in exprs:
+            session.evaluate(expr)
+    return run
+
+
+@benchmark("history_append", corpora=("short",))
+def bench_history_append(exprs):
+    entries = [
+        {"expression": expr, "result": "0", "value": value, "timestamp": 0.0, "duration": 0.0}
+        for expr, value in zip(exprs, [eval_postfix(convert_to_postfix(tokenize(e))) for e in exprs])
+    ]
+    history = MemoryHistory(maxlen=100000)
+
+    def run():
+        for entry in entries:
+            history.append(entry)
+    return run
+
+
+@benchmark("history_search", corpora=("short",))
+def bench_history_search(exprs):
+    # a 100k entry history searched for a few expressions from the corpus
+    # and for one that is not there, which scans every entry
+    history = MemoryHistory(maxlen=100000)
+    for i in range(100000):
+        expr = exprs[i % len(exprs)]
+        history.append({"expression": expr, "result": "0", "timestamp": 0.0})
+    queries = exprs[:5] + ["no such expression"]
+
+    def run():
+        for query in queries:
+            history.search(query, limit=50)
+    return run
+
+
+@benchmark("format_result", corpora=("short", "nested", "large_literal"))
+def bench_format_result(exprs):
+    session = CalculatorSession()
+    values = [eval_postfix(convert_to_postfix(tokenize(expr))) for expr in exprs]
+
+    def run():
+        for value in values:
+            session.format_result(value)
+    return run
+
+
+def format_result_float(value):
+    # the formatter CalculatorSession used before calc.core.formatting,
+    # kept as a reference point for the Decimal based one
+    float_val = float(value)
+    if float_val == int(float_val):
+        return str(int(float_val))
+    one_decimal = round(float_val, 1)
+    if one_decimal == float_val:
+        return f"{float_val:.1f}"
+    return f"{float_val:.2f}"
+
+
+@benchmark("format_result_float", corpora=("short", "nested"))
+def bench_format_result_float(exprs):
+    # large_literal is left out, its results overflow float
+    values = [eval_postfix(convert_to_postfix(tokenize(expr))) for expr in exprs]
+
+    def run():
+        for value in values:
+            format_result_float(value)
+    return run
+
+
+@benchmark("api_evaluate", corpora=("short",))
+def bench_api_evaluate(exprs):
+    # full Flask request path through the test client, tracked separately
+    # from session_evaluate so HTTP/JSON overhead is visible on its own
+    app = create_app()
+    client = app.test_client()
+
+    def run():
+        for expr in exprs:
+            client.post("/evaluate", json={"expression": expr})
+    return run
+
+
+@benchmark("api_history", corpora=("short",))
+def bench_api_history(exprs):
+    # repeated polls of an unchanged /history, one per expression, served
+    # from the per-version response cache
+    app = create_app()
+    client = app.test_client()
+    for expr in exprs[:10]:
+        client.post("/evaluate", json={"expression": expr})
+
+    def run():
+        for _ in exprs:
+            client.get("/history")
+    return run
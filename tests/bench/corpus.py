@@ -0,0 +1,57 @@
+import random
+
+# deterministic expression corpora used by the benchmarks. each corpus is a
+# list of expressions that exercise a different shape of input
+
+SEED = 1234
+
+
+def short_expressions(count=200):
+    rng = random.Random(SEED)
+    ops = "+-*/"
+    return [
+        f"{rng.randint(1, 999)} {rng.choice(ops)} {rng.randint(1, 999)} "
+        f"{rng.choice(ops)} {rng.randint(1, 99)}.{rng.randint(0, 99)}"
+        for _ in range(count)
+    ]
+
+
+def nested_expressions(count=20, depth=60):
+    rng = random.Random(SEED + 1)
+    result = []
+    for _ in range(count):
+        expr = str(rng.randint(1, 9))
+        for _ in range(depth):
+            expr = f"({expr} {rng.choice('+-*')} {rng.randint(1, 9)})"
+        result.append(expr)
+    return result
+
+
+def long_chains(count=5, terms=2000):
+    rng = random.Random(SEED + 2)
+    return [
+        " + ".join(f"{rng.randint(1, 99)} * {rng.randint(1, 9)}" for _ in range(terms))
+        for _ in range(count)
+    ]
+
+
+def large_literals(count=50, digits=300):
+    rng = random.Random(SEED + 3)
+    def literal():
+        return "".join(rng.choice("123456789") for _ in range(digits))
+    return [f"{literal()} * {literal()} - {literal()}" for _ in range(count)]
+
+
+def operands(count=200):
+    # single numbers, joined with one operator by the dispatch benchmarks
+    rng = random.Random(SEED + 4)
+    return [f"{rng.randint(1, 9)}.{rng.randint(1, 99)}" for _ in range(count)]
+
+
+CORPORA = {
+    "short": short_expressions(),
+    "nested": nested_expressions(),
+    "long_chain": long_chains(),
+    "large_literal": large_literals(),
+    "operands": operands(),
+}
@@ -0,0 +1,35 @@
+import json
+
+from calc.bench.load import main, percentiles
+
+
+def run(capsys, *args):
+    assert main(["--concurrency", "2", *args]) == 0
+    return json.loads(capsys.readouterr().out)
+
+
+def test_request_count_and_report(capsys):
+    report = run(capsys, "--requests", "60", "--invalid-share", "0.5", "--seed", "1")
+    assert report["requests"] == 60
+    assert set(report["endpoints"]) == {"evaluate", "history"}
+    assert sum(e["requests"] for e in report["endpoints"].values()) == 60
+    latency = report["latency_ms"]
+    assert 0 < latency["p50"] <= latency["p95"] <= latency["p99"] <= latency["max"]
+    # invalid expressions are counted by CalcError code
+    assert report["errors"]
+    assert set(report["errors"]) <= {"SYNTAX_ERROR", "MATH_ERROR", "NAME_ERROR"}
+    assert report["status"]["400"] == sum(report["errors"].values())
+
+
+def test_rate_limits_requests(capsys):
+    report = run(capsys, "--workload", "history", "--rate", "40", "--duration", "0.5")
+    assert set(report["endpoints"]) == {"history"}
+    assert report["requests"] == 20
+    assert report["errors"] == {}
+
+
+def test_percentiles():
+    assert percentiles([i / 1000 for i in range(1, 101)]) == {
+        "p50": 50.0, "p95": 95.0, "p99": 99.0, "max": 100.0, "mean": 50.5,
+    }
+    assert percentiles([])["p99"] is None
@@ -0,0 +1,16 @@
+# keeps the benchmark suite runnable, timings are checked by run_bench.py
+
+from bench_core import BENCHMARKS
+from corpus import CORPORA
+
+
+def test_corpora_are_deterministic():
+    from corpus import short_expressions
+    assert short_expressions(5) == short_expressions(5)
+    assert all(CORPORA.values())
+
+
+def test_every_benchmark_runs_once():
+    for name, (corpora, setup) in BENCHMARKS.items():
+        for corpus in corpora:
+            setup(CORPORA[corpus][:2])()
@@ -0,0 +1,65 @@
+import io
+import json
+
+import pytest
+
+from calc.cli.batch import run_batch
+from calc.cli.main import main
+
+
+def run(text, fmt="tsv"):
+    out = io.StringIO()
+    report = io.StringIO()
+    count, errors, _ = run_batch(io.StringIO(text), out, fmt, report=report)
+    return out.getvalue(), count, errors, report.getvalue()
+
+
+def test_batch_tsv_output():
+    out, count, errors, _ = run("2 + 3\n(1 + 1) * 4\n")
+    assert out == "2 + 3\t5\n(1 + 1) * 4\t8\n"
+    assert (count, errors) == (2, 0)
+
+
+def test_batch_errors_do_not_stop_the_run():
+    out, count, errors, _ = run("1 / 0\n2 + + 3\n7 - 2\n")
+    lines = out.splitlines()
+    assert lines[0].startswith("1 / 0\tError: MATH_ERROR")
+    assert lines[1].startswith("2 + + 3\tError: SYNTAX_ERROR")
+    assert lines[2] == "7 - 2\t5"
+    assert (count, errors) == (3, 2)
+
+
+def test_batch_overflow_does_not_stop_the_run(tmp_path, capsys):
+    path = tmp_path / "exprs.txt"
+    path.write_text("1 + 1\n10 ^ 999999 * 10\n2 * 3\n")
+    with pytest.raises(SystemExit):
+        main(["--file", str(path)])
+    lines = capsys.readouterr().out.splitlines()
+    assert lines[0] == "1 + 1\t2"
+    assert lines[1] == "10 ^ 999999 * 10\tError: MATH_ERROR: Result is too large"
+    assert lines[2] == "2 * 3\t6"
+
+
+def test_batch_jsonl_output_keeps_line_numbers():
+    out, _, _, _ = run("1 + 1\n\n   \n10 / 0\n", fmt="jsonl")
+    records = [json.loads(line) for line in out.splitlines()]
+    assert records[0] == {"line": 1, "expression": "1 + 1", "result": "2"}
+    assert records[1]["line"] == 4
+    assert records[1]["code"] == "MATH_ERROR"
+
+
+def test_batch_reports_throughput():
+    _, _, _, report = run("1 + 1\n")
+    assert "Processed 1 expressions (0 errors)" in report
+    assert "expr/s" in report
+
+
+def test_main_file_option(tmp_path, capsys):
+    path = tmp_path / "exprs.txt"
+    path.write_text("3 * 3\n4 / 0\n")
+    with pytest.raises(SystemExit) as exc:
+        main(["--file", str(path)])
+    assert exc.value.code == 1
+    captured = capsys.readouterr()
+    assert captured.out.splitlines()[0] == "3 * 3\t9"
+    assert "Processed 2 expressions (1 errors)" in captured.err
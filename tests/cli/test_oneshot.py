@@ -0,0 +1,71 @@
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+from calc.__main__ import main
+
+ROOT = Path(__file__).resolve().parents[2]
+
+# cumulative import time of everything `python -m calc EXPR` imports after
+# interpreter startup, in microseconds. it is a few ms, the slack is for
+# slow machines
+IMPORT_BUDGET_US = 50000
+
+# none of these belong on the one-shot path
+HEAVY_MODULES = ("flask", "werkzeug", "requests", "tkinter", "numpy", "sqlite3",
+                 "argparse", "calc.core.session", "calc.core.history", "calc.api")
+
+
+def run_calc(*args):
+    return subprocess.run(
+        [sys.executable, "-X", "importtime", "-m", "calc", *args],
+        cwd=ROOT, capture_output=True, text=True,
+        env={**os.environ, "PYTHONPATH": str(ROOT)},
+    )
+
+
+def imports_after_startup(stderr):
+    # (module, nesting depth, cumulative us) for imports after site, the
+    # last module the interpreter imports by itself
+    rows = []
+    for line in stderr.splitlines()[1:]: # header
+        if line.startswith("import time:"):
+            _, cumulative, name = line.split("|")
+            depth = (len(name) - len(name.lstrip())) // 2
+            rows.append((name.strip(), depth, int(cumulative)))
+    site = max(i for i, (name, depth, _) in enumerate(rows) if name == "site" and depth == 0)
+    return rows[site + 1:]
+
+
+def test_one_shot_import_budget():
+    process = run_calc("2 + 3 * 4")
+    assert process.returncode == 0
+    assert process.stdout == "14\n"
+
+    rows = imports_after_startup(process.stderr)
+    modules = {name for name, _, _ in rows}
+    assert "calc.cli.oneshot" in modules
+    heavy = [m for m in modules if m.startswith(HEAVY_MODULES)]
+    assert heavy == []
+    total = sum(cumulative for _, depth, cumulative in rows if depth == 0)
+    assert total < IMPORT_BUDGET_US
+
+
+def test_one_shot_error_exit_code():
+    process = run_calc("1 / 0")
+    assert process.returncode == 1
+    assert process.stdout == ""
+    assert "Division by zero" in process.stderr
+
+
+def test_arguments_are_joined(capsys):
+    assert main(["-3", "+", "1"]) == 0
+    assert capsys.readouterr().out == "-2\n"
+
+
+def test_syntax_error(capsys):
+    assert main(["2 * (3"]) == 1
+    captured = capsys.readouterr()
+    assert captured.out == ""
+    assert captured.err.startswith("Error: ")
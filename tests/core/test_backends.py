@@ -0,0 +1,59 @@
+from decimal import Decimal
+from fractions import Fraction
+import pytest
+
+from calc.core.backends import get_backend
+from calc.core.errors import CalcMathError, CalcSyntaxError
+from calc.core.expression import eval_expr
+from calc.core.session import CalculatorSession
+
+
+def test_float_backend():
+    backend = get_backend("float")
+    result = eval_expr("0.1 + 0.2", backend=backend)
+    assert isinstance(result, float)
+    assert result == 0.1 + 0.2
+    assert backend.to_decimal(result) == Decimal("0.30000000000000004")
+
+
+def test_fraction_backend_is_exact():
+    backend = get_backend("fraction")
+    assert eval_expr("1 / 3 * 3", backend=backend) == 1
+    assert eval_expr("0.1 + 0.2", backend=backend) == Fraction(3, 10)
+    assert eval_expr("-(1 / 3) + x", {"x": 1}, backend) == Fraction(2, 3)
+
+
+def test_decimal_backend_precision():
+    assert eval_expr("1 / 3", backend=get_backend("decimal", 5)) == Decimal("0.33333")
+    assert eval_expr("1 / 3", backend=get_backend("decimal")) == eval_expr("1 / 3")
+    # literals are rounded to the precision too
+    assert eval_expr("1.23456789 + 0", backend=get_backend("decimal", 3)) == Decimal("1.23")
+
+
+@pytest.mark.parametrize("name", ["float", "decimal", "fraction"])
+def test_backends_share_errors(name):
+    backend = get_backend(name)
+    with pytest.raises(CalcMathError, match="Division by zero"):
+        eval_expr("1 / (2 - 2)", backend=backend)
+    with pytest.raises(CalcSyntaxError, match="missing operand"):
+        eval_expr("1 +", backend=backend)
+    assert eval_expr("2 * (3 + 4) - -1", backend=backend) == 15
+
+
+def test_get_backend():
+    assert get_backend("decimal", 10) is get_backend("decimal", 10)
+    for name, precision in [("double", None), ("float", 10), ("decimal", 0), ("decimal", 2.5),
+                            (["float"], None)]:
+        with pytest.raises(ValueError):
+            get_backend(name, precision)
+
+
+def test_session_backend():
+    session = CalculatorSession(backend="fraction")
+    assert session.evaluate("1 / 3 * 3") == "1"
+    assert session.current_value == Decimal(1)
+    # per call override
+    assert session.evaluate("1 / 3", backend=get_backend("decimal", 2)) == "0.33"
+    results = list(session.evaluate_many(["0.1 + 0.2", "1 / 0"], backend="float"))
+    assert results[0][1] == "0.3"
+    assert isinstance(results[1][2], CalcMathError)
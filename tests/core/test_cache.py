@@ -0,0 +1,98 @@
+from decimal import Decimal
+import threading
+import pytest
+
+from calc.core import expression
+from calc.core.cache import ProgramCache, normalize_expr
+from calc.core.errors import CalcSyntaxError
+from calc.core.expression import eval_expr, cache_info, clear_cache
+from calc.core.session import CalculatorSession
+
+
+@pytest.fixture(autouse=True)
+def fresh_cache():
+    clear_cache()
+    yield
+    clear_cache()
+
+
+def test_normalize_expr():
+    assert normalize_expr("  2 +   3 ") == "2 + 3"
+    assert normalize_expr("1 2") != normalize_expr("12")
+
+
+def test_repeat_evaluation_hits_cache():
+    assert eval_expr("2 + 3 * 4") == Decimal("14")
+    assert eval_expr(" 2 + 3  * 4 ") == Decimal("14")
+    info = cache_info()
+    assert info["misses"] == 1
+    assert info["hits"] == 1
+    assert info["size"] == 1
+
+
+def test_cache_hit_skips_parsing(monkeypatch):
+    eval_expr("7 - 2")
+
+    def fail(expr):
+        raise AssertionError("tokenize called on cache hit")
+
+    monkeypatch.setattr(expression, "tokenize", fail)
+    assert eval_expr("7 - 2") == Decimal("5")
+
+
+def test_errors_are_not_cached():
+    for _ in range(2):
+        with pytest.raises(CalcSyntaxError):
+            eval_expr("(2 + 3")
+    assert cache_info()["size"] == 0
+
+
+def test_lru_eviction():
+    cache = ProgramCache(maxsize=2)
+    cache.put("a", 1)
+    cache.put("b", 2)
+    cache.get("a")
+    cache.put("c", 3)
+    assert "a" in cache
+    assert "b" not in cache
+    assert cache.info()["evictions"] == 1
+
+
+def test_resize_shrinks_cache():
+    cache = ProgramCache(maxsize=4)
+    for key in "abcd":
+        cache.put(key, key)
+    cache.resize(1)
+    assert len(cache) == 1
+    assert "d" in cache
+    assert cache.info()["evictions"] == 3
+
+
+def test_zero_size_disables_cache():
+    cache = ProgramCache(maxsize=0)
+    cache.put("a", 1)
+    assert cache.get("a") is None
+
+
+def test_concurrent_access():
+    cache = ProgramCache(maxsize=8)
+
+    def worker(n):
+        for i in range(500):
+            cache.put(f"{n}-{i % 16}", i)
+            cache.get(f"{n}-{i % 16}")
+
+    threads = [threading.Thread(target=worker, args=(n,)) for n in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert len(cache) == 8
+
+
+def test_session_reset_clears_cache():
+    session = CalculatorSession()
+    session.evaluate("1 + 1")
+    assert cache_info()["size"] == 1
+    session.reset()
+    assert cache_info()["size"] == 0
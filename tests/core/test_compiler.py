@@ -0,0 +1,60 @@
+from decimal import Decimal
+import threading
+import pytest
+
+from calc.core.compiler import compile_expr
+from calc.core.errors import CalcSyntaxError, CalcMathError, CalcNameError
+from calc.core.expression import eval_expr
+
+
+def test_compile_matches_eval_expr():
+    for expr in ["2 + 3 * 4", "(2 + 3) * 4", "-(3 + 2)", "10 + -5",
+                 "10.5 / 2", "--4", "7", "(((1 + 2) * 3) / 9)"]:
+        assert compile_expr(expr)() == eval_expr(expr)
+
+
+def test_compiled_callable_is_reusable():
+    fn = compile_expr("1.5 * 2")
+    assert fn() == Decimal("3.0")
+    assert fn() == Decimal("3.0")
+
+
+def test_compiled_division_by_zero():
+    fn = compile_expr("1 / (2 - 2)")
+    with pytest.raises(CalcMathError):
+        fn()
+
+
+def test_compile_syntax_errors():
+    with pytest.raises(CalcSyntaxError):
+        compile_expr("2 + + 3")
+    with pytest.raises(CalcSyntaxError):
+        compile_expr("(2 + 3")
+
+
+def test_compile_long_expression():
+    expr = " + ".join(["1"] * 5000)
+    assert compile_expr(expr)() == Decimal("5000")
+
+
+def test_compiled_callable_shared_between_threads():
+    fn = compile_expr("10 / 4 - 0.5")
+    results = []
+
+    def worker():
+        for _ in range(200):
+            results.append(fn())
+
+    threads = [threading.Thread(target=worker) for _ in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert set(results) == {Decimal("2.0")}
+
+
+def test_compiled_variables():
+    fn = compile_expr("x * x - y")
+    assert fn(x=3, y=Decimal("0.5")) == Decimal("8.5")
+    with pytest.raises(CalcNameError):
+        fn(x=3)
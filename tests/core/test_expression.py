@@ -1,8 +1,8 @@
 from decimal import Decimal
 import pytest
 
-from calc.core.expression import eval_expr
-from calc.core.errors import CalcSyntaxError, CalcMathError
+from calc.core.expression import eval_expr, tokenize
+from calc.core.errors import CalcSyntaxError, CalcMathError, CalcNameError
 
 
 def test_basic_addition():
@@ -71,3 +71,41 @@ def test_invalid_syntax():
         eval_expr("2 + + 3")
     with pytest.raises(CalcSyntaxError):
         eval_expr("* 5")
+
+
+def test_tokenize_constant_pool():
+    tokens = tokenize("1.5 + 1.5 * 2")
+    numbers = [t for t in tokens if t.kind == "NUMBER"]
+    assert numbers[0].value == Decimal("1.5")
+    # the same literal is parsed once and shared
+    assert numbers[0].value is numbers[1].value
+
+
+def test_tokenize_positions():
+    tokens = tokenize(" 12 +(3.5)")
+    assert [(t.kind, t.pos) for t in tokens] == [
+        ("NUMBER", 1), ("OP", 4), ("LPAREN", 5), ("NUMBER", 6), ("RPAREN", 9)
+    ]
+
+
+def test_tokenize_error_messages():
+    cases = {
+        "1.2.3": "Invalid number near: 1.2.",
+        "2 + .": "Invalid number '.'",
+        "2 $ 3": "Unexpected character: '$'",
+        "12²": "Invalid number: 12²",
+    }
+    for expr, message in cases.items():
+        with pytest.raises(CalcSyntaxError) as exc:
+            tokenize(expr)
+        assert exc.value.message == message
+
+
+def test_variables():
+    assert eval_expr("x * 2 + y", {"x": 3, "y": Decimal("0.5")}) == Decimal("6.5")
+    assert eval_expr("-rate * 10", {"rate": 0.1}) == Decimal("-1.0")
+
+
+def test_unknown_variable():
+    with pytest.raises(CalcNameError):
+        eval_expr("x + 1")
@@ -0,0 +1,69 @@
+from decimal import Decimal
+import pytest
+
+from calc.core.formatting import ResultFormatter
+from calc.core.session import CalculatorSession
+
+
+def fmt(value, **options):
+    return ResultFormatter(**options).format(Decimal(value))
+
+
+def test_auto_policy_matches_legacy_rule():
+    assert fmt("14") == "14"
+    assert fmt("2.5") == "2.5"
+    assert fmt("3.333333") == "3.33"
+    assert fmt("5.000") == "5"
+    assert fmt("-0.001") == "-0.00"
+    assert fmt("-0") == "0"
+
+
+def test_auto_policy_treats_rounding_noise_as_whole():
+    assert ResultFormatter().format(Decimal(10) / 3 * 3) == "10"
+
+
+def test_auto_policy_keeps_large_integers_exact():
+    assert fmt("12345678901234567") == "12345678901234567"
+
+
+def test_huge_results_do_not_overflow():
+    session = CalculatorSession()
+    huge = "9" * 250
+    # the product is rounded to 28 significant digits by the decimal context
+    result = session.evaluate(f"{huge} * {huge}")
+    assert result == "1" + "0" * 500
+
+
+def test_fixed_policy():
+    assert fmt("2.5", policy="fixed", places=3) == "2.500"
+    assert fmt("0", policy="fixed") == "0.00"
+
+
+def test_significant_policy():
+    assert fmt("123456.789", policy="significant", digits=3) == "123000"
+    assert fmt("0.000123456", policy="significant", digits=2) == "0.00012"
+
+
+def test_scientific_policy():
+    assert fmt("123456.789", policy="scientific", digits=3) == "1.23E+5"
+    assert fmt("0", policy="scientific", digits=2) == "0.0E+0"
+
+
+def test_sci_exponent_switches_huge_and_tiny_values():
+    assert fmt("1e400", sci_exponent=15) == "1.00000E+400"
+    assert fmt("1e-20", sci_exponent=15, digits=2) == "1.0E-20"
+    assert fmt("12.5", sci_exponent=15) == "12.5"
+
+
+def test_non_finite_values():
+    assert fmt("NaN") == "NaN"
+
+
+def test_invalid_policy():
+    with pytest.raises(ValueError):
+        ResultFormatter(policy="roman")
+
+
+def test_session_uses_its_formatter():
+    session = CalculatorSession(formatter=ResultFormatter(policy="fixed", places=4))
+    assert session.evaluate("1 / 4") == "0.2500"
@@ -0,0 +1,219 @@
+import sqlite3
+import time
+from decimal import Decimal
+
+import pytest
+
+from calc.core.history import HistoryLog, MemoryHistory, SQLiteHistory
+from calc.core.session import CalculatorSession
+
+
+def entry(expression, result, timestamp):
+    return {"expression": expression, "result": result, "timestamp": timestamp}
+
+
+@pytest.fixture
+def log(tmp_path):
+    log = HistoryLog(str(tmp_path / "history.db"), flush_interval=0.01)
+    yield log
+    log.close()
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def backend(request, tmp_path):
+    if request.param == "memory":
+        yield MemoryHistory(maxlen=100)
+        return
+    log = HistoryLog(str(tmp_path / "history.db"))
+    yield SQLiteHistory(log, "client")
+    log.close()
+
+
+def test_recent_returns_last_entries(backend):
+    for i in range(15):
+        backend.append(entry(f"{i} + 1", str(i + 1), float(i)))
+    recent = backend.recent(10)
+    assert len(recent) == 10
+    assert recent[0]["expression"] == "5 + 1"
+    assert recent[-1]["result"] == "15"
+
+
+def test_page_with_cursor(backend):
+    for i in range(5):
+        backend.append(entry(f"{i}", str(i), float(i)))
+    first, cursor = backend.page(limit=2)
+    assert [e["expression"] for e in first] == ["0", "1"]
+    second, cursor = backend.page(cursor=cursor, limit=2)
+    assert [e["expression"] for e in second] == ["2", "3"]
+    last, cursor = backend.page(cursor=cursor, limit=2)
+    assert [e["expression"] for e in last] == ["4"]
+    assert cursor is None
+
+
+def test_page_time_range(backend):
+    for i in range(10):
+        backend.append(entry(f"{i}", str(i), float(i)))
+    entries, _ = backend.page(since=3.0, until=6.0)
+    assert [e["timestamp"] for e in entries] == [3.0, 4.0, 5.0]
+
+
+def test_memory_history_time_range_is_bisected():
+    history = MemoryHistory(maxlen=200000)
+    for i in range(200000):
+        history.append(entry("1", "1", float(i)))
+    located = []
+    locate = history.locate
+    history.locate = lambda index: located.append(index) or locate(index)
+    entries, cursor = history.page(since=199990.0, limit=5)
+    assert [e["timestamp"] for e in entries] == [199990.0 + i for i in range(5)]
+    assert history.page(cursor=cursor, since=199990.0, until=199997.0)[0][-1]["timestamp"] == 199996.0
+    assert history.page(since=300000.0) == ([], None)
+    assert history.page(until=-1.0) == ([], None)
+    # a couple of bisects, not a walk over the entries before the range
+    assert len(located) < 200
+
+
+def test_clear(backend):
+    backend.append(entry("1", "1", 1.0))
+    backend.clear()
+    assert len(backend) == 0
+    assert backend.recent(10) == []
+
+
+def test_search(backend):
+    for i, expr in enumerate(["1 + 2", "x * 3", "12+5", "2 * (1 + 2)"]):
+        backend.append(entry(expr, "0", float(i)))
+    assert [e["expression"] for e in backend.search("1+2")] == ["1 + 2", "2 * (1 + 2)"]
+    assert [e["expression"] for e in backend.search("1", prefix=True)] == ["1 + 2", "12+5"]
+    assert [e["expression"] for e in backend.search("1", limit=1)] == ["2 * (1 + 2)"]
+    assert backend.search("y") == []
+
+
+def test_memory_history_is_bounded():
+    history = MemoryHistory(maxlen=3)
+    for i in range(5):
+        history.append(entry(f"{i}", str(i), float(i)))
+    assert [e["id"] for e in history.recent()] == [3, 4, 5]
+
+
+def test_memory_history_ring():
+    # several blocks, wrapped around more than once
+    history = MemoryHistory(maxlen=2500)
+    for i in range(6000):
+        history.append({"expression": f"{i} + 0", "result": str(i), "value": Decimal(i),
+                        "timestamp": float(i), "duration": 0.001})
+    assert len(history) == 2500
+    assert [e["id"] for e in history.recent(3)] == [5998, 5999, 6000]
+    assert history.recent(1)[0]["result"] == "5999"
+    assert history.recent(1)[0]["duration"] == 0.001
+    entries, cursor = history.page(cursor=5000, limit=10)
+    assert [e["id"] for e in entries] == list(range(5001, 5011))
+    assert cursor == 5010
+    # ids that dropped out start the page at the oldest entry
+    assert history.page(cursor=10, limit=1)[0][0]["id"] == 3501
+    assert [e["id"] for e in history.search("3500+", prefix=True)] == [3501]
+    assert history.search("3499", prefix=True) == []
+    assert [e["id"] for e in history.search("999+")] == [4000, 5000, 6000]
+    assert [e["id"] for e in history.search("5+0", limit=2)] == [5986, 5996]
+
+
+def test_memory_history_formats_on_read():
+    session = CalculatorSession()
+    session.evaluate("1 / 3")
+    stored = session.history.blocks[0].values[0]
+    assert stored == Decimal(1) / Decimal(3)
+    assert session.get_history()[0]["result"] == "0.33"
+
+
+def test_sqlite_history_survives_restart(tmp_path):
+    path = str(tmp_path / "history.db")
+    log = HistoryLog(path)
+    session = CalculatorSession(history=SQLiteHistory(log, "alice"))
+    session.evaluate("2 + 3")
+    session.evaluate("4 * 4")
+    log.close()
+
+    log = HistoryLog(path)
+    history = SQLiteHistory(log, "alice").recent()
+    assert [(e["expression"], e["result"]) for e in history] == [("2 + 3", "5"), ("4 * 4", "16")]
+    # ids keep increasing after a restart
+    SQLiteHistory(log, "alice").append(entry("1", "1", 1.0))
+    assert SQLiteHistory(log, "alice").recent(1)[0]["id"] == 3
+    log.close()
+
+
+def test_sqlite_history_write_behind(log):
+    history = SQLiteHistory(log, "bob")
+    history.append(entry("1 + 1", "2", time.time()))
+    # the append is buffered until the writer thread runs or a read flushes
+    deadline = time.time() + 2
+    while log.pending and time.time() < deadline:
+        time.sleep(0.01)
+    assert not log.pending
+    assert len(history) == 1
+
+
+def test_entries_have_the_same_shape(backend):
+    backend.append({**entry("1 + 1", "2", 1.0), "duration": 0.25})
+    stored = backend.recent(1)[0]
+    assert sorted(stored) == ["duration", "expression", "id", "result", "timestamp"]
+    assert stored["duration"] == 0.25
+
+
+def test_sqlite_logs_share_a_file(tmp_path):
+    # two processes' logs on one file, ids come from the database
+    path = str(tmp_path / "history.db")
+    first, second = HistoryLog(path), HistoryLog(path)
+    for i in range(5):
+        first.append("a", entry(f"{i}", "0", float(i)))
+        second.append("b", entry(f"{i}", "0", float(i)))
+        first.flush()
+        second.flush()
+    ids = [e["id"] for e in first.recent("a", 10) + first.recent("b", 10)]
+    assert sorted(ids) == list(range(1, 11))
+    first.close()
+    second.close()
+
+
+def test_sqlite_log_without_duration_column(tmp_path):
+    path = str(tmp_path / "history.db")
+    db = sqlite3.connect(path)
+    db.execute(
+        "CREATE TABLE history (id INTEGER PRIMARY KEY, client TEXT NOT NULL,"
+        " timestamp REAL NOT NULL, expression TEXT NOT NULL, result TEXT NOT NULL)"
+    )
+    db.execute("INSERT INTO history VALUES (1, 'a', 1.0, '1 + 1', '2')")
+    db.commit()
+    db.close()
+    log = HistoryLog(path)
+    log.append("a", {**entry("2 + 2", "4", 2.0), "duration": 0.5})
+    assert [(e["id"], e["duration"]) for e in log.recent("a", 10)] == [(1, 0.0), (2, 0.5)]
+    log.close()
+
+
+def test_sqlite_history_failed_flush_keeps_rows(log):
+    log.db.execute("PRAGMA busy_timeout = 10")
+    other = sqlite3.connect(log.path, isolation_level=None)
+    other.execute("BEGIN EXCLUSIVE")
+    SQLiteHistory(log, "bob").append(entry("1 + 1", "2", 1.0))
+    with pytest.raises(sqlite3.OperationalError):
+        log.flush()
+    # the writer thread keeps retrying while the database is locked
+    time.sleep(0.1)
+    assert len(log.pending) == 1
+    assert log.writer.is_alive()
+    other.execute("COMMIT")
+    other.close()
+    deadline = time.time() + 2
+    while log.pending and time.time() < deadline:
+        time.sleep(0.01)
+    assert not log.pending
+    assert len(SQLiteHistory(log, "bob")) == 1
+
+
+def test_sqlite_history_clients_are_separate(log):
+    SQLiteHistory(log, "a").append(entry("1", "1", 1.0))
+    SQLiteHistory(log, "b").append(entry("2", "2", 2.0))
+    SQLiteHistory(log, "b").clear()
+    assert len(SQLiteHistory(log, "a")) == 1
+    assert len(SQLiteHistory(log, "b")) == 0
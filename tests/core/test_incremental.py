@@ -0,0 +1,92 @@
+from decimal import Decimal
+import pytest
+
+from calc.core.errors import CalcError, CalcMathError, CalcNameError, CalcSyntaxError
+from calc.core.expression import eval_expr, scan_tokens, tokenize
+from calc.core.incremental import IncrementalEvaluator
+
+
+def outcome(func, text):
+    try:
+        return func(text)
+    except CalcError as e:
+        return type(e), e.message
+
+
+def test_typing_matches_eval_expr():
+    ev = IncrementalEvaluator()
+    target = "(12.5 + 3) * -2 / (4 - 1.5) - 7"
+    for i in range(1, len(target) + 1):
+        text = target[:i]
+        assert outcome(ev.evaluate, text) == outcome(eval_expr, text)
+    assert ev.evaluate(target) == eval_expr(target)
+
+
+def test_deleting_and_inserting_matches_eval_expr():
+    ev = IncrementalEvaluator()
+    edits = ["1 + 2 * 3", "1 + 2 * 3 +", "1 + 2 *", "1 + 25 *", "1 + 25 * 4",
+             "(1 + 25 * 4", "(1 + 25) * 4", "-(1 + 25) * 4", "9", ""]
+    for text in edits:
+        assert outcome(ev.evaluate, text) == outcome(eval_expr, text)
+
+
+def test_operators_and_functions_match_eval_expr():
+    ev = IncrementalEvaluator()
+    target = "-2 ^ 3 ^ 2 + max(7 // 2, abs(-4), 1) % 3 - sqrt(16)"
+    for i in range(1, len(target) + 1):
+        text = target[:i]
+        assert outcome(ev.evaluate, text) == outcome(eval_expr, text)
+    for text in ["sqrt(1, 2)", "min()", "1, 2", "abs 4", "2 + abs", "1 % 0",
+                 "2 min(1,)", "2 min(, 1)", "2 (1 +)", "2()"]:
+        assert outcome(ev.evaluate, text) == outcome(eval_expr, text)
+
+
+def test_prefix_tokens_are_reused():
+    ev = IncrementalEvaluator()
+    ev.evaluate("1 + 2 + 3")
+    first = ev.tokens[0]
+    ev.evaluate("1 + 2 + 34")
+    assert ev.tokens[0] is first
+    assert ev.tokens[-1].value == Decimal("34")
+
+
+def test_parse_errors_win_over_math_errors():
+    ev = IncrementalEvaluator()
+    with pytest.raises(CalcSyntaxError, match="Mismatched parentheses"):
+        ev.evaluate("1 / 0 + (2")
+    with pytest.raises(CalcMathError):
+        ev.evaluate("1 / 0 + (2)")
+
+
+def test_recovers_after_scan_error():
+    ev = IncrementalEvaluator()
+    with pytest.raises(CalcSyntaxError):
+        ev.evaluate("2 + $")
+    assert ev.evaluate("2 + 3") == Decimal("5")
+
+
+def test_variables():
+    ev = IncrementalEvaluator({"x": 4})
+    assert ev.evaluate("x * 2") == Decimal("8")
+    with pytest.raises(CalcNameError):
+        ev.evaluate("y * 2")
+
+
+def test_preview_returns_none_for_incomplete_input():
+    ev = IncrementalEvaluator()
+    assert ev.preview("2 +") is None
+    assert ev.preview("") is None
+    assert ev.preview("2 + 3") == Decimal("5")
+
+
+def test_long_expression():
+    ev = IncrementalEvaluator()
+    text = " + ".join(["1"] * 5000)
+    assert ev.evaluate(text) == Decimal("5000")
+    assert ev.evaluate(text + "0") == Decimal("5009")
+
+
+def test_scan_tokens_from_offset():
+    tokens = scan_tokens("12 + 3", 2)
+    assert [t.value for t in tokens[:1]] == ["+"]
+    assert [t.pos for t in tokens] == [t.pos for t in tokenize("12 + 3")[1:]]
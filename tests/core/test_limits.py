@@ -0,0 +1,60 @@
+import time
+from decimal import Decimal
+import pytest
+
+from calc.core.backends import get_backend
+from calc.core.errors import CalcLimitError, CalcTimeoutError
+from calc.core.expression import eval_expr
+from calc.core.limits import Limits
+from calc.core.session import CalculatorSession
+
+
+@pytest.mark.parametrize("expr, limit", [
+    ("1 + " * 30 + "1", "length"),
+    ("1+" * 20 + "1", "tokens"),
+    ("12345678901 + 1", "digits"),
+    ("1234.5678901 + 1", "digits"),
+    ("(" * 6 + "1" + ")" * 6, "depth"),
+    ("99999 * 99999", "magnitude"),
+])
+def test_input_limits(expr, limit):
+    limits = Limits(max_length=100, max_tokens=30, max_digits=10, max_depth=5, max_exponent=9)
+    with pytest.raises(CalcLimitError) as info:
+        eval_expr(expr, limits=limits)
+    assert info.value.limit == limit
+    assert info.value.code == "LIMIT_EXCEEDED"
+
+
+def test_within_limits():
+    limits = Limits(max_length=100, max_tokens=30, max_digits=10, max_depth=5, max_exponent=9)
+    assert eval_expr("((((1 + 2)))) * 3 + (4) * (5)", limits=limits) == 29
+    assert eval_expr("1 / 3", limits=limits) == eval_expr("1 / 3")
+    assert eval_expr("1 / 3", backend=get_backend("fraction"), limits=limits) * 3 == 1
+    # any limit can be turned off
+    assert eval_expr("1" * 50, limits=Limits(max_digits=None)) == Decimal("1" * 50)
+
+
+def test_deadline():
+    limits = Limits(timeout=0)
+    with pytest.raises(CalcTimeoutError) as info:
+        eval_expr("1 + 2 + 3", limits=limits)
+    assert info.value.code == "TIMEOUT"
+    assert info.value.limit == "time"
+    assert eval_expr("1 + 2 + 3", limits=Limits(timeout=None)) == 6
+
+
+def test_pathological_input_is_rejected_quickly():
+    limits = Limits()
+    start = time.perf_counter()
+    for expr in ["(" * 100000 + "1" + ")" * 100000, "9" * 5000000, "1+" * 1000000 + "1"]:
+        with pytest.raises(CalcLimitError):
+            eval_expr(expr, limits=limits)
+    assert time.perf_counter() - start < 1.0
+
+
+def test_session_limits():
+    session = CalculatorSession(limits=Limits(max_length=5))
+    with pytest.raises(CalcLimitError):
+        session.evaluate("1 + 2 + 3")
+    assert session.evaluate("1 + 2 + 3", limits=Limits()) == "6"
+    assert session.get_history()[0]["expression"] == "1 + 2 + 3"
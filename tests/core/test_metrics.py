@@ -0,0 +1,75 @@
+import threading
+
+import pytest
+
+from calc.core import metrics
+from calc.core.errors import CalcError
+from calc.core.expression import clear_cache
+from calc.core.metrics import Counter, Histogram
+from calc.core.session import CalculatorSession
+
+
+@pytest.fixture
+def enabled_metrics():
+    clear_cache()
+    metrics.registry.clear()
+    metrics.enable()
+    yield metrics
+    metrics.disable()
+    metrics.registry.clear()
+
+
+def test_histogram_render():
+    histogram = Histogram("latency", "Latency", ("stage",), buckets=(0.1, 1.0))
+    histogram.observe(0.05, "a")
+    histogram.observe(0.1, "a")
+    histogram.observe(3, "a")
+    lines = histogram.render()
+    assert 'latency_bucket{stage="a",le="0.1"} 2' in lines
+    assert 'latency_bucket{stage="a",le="1.0"} 2' in lines
+    assert 'latency_bucket{stage="a",le="+Inf"} 3' in lines
+    assert 'latency_count{stage="a"} 3' in lines
+    assert "# TYPE latency histogram" in lines
+
+
+def test_counter_render_escapes_labels():
+    counter = Counter("hits", "Hits", ("path",))
+    counter.inc('a"b')
+    counter.inc('a"b', amount=2)
+    assert 'hits{path="a\\"b"} 3' in counter.render()
+
+
+def test_counter_is_thread_safe():
+    counter = Counter("n", "N")
+
+    def worker():
+        for _ in range(1000):
+            counter.inc()
+
+    threads = [threading.Thread(target=worker) for _ in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert counter.values[()] == 4000
+
+
+def test_disabled_metrics_record_nothing():
+    metrics.registry.clear()
+    CalculatorSession().evaluate("1 + 2")
+    assert metrics.stage_seconds.series == {}
+
+
+def test_pipeline_stages_are_timed(enabled_metrics):
+    session = CalculatorSession()
+    session.evaluate("1 + 2")
+    stages = {labels[0] for labels in metrics.stage_seconds.series}
+    assert stages == {"tokenize", "postfix", "evaluate", "format"}
+
+
+def test_errors_counted_by_code(enabled_metrics):
+    session = CalculatorSession()
+    for expr in ["1 / 0", "2 / 0", "(1"]:
+        with pytest.raises(CalcError):
+            session.evaluate(expr)
+    assert metrics.errors_total.values == {("MATH_ERROR",): 2, ("SYNTAX_ERROR",): 1}
@@ -0,0 +1,163 @@
+from decimal import Decimal
+from fractions import Fraction
+import pytest
+
+from calc.core.backends import get_backend
+from calc.core.compiler import compile_expr
+from calc.core.errors import CalcMathError, CalcNameError, CalcSyntaxError
+from calc.core.expression import eval_expr, tokenize
+from calc.core.incremental import IncrementalEvaluator
+from calc.core.operators import (
+    FUNCTIONS, OPERATORS, rebuild, register_function, register_operator,
+)
+from calc.core.validation import validate_expr
+
+
+@pytest.fixture
+def registry():
+    # registrations are global, put the built-in table back afterwards
+    operators = dict(OPERATORS)
+    functions = dict(FUNCTIONS)
+    yield
+    OPERATORS.clear()
+    OPERATORS.update(operators)
+    FUNCTIONS.clear()
+    FUNCTIONS.update(functions)
+    rebuild()
+
+
+def test_power_precedence_and_associativity():
+    assert eval_expr("2 ^ 3 ^ 2") == Decimal("512")
+    assert eval_expr("-2 ^ 2") == Decimal("-4")
+    assert eval_expr("2 ^ -1") == Decimal("0.5")
+    assert eval_expr("2 * 3 ^ 2") == Decimal("18")
+    assert eval_expr("(-8) ^ 2") == Decimal("64")
+
+
+def test_modulo_and_floor_division_round_down():
+    assert eval_expr("7 % 3") == Decimal("1")
+    assert eval_expr("-7 % 3") == Decimal("2")
+    assert eval_expr("7 % -3") == Decimal("-2")
+    assert eval_expr("7.5 % 2") == Decimal("1.5")
+    assert eval_expr("7 // 2") == Decimal("3")
+    assert eval_expr("-7 // 2") == Decimal("-4")
+    assert eval_expr("1 + 7 // 2 * 2") == Decimal("7")
+    assert [(t.kind, t.value) for t in tokenize("7//2")] == [
+        ("NUMBER", Decimal("7")), ("OP", "//"), ("NUMBER", Decimal("2"))
+    ]
+
+
+def test_functions():
+    assert eval_expr("sqrt(16)") == Decimal("4")
+    assert eval_expr("abs(-2.5)") == Decimal("2.5")
+    assert eval_expr("min(3, x, 2)", {"x": 1}) == Decimal("1")
+    assert eval_expr("max(3)") == Decimal("3")
+    assert eval_expr("max(1, -(2 - 5), sqrt(4)) * 2") == Decimal("6")
+    assert eval_expr("-sqrt(4) ^ 2") == Decimal("-4")
+
+
+@pytest.mark.parametrize("expr, error", [
+    ("1 % 0", "Division by zero"),
+    ("1 // 0", "Division by zero"),
+    ("0 ^ -1", "Division by zero"),
+    ("(-8) ^ 0.5", "Power is undefined"),
+    ("sqrt(-1)", "Square root of a negative number"),
+])
+def test_math_errors(expr, error):
+    with pytest.raises(CalcMathError, match=error):
+        eval_expr(expr)
+
+
+@pytest.mark.parametrize("evaluate", [
+    eval_expr,
+    lambda expr: eval_expr(expr, backend=get_backend("decimal", 50)),
+    lambda expr: compile_expr(expr)(),
+    lambda expr: compile_expr(expr, optimize=True)(),
+    lambda expr: IncrementalEvaluator().evaluate(expr),
+])
+def test_overflow_is_a_math_error(evaluate):
+    # only ^ checks for it, plain * leaves it to the decimal context
+    with pytest.raises(CalcMathError, match="Result is too large"):
+        evaluate("10 ^ 999999 * 10")
+
+
+@pytest.mark.parametrize("expr, error", [
+    ("sqrt()", "takes 1 argument"),
+    ("sqrt(1, 2)", "takes 1 argument"),
+    ("min()", "takes at least 1 argument"),
+    ("sqrt 4", "must be followed by '\\('"),
+    ("2 + abs", "must be followed by '\\('"),
+    ("1, 2", "Unexpected ','"),
+    ("(1, 2)", "Unexpected ','"),
+    ("2 min(1,)", "Missing operand before '\\)'"),
+    ("2 min(, 1)", "Missing operand before ','"),
+    ("2 max(1 +)", "Missing operand before '\\)'"),
+    ("2 (1 -)", "Missing operand before '\\)'"),
+])
+def test_syntax_errors(expr, error):
+    with pytest.raises(CalcSyntaxError, match=error):
+        eval_expr(expr)
+
+
+@pytest.mark.parametrize("name", ["float", "decimal", "fraction"])
+def test_empty_argument_is_not_taken_from_outside_the_call(name):
+    with pytest.raises(CalcSyntaxError, match="Missing operand"):
+        eval_expr("2 min(1,)", backend=get_backend(name))
+
+
+def test_function_names_are_reserved():
+    with pytest.raises(CalcSyntaxError):
+        eval_expr("sqrt + 1", {"sqrt": 2})
+    with pytest.raises(CalcNameError):
+        eval_expr("sqrt2 + 1")
+
+
+@pytest.mark.parametrize("name", ["float", "decimal", "fraction"])
+def test_backends(name):
+    backend = get_backend(name)
+    assert eval_expr("2 ^ 3 ^ 2 - -7 % 3 + 9 // 2", backend=backend) == 514
+    assert eval_expr("max(abs(-3), sqrt(4))", backend=backend) == 3
+    with pytest.raises(CalcMathError, match="Division by zero"):
+        eval_expr("1 % (2 - 2)", backend=backend)
+
+
+def test_fraction_backend_powers_and_roots():
+    backend = get_backend("fraction")
+    assert eval_expr("(2 / 3) ^ -2", backend=backend) == Fraction(9, 4)
+    assert eval_expr("sqrt(9 / 4)", backend=backend) == Fraction(3, 2)
+    assert eval_expr("7 // (1 / 2)", backend=backend) == Fraction(14)
+    assert round(eval_expr("sqrt(2)", backend=backend), 6) == Fraction("1.414214")
+
+
+def test_decimal_backend_precision_applies_to_functions():
+    assert eval_expr("sqrt(2)", backend=get_backend("decimal", 5)) == Decimal("1.4142")
+    assert eval_expr("2 ^ 0.5", backend=get_backend("decimal", 5)) == Decimal("1.4142")
+
+
+def test_register_operator_and_function(registry):
+    register_operator("<<", 2, 2, lambda a, b: a * 2 ** b)
+    register_function("hypot", lambda a, b: (a * a + b * b).sqrt(), 2, 2)
+
+    assert eval_expr("1 + 3 << 2") == Decimal("13")
+    assert eval_expr("hypot(3, 4) << 1") == Decimal("10")
+    assert compile_expr("hypot(x, 4)")(x=3) == Decimal("5")
+    assert IncrementalEvaluator().evaluate("hypot(6, 8) << 1") == Decimal("20")
+    assert validate_expr("hypot(3)")[0]["message"] == (
+        "Function 'hypot' takes 2 argument(s), got 1"
+    )
+
+
+def test_register_clears_program_cache(registry):
+    assert eval_expr("2 + 3 * 4") == Decimal("14")
+    # the cached program still has the old precedence
+    register_operator("+", 2, 3, OPERATORS["+"].apply)
+    assert eval_expr("2 + 3 * 4") == Decimal("20")
+
+
+def test_register_rejects_bad_entries(registry):
+    with pytest.raises(ValueError):
+        register_operator("x", 2, 1, max)
+    with pytest.raises(ValueError):
+        register_operator("@", 3, 1, max)
+    with pytest.raises(ValueError):
+        register_function("2x", abs)
@@ -0,0 +1,108 @@
+from decimal import Decimal
+import pytest
+
+from calc.core.compiler import compile_expr, compile_postfix
+from calc.core.errors import CalcMathError, CalcSyntaxError
+from calc.core.expression import eval_expr, eval_postfix, parse_expr
+from calc.core.optimizer import optimize, optimize_expr
+
+
+def kinds(program):
+    return [t.kind for t in program]
+
+
+def test_constant_folding():
+    program, stats = optimize_expr("2 * 3 + 4")
+    assert kinds(program) == ["NUMBER"]
+    assert program[0].value == Decimal("10")
+    assert stats.folded == 2
+
+
+def test_partial_folding_with_variables():
+    program, stats = optimize_expr("x * (2 + 3)")
+    assert stats.folded == 1
+    assert eval_postfix(program, {"x": 4}) == Decimal("20")
+
+
+def test_division_by_zero_is_not_folded():
+    program, stats = optimize_expr("1 / 0")
+    assert stats.folded == 0
+    with pytest.raises(CalcMathError):
+        eval_postfix(program)
+
+
+def test_functions_and_powers_are_folded():
+    expr = "x * max(2 ^ 3, 7 % 4) + sqrt(x) + sqrt(x)"
+    program, stats = optimize_expr(expr)
+    assert stats.folded == 3
+    assert stats.shared == 1
+    assert eval_postfix(program, {"x": 4}) == eval_expr(expr, {"x": 4})
+    # like division by zero, errors are left for run time
+    program, _ = optimize_expr("sqrt(-1)")
+    assert kinds(program) == ["NUMBER", "CALL"]
+    with pytest.raises(CalcMathError):
+        eval_postfix(program)
+
+
+def test_double_negation_removed():
+    program, stats = optimize_expr("--x")
+    assert kinds(program) == ["NAME"]
+    assert stats.negations_removed == 1
+    program, _ = optimize_expr("---x")
+    assert [t.value for t in program] == ["x", "NEGATIVE"]
+
+
+def test_variable_named_like_the_negation_operator():
+    program, stats = optimize_expr("-NEGATIVE")
+    assert [(t.kind, t.value) for t in program] == [("NAME", "NEGATIVE"), ("OP", "NEGATIVE")]
+    assert stats.negations_removed == 0
+    assert eval_postfix(program, {"NEGATIVE": 2}) == Decimal("-2")
+
+
+def test_common_subexpression_shared():
+    expr = "(a*b+c) / (a*b+c - 1)"
+    program, stats = optimize_expr(expr)
+    assert stats.shared == 1
+    assert stats.reused == 1
+    assert kinds(program).count("STORE") == 1
+    variables = {"a": 2, "b": 3, "c": 1}
+    expected = eval_expr(expr, variables)
+    assert eval_postfix(program, variables) == expected
+    assert compile_postfix(program)(**variables) == expected
+
+
+def test_nested_shared_subexpressions():
+    expr = "(x*x) * (x*x) + (x*x) * (x*x)"
+    program, stats = optimize_expr(expr)
+    # x*x and (x*x)*(x*x) are each computed once
+    assert stats.shared == 2
+    assert kinds(program).count("OP") == 3
+    assert eval_postfix(program, {"x": 3}) == Decimal("162")
+
+
+def test_optimized_results_match():
+    for expr in ["2 + 3 * 4", "-(3 + 2)", "10 + -5", "(((1 + 2) * 3) / 9)",
+                 "x - -x", "(x + 1) * (x + 1) - (x + 1)"]:
+        program, _ = optimize_expr(expr)
+        assert eval_postfix(program, {"x": 7}) == eval_expr(expr, {"x": 7})
+
+
+def test_long_chain_does_not_recurse():
+    expr = " + ".join(["x"] * 5000)
+    program, _ = optimize_expr(expr)
+    assert eval_postfix(program, {"x": 1}) == Decimal("5000")
+
+
+def test_compile_expr_optimize_flag():
+    assert compile_expr("(y*2) * (y*2)", optimize=True)(y=3) == Decimal("36")
+
+
+def test_optimize_keeps_syntax_errors():
+    with pytest.raises(CalcSyntaxError):
+        optimize(parse_expr("2 + + 3"))
+
+
+def test_stats_as_dict():
+    _, stats = optimize_expr("1 + 1")
+    assert stats.as_dict()["tokens_before"] == 3
+    assert stats.as_dict()["tokens_after"] == 1
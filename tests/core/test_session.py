@@ -1,5 +1,8 @@
+import threading
 from decimal import Decimal
+import pytest
 
+from calc.core.errors import CalcError
 from calc.core.session import CalculatorSession
 
 
@@ -61,3 +64,31 @@ def test_session_reset():
     session.reset()
     history = session.get_history()
     assert len(history) == 0
+
+
+def test_session_version():
+    session = CalculatorSession()
+    session.evaluate("1 + 1")
+    # failed evaluations change nothing
+    with pytest.raises(CalcError):
+        session.evaluate("1 +")
+    assert session.version == 1
+    session.clear_history()
+    session.reset()
+    assert session.version == 3
+
+
+def test_session_wait_for_version():
+    session = CalculatorSession()
+    assert session.wait_for_version(0, timeout=0.05) == 0
+    timer = threading.Timer(0.1, session.evaluate, ["2 * 3"])
+    timer.start()
+    assert session.wait_for_version(0, timeout=5) == 1
+    timer.join()
+
+    woken = []
+    session.watch_version(1, lambda: woken.append(session.version))
+    session.watch_version(0, lambda: woken.append("now"))
+    assert woken == ["now"]
+    session.evaluate("1")
+    assert woken == ["now", 2]
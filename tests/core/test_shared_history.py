@@ -0,0 +1,187 @@
+import multiprocessing
+import os
+import signal
+import threading
+import pytest
+
+from calc.core.session import CalculatorSession
+from calc.core.shared_history import SharedHistory, SharedHistoryRing
+
+
+@pytest.fixture
+def ring():
+    ring = SharedHistoryRing(capacity=8, max_expression=16, max_result=8)
+    yield ring
+    ring.close()
+    ring.unlink()
+
+
+def entry(expr, result="1", timestamp=0.0):
+    return {"expression": expr, "result": result, "timestamp": timestamp}
+
+
+def test_recent_is_per_client(ring):
+    ring.append("a", entry("1 + 1"))
+    ring.append("b", entry("2 + 2"))
+    ring.append("a", entry("3 + 3"))
+    assert [e["expression"] for e in ring.recent("a", 10)] == ["1 + 1", "3 + 3"]
+    assert [e["expression"] for e in ring.recent("b", 10)] == ["2 + 2"]
+    assert [e["expression"] for e in ring.recent("a", 1)] == ["3 + 3"]
+    assert ring.count("a") == 2
+
+
+def test_oldest_entries_are_overwritten(ring):
+    for i in range(12):
+        ring.append("a", entry(f"{i}"))
+    assert [e["expression"] for e in ring.recent("a", 100)] == [str(i) for i in range(4, 12)]
+    assert ring.count("a") == 8
+
+
+def test_page(ring):
+    for i in range(5):
+        ring.append("a", entry(f"{i}", timestamp=float(i)))
+        if i % 2:
+            ring.append("b", entry("x"))
+    entries, cursor = ring.page("a", limit=2)
+    assert [e["expression"] for e in entries] == ["0", "1"]
+    entries, cursor = ring.page("a", cursor=cursor, limit=2)
+    assert [e["expression"] for e in entries] == ["2", "3"]
+    entries, cursor = ring.page("a", cursor=cursor, limit=2)
+    assert [e["expression"] for e in entries] == ["4"]
+    assert cursor is None
+    entries, _ = ring.page("a", since=1.0, until=3.0)
+    assert [e["expression"] for e in entries] == ["1", "2"]
+
+
+def test_search(ring):
+    ring.append("a", entry("1 + 2"))
+    ring.append("b", entry("1 + 2"))
+    ring.append("a", entry("21 * 3"))
+    assert [e["expression"] for e in ring.search("a", "1+")] == ["1 + 2"]
+    assert [e["expression"] for e in ring.search("a", "2", prefix=True)] == ["21 * 3"]
+    assert len(ring.search("a", "", limit=1)) == 1
+
+
+def test_clear_only_affects_one_client(ring):
+    ring.append("a", entry("1"))
+    ring.append("b", entry("2"))
+    ring.clear("a")
+    assert ring.recent("a", 10) == []
+    assert len(ring.recent("b", 10)) == 1
+
+
+def test_clients_sharing_buckets(ring):
+    # 8 buckets for 10 clients, so some chains hold several clients
+    model = []
+    for i in range(30):
+        client = f"c{i % 10}"
+        ring.append(client, entry(f"{i}"))
+        model.append((client, f"{i}"))
+        if i == 20:
+            ring.clear("c3")
+            model = [m for m in model if m[0] != "c3"]
+    model = [m for m in model if int(m[1]) >= 30 - 8]
+    for n in range(10):
+        client = f"c{n}"
+        expected = [expr for owner, expr in model if owner == client]
+        assert [e["expression"] for e in ring.recent(client, 100)] == expected
+        assert [e["expression"] for e in ring.page(client)[0]] == expected
+        assert ring.count(client) == len(expected)
+
+
+def test_reads_only_visit_the_clients_chain():
+    ring = SharedHistoryRing(capacity=1000)
+    try:
+        for i in range(999):
+            ring.append(f"c{i % 100}", entry(f"{i}"))
+        ring.append("a", entry("1"))
+        visited = []
+        read = ring.read
+        ring.read = lambda *args: visited.append(args[0]) or read(*args)
+        assert len(ring.recent("a", 10)) == 1
+        assert len(visited) < 20
+    finally:
+        ring.close()
+        ring.unlink()
+
+
+def test_long_text_is_truncated(ring):
+    ring.append("a", entry("1 + 2 + 3 + 4 + 5 + 6", "123456789"))
+    stored = ring.recent("a", 1)[0]
+    assert stored["expression"] == "1 + 2 + 3 + 4..."
+    assert stored["result"] == "12345..."
+    ring.append("a", entry("é" * 20))
+    assert ring.recent("a", 1)[0]["expression"] == "é" * 6 + "..."
+
+
+def test_session_backend(ring):
+    session = CalculatorSession(history=SharedHistory(ring, "a"))
+    session.evaluate("2 * 21")
+    assert session.get_history()[0]["result"] == "42"
+    assert len(session.history) == 1
+    session.clear_history()
+    assert session.get_history() == []
+
+
+def test_version_is_shared_between_sessions(ring):
+    # two workers' sessions for one client
+    first = CalculatorSession(history=SharedHistory(ring, "a"))
+    second = CalculatorSession(history=SharedHistory(ring, "a"))
+    version = first.current_version()
+    woken = []
+    waiter = threading.Thread(target=lambda: woken.append(first.wait_for_version(version, 5)))
+    waiter.start()
+    second.evaluate("1 + 1")
+    waiter.join()
+    assert woken == [version + 1]
+    assert first.current_version() == second.current_version() == version + 1
+    second.clear_history()
+    assert first.current_version() == version + 2
+    assert first.wait_for_version(version + 2, timeout=0.05) == version + 2
+
+
+def append_from_child(ring, n):
+    for i in range(n):
+        ring.append("shared", entry(f"{i}"))
+
+
+@pytest.mark.skipif("fork" not in multiprocessing.get_all_start_methods(), reason="needs fork")
+def test_visible_across_processes():
+    ring = SharedHistoryRing(capacity=100)
+    try:
+        context = multiprocessing.get_context("fork")
+        children = [context.Process(target=append_from_child, args=(ring, 10)) for _ in range(3)]
+        for child in children:
+            child.start()
+        for child in children:
+            child.join()
+        entries = ring.recent("shared", 100)
+        assert len(entries) == 30
+        assert [e["id"] for e in entries] == list(range(1, 31))
+    finally:
+        ring.close()
+        ring.unlink()
+
+
+def hold_lock(lock, held):
+    with lock:
+        held.set()
+        signal.pause()
+
+
+@pytest.mark.skipif("fork" not in multiprocessing.get_all_start_methods(), reason="needs fork")
+def test_lock_is_released_when_its_holder_is_killed():
+    ring = SharedHistoryRing(capacity=10)
+    try:
+        context = multiprocessing.get_context("fork")
+        held = context.Event()
+        child = context.Process(target=hold_lock, args=(ring.lock, held))
+        child.start()
+        assert held.wait(10)
+        os.kill(child.pid, signal.SIGKILL)
+        child.join()
+        ring.append("shared", entry("1"))
+        assert [e["expression"] for e in ring.recent("shared", 10)] == ["1"]
+    finally:
+        ring.close()
+        ring.unlink()
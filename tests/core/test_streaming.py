@@ -0,0 +1,113 @@
+import io
+import random
+import tracemalloc
+from decimal import Decimal
+import pytest
+
+from calc.core.backends import get_backend
+from calc.core.errors import CalcMathError, CalcSyntaxError
+from calc.core.expression import eval_expr
+from calc.core.streaming import eval_stream, iter_tokens
+
+
+def random_expression(rng, depth=0):
+    if depth > 4 or rng.random() < 0.3:
+        return rng.choice(["7", "12.5", ".25", "x", "300"])
+    left = random_expression(rng, depth + 1)
+    right = random_expression(rng, depth + 1)
+    expr = f"{left} {rng.choice('+-*')} {right}"
+    if rng.random() < 0.3:
+        expr = "-" + expr
+    return f"({expr})" if rng.random() < 0.5 else expr
+
+
+@pytest.mark.parametrize("chunk_size", [1, 2, 5, 64])
+def test_matches_eval_expr(chunk_size):
+    rng = random.Random(19)
+    for _ in range(200):
+        expr = random_expression(rng)
+        expected = eval_expr(expr, {"x": 3})
+        assert eval_stream(expr, {"x": 3}, chunk_size=chunk_size) == expected
+        assert eval_stream(io.StringIO(expr), {"x": 3}, chunk_size=chunk_size) == expected
+
+
+def test_binary_source():
+    # the chunk size splits the two byte "é"
+    source = io.BytesIO("2 * é + 123.5".encode("utf-8"))
+    assert eval_stream(source, {"é": 4}, chunk_size=4) == Decimal("131.5")
+    with pytest.raises(CalcSyntaxError):
+        eval_stream(io.BytesIO(b"1 + \xff"))
+
+
+def test_backend():
+    assert eval_stream("1 / 3 * 3", backend=get_backend("fraction"), chunk_size=3) == 1
+
+
+def test_token_positions():
+    tokens = list(iter_tokens("12 + (345 * y)", chunk_size=3))
+    assert [t.pos for t in tokens] == [0, 3, 5, 6, 10, 12, 13]
+
+
+def test_long_literal_spanning_chunks():
+    # the held back tail is scanned once per chunk, not once per character
+    literal = "7" * 200000
+    expr = f"x + {literal}.5 * 2 + {literal}"
+    assert eval_stream(expr, {"x": 1}, chunk_size=1000) == eval_expr(expr, {"x": 1})
+    tokens = list(iter_tokens("1 + " + literal, chunk_size=997))
+    assert [t.pos for t in tokens] == [0, 2, 4]
+
+
+def test_operators_and_functions_split_across_chunks():
+    expr = "7//2 + max(1, 2^3) % 5 - sqrt(16)"
+    for chunk_size in (1, 2, 3):
+        assert eval_stream(expr, chunk_size=chunk_size) == eval_expr(expr)
+
+
+@pytest.mark.parametrize("expr, error", [
+    ("   ", CalcSyntaxError),
+    ("1 + (2", CalcSyntaxError),
+    ("1.2.3 + 1", CalcSyntaxError),
+    ("1 $ 2", CalcSyntaxError),
+    ("1 / (2 - 2)", CalcMathError),
+])
+def test_errors(expr, error):
+    with pytest.raises(error):
+        eval_stream(expr, chunk_size=2)
+
+
+class GeneratedSum(io.RawIOBase):
+    # "1 + 2 + 3 + ..." produced on the fly, never held in memory
+    def __init__(self, terms):
+        self.lines = (f"{i} + " if i < terms else f"{i}" for i in range(1, terms + 1))
+        self.pending = b""
+
+    def readable(self):
+        return True
+
+    def read(self, size=-1):
+        while len(self.pending) < size:
+            line = next(self.lines, None)
+            if line is None:
+                break
+            self.pending += line.encode()
+        data, self.pending = self.pending[:size], self.pending[size:]
+        return data
+
+
+def peak_memory(terms):
+    tracemalloc.start()
+    try:
+        result = eval_stream(GeneratedSum(terms), chunk_size=1024)
+        return result, tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def test_memory_does_not_grow_with_input():
+    result, small = peak_memory(4000)
+    assert result == 4000 * 4001 // 2
+    # about 200 KB of input, eight times as much
+    result, large = peak_memory(32000)
+    assert result == 32000 * 32001 // 2
+    assert large < small * 1.25
+    assert large < 100_000
@@ -0,0 +1,72 @@
+import pytest
+
+from calc.core.errors import CalcSyntaxError
+from calc.core.expression import cache_info, clear_cache, eval_expr
+from calc.core.limits import Limits
+from calc.core.validation import validate_expr
+
+
+def spans(expr):
+    return [(p["message"], p["start"], p["end"]) for p in validate_expr(expr)]
+
+
+@pytest.mark.parametrize("expr", ["2 + 3 * 4", "-(-2)", "x * (y - 1)", " 1.5 / 3 "])
+def test_valid_expressions(expr):
+    assert validate_expr(expr) == []
+
+
+def test_reports_every_problem():
+    assert spans("1..2 + $ + (3") == [
+        ("Invalid number near: 1..", 0, 4),
+        ("Unexpected character: '$'", 7, 8),
+        ("Mismatched parentheses", 11, 12),
+    ]
+    assert spans("* 2 3 +") == [
+        ("Operator '*' missing operand(s)", 0, 1),
+        ("Missing operator", 4, 5),
+        ("Expression ends without an operand", 7, 7),
+    ]
+    assert spans("(1 + ()) )") == [
+        ("Missing operand before ')'", 6, 7),
+        ("Mismatched parentheses", 9, 10),
+    ]
+    problems = validate_expr("  ")
+    assert problems == [
+        {"code": "SYNTAX_ERROR", "message": "Empty expression", "start": 0, "end": 2}
+    ]
+
+
+@pytest.mark.parametrize("expr", ["(1 + 2", "1 + 2)", "2 $ 3", "sqrt(1, 2)", "min(1,)"])
+def test_messages_match_evaluation(expr):
+    with pytest.raises(CalcSyntaxError) as error:
+        eval_expr(expr)
+    assert validate_expr(expr)[0]["message"] == error.value.message
+
+
+def test_function_problems():
+    assert validate_expr("max(1, sqrt(4)) ^ 2 % 3") == []
+    assert spans("sqrt(1, 2) + min() + abs 4") == [
+        ("Function 'sqrt' takes 1 argument(s), got 2", 0, 10),
+        ("Function 'min' takes at least 1 argument(s), got 0", 13, 18),
+        ("Function 'abs' must be followed by '('", 21, 24),
+        ("Missing operator", 25, 26),
+    ]
+    assert spans("max(1,, 2), 3") == [
+        ("Missing operand before ','", 6, 7),
+        ("Unexpected ','", 10, 11),
+    ]
+
+
+def test_limits():
+    problems = validate_expr("(((1)))", Limits(max_depth=2))
+    assert [(p["code"], p["start"], p["end"]) for p in problems] == [("LIMIT_EXCEEDED", 0, 7)]
+
+
+def test_valid_program_is_cached():
+    clear_cache()
+    assert validate_expr("2 *  (3 + 4)") == []
+    validate_expr("2 * (3 + 4)")
+    assert cache_info()["misses"] == 0
+    hits = cache_info()["hits"]
+    assert eval_expr("2 * (3 + 4)") == 14
+    assert cache_info()["hits"] == hits + 1
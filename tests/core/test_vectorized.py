@@ -0,0 +1,60 @@
+from decimal import Decimal
+import pytest
+
+np = pytest.importorskip("numpy")
+
+from calc.core.errors import CalcNameError
+from calc.core.vectorized import eval_vectorized
+
+
+def test_float_columns():
+    result = eval_vectorized("a * 2 + b", a=[1, 2, 3], b=np.array([0.5, 0.5, 0.5]))
+    assert result.values.dtype == np.float64
+    assert result.values.tolist() == [2.5, 4.5, 6.5]
+    assert not result.errors.any()
+
+
+def test_unary_minus_and_parentheses():
+    result = eval_vectorized("-(x - 1) * y", x=[1, 2, 3], y=[2, 2, 2])
+    assert result.values.tolist() == [0, -2, -4]
+
+
+def test_division_by_zero_is_masked():
+    result = eval_vectorized("1 / (x - 2)", x=[1, 2, 4])
+    assert result.errors.tolist() == [False, True, False]
+    assert result.values[0] == -1
+    assert np.isnan(result.values[1])
+    assert result.values[2] == 0.5
+
+
+def test_exact_uses_decimal():
+    result = eval_vectorized("x + 0.2", exact=True, x=[0.1, 1])
+    assert result.values.dtype == object
+    assert result.values.tolist() == [Decimal("0.3"), Decimal("1.2")]
+
+
+def test_exact_division_by_zero_is_masked():
+    result = eval_vectorized("x / y", exact=True, x=[1, 1], y=[0, 4])
+    assert result.errors.tolist() == [True, False]
+    assert result.values[1] == Decimal("0.25")
+    assert result.values[0].is_nan()
+
+
+def test_operators_and_functions_without_numpy_equivalent():
+    result = eval_vectorized("x % 3 + max(x, 2) - 2 ^ 2", x=[-1, 4])
+    assert result.values.tolist() == [0, 1]
+    result = eval_vectorized("sqrt(x) + 1 // y", exact=True, x=[-1, 9], y=[1, 0])
+    assert result.errors.tolist() == [True, True]
+    result = eval_vectorized("sqrt(x)", exact=True, x=[-1, 9])
+    assert result.errors.tolist() == [True, False]
+    assert result.values[1] == Decimal("3")
+
+
+def test_constant_expression_broadcasts():
+    result = eval_vectorized("2 * 3 + x - x", x=np.zeros(4))
+    assert result.values.tolist() == [6, 6, 6, 6]
+
+
+def test_unknown_variable():
+    with pytest.raises(CalcNameError):
+        eval_vectorized("x + z", x=[1])
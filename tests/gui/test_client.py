@@ -0,0 +1,131 @@
+import socket
+import threading
+import time
+import pytest
+
+from werkzeug.serving import make_server
+
+from calc.api.main import create_app
+from calc.gui.client import ApiWorker
+from calc.gui.main import KeepAliveRequestHandler
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_server(port, app=None):
+    server = make_server(
+        "127.0.0.1", port, app or create_app(), threaded=True,
+        request_handler=KeepAliveRequestHandler,
+    )
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+@pytest.fixture
+def server_port():
+    port = free_port()
+    server = start_server(port)
+    yield port
+    server.shutdown()
+
+
+def make_worker(port, **kwargs):
+    kwargs.setdefault("base_delay", 0.01)
+    worker = ApiWorker(f"http://127.0.0.1:{port}", **kwargs)
+    worker.start()
+    return worker
+
+
+def drain_until(worker, done, timeout=5):
+    # stands in for the Tk after() loop
+    deadline = time.monotonic() + timeout
+    while not done() and time.monotonic() < deadline:
+        worker.drain()
+        time.sleep(0.005)
+    assert done()
+
+
+def test_evaluate_and_history(server_port):
+    worker = make_worker(server_port)
+    results = []
+    worker.submit("POST", "/evaluate", {"expression": "2 + 3"}, on_success=results.append)
+    worker.submit("GET", "/history", on_success=results.append)
+    drain_until(worker, lambda: len(results) == 2)
+    assert results[0]["result"] == "5"
+    assert results[1]["history"][0]["expression"] == "2 + 3"
+    worker.stop()
+
+
+def test_error_response_is_delivered_as_data(server_port):
+    worker = make_worker(server_port)
+    results = []
+    worker.submit("POST", "/evaluate", {"expression": "1 / 0"}, on_success=results.append)
+    drain_until(worker, lambda: results)
+    assert results[0]["status"] == "error"
+    worker.stop()
+
+
+def test_superseded_jobs_are_dropped(server_port):
+    worker = make_worker(server_port)
+    results = []
+    for expr in ("1 + 1", "2 + 2", "3 + 3"):
+        worker.submit("POST", "/evaluate", {"expression": expr},
+                      on_success=results.append, key="evaluate")
+    done = []
+    worker.submit("GET", "/health", on_success=done.append)
+    drain_until(worker, lambda: done)
+    assert [r["result"] for r in results] == ["6"]
+    worker.stop()
+
+
+def test_cancel_discards_result(server_port):
+    worker = make_worker(server_port)
+    results = []
+    worker.submit("POST", "/evaluate", {"expression": "1 + 1"},
+                  on_success=results.append, key="evaluate")
+    worker.cancel("evaluate")
+    done = []
+    worker.submit("GET", "/health", on_success=done.append)
+    drain_until(worker, lambda: done)
+    assert results == []
+    worker.stop()
+
+
+def test_waits_for_server_to_become_ready():
+    port = free_port()
+    worker = make_worker(port, ready_timeout=5)
+    results = []
+    worker.submit("POST", "/evaluate", {"expression": "2 * 4"}, on_success=results.append)
+    time.sleep(0.1)
+    assert not worker.ready.is_set()
+    server = start_server(port)
+    try:
+        drain_until(worker, lambda: results)
+        assert worker.ready.is_set()
+        assert results[0]["result"] == "8"
+    finally:
+        worker.stop()
+        server.shutdown()
+
+
+def test_gives_up_after_retries():
+    port = free_port()
+    worker = make_worker(port, ready_timeout=0.05, retries=2, max_delay=0.02)
+    errors = []
+    worker.submit("GET", "/history", on_error=errors.append)
+    drain_until(worker, lambda: errors)
+    assert not worker.ready.is_set()
+    worker.stop()
+
+
+def test_drain_never_blocks():
+    port = free_port()
+    worker = make_worker(port, ready_timeout=5)
+    start = time.perf_counter()
+    assert worker.drain() == 0
+    assert time.perf_counter() - start < 0.05
+    worker.stop()